@@ -0,0 +1,91 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+"""Per-user vs batch last-seen filtering.
+
+Filters N participants with a realistic status mix (mostly offline with a
+was_online time, some online / recently / last week / last month, a few with
+no status) through user_filters.passes_last_seen one by one and through
+user_filters.last_seen_matches in chunks of PARSE_STREAM_BATCH_SIZE, and checks
+that both select the same ids.
+
+    python benchmarks/bench_last_seen.py [N ...]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import entity_cache  # noqa: E402
+import defunc  # noqa: E402
+import user_filters  # noqa: E402
+from telethon.tl.types import (  # noqa: E402
+    UserStatusOnline, UserStatusOffline, UserStatusRecently, UserStatusLastWeek, UserStatusLastMonth,
+)
+
+LAST_SEEN_DAYS = 3
+
+
+def _participants(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    users = []
+    for i in range(n):
+        roll = rng.random()
+        if roll < 0.70:
+            status = UserStatusOffline(was_online=now - timedelta(seconds=rng.randrange(30 * 86400)))
+        elif roll < 0.75:
+            status = UserStatusOnline(expires=now + timedelta(minutes=5))
+        elif roll < 0.85:
+            status = UserStatusRecently()
+        elif roll < 0.92:
+            status = UserStatusLastWeek()
+        elif roll < 0.98:
+            status = UserStatusLastMonth()
+        else:
+            status = None
+        users.append(SimpleNamespace(id=i + 1, username=f'user{i}', status=status))
+    return users
+
+
+def run(n: int) -> tuple[float, float, int]:
+    users = _participants(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        entity_cache._default_cache = entity_cache.EntityCache(os.path.join(tmp, 'entities.db'))
+        started = time.perf_counter()
+        per_user = {u.id for u in users if user_filters.passes_last_seen(u, LAST_SEEN_DAYS, True)}
+        per_user_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batch: set[int] = set()
+        for start in range(0, n, defunc.STREAM_BATCH_SIZE):
+            batch |= user_filters.last_seen_matches(users[start:start + defunc.STREAM_BATCH_SIZE],
+                                                   LAST_SEEN_DAYS, True)
+        batch_time = time.perf_counter() - started
+        entity_cache._default_cache.close()
+        entity_cache._default_cache = None
+    if per_user != batch:
+        raise SystemExit(f"mismatch at N={n}: {len(per_user ^ batch)} ids differ")
+    return per_user_time, batch_time, len(batch)
+
+
+def main(argv: list[str]) -> None:
+    sizes = [int(a) for a in argv] or [200_000]
+    print(f"{'N':>9} {'matched':>9} {'per-user s':>11} {'us/user':>8} {'batch s':>9} {'us/user':>8} {'speedup':>8}")
+    for n in sizes:
+        per_user_time, batch_time, matched = run(n)
+        print(f"{n:>9} {matched:>9} {per_user_time:>11.3f} {per_user_time / n * 1e6:>8.2f} "
+              f"{batch_time:>9.3f} {batch_time / n * 1e6:>8.2f} {per_user_time / batch_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,101 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+"""Scaling benchmark for defunc.parsing() deduplication.
+
+Runs parsing() against a group of N participants with 10*N users already in
+usernames.txt / userids.txt, and compares it with the previous list-scan
+implementation at sizes where that one still finishes. Per-user time of the
+store-backed path should stay flat as N grows (linear total time).
+
+    python benchmarks/bench_parsing.py [N ...]
+"""
+
+import os
+import sys
+import time
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_store  # noqa: E402
+import defunc  # noqa: E402
+
+
+class _Client:
+    def __init__(self, participants):
+        self._participants = participants
+
+    async def get_participants(self, entity, filter=None):
+        return self._participants
+
+
+def _legacy_parsing(participants, id: bool, name: bool) -> None:
+    """The pre-store implementation: membership tests against readlines() lists."""
+    if name:
+        with open('usernames.txt', 'r+') as f:
+            usernames = f.readlines()
+            for user in participants:
+                if user.username and ('Bot' not in user.username) and ('bot' not in user.username):
+                    if ('@' + user.username + '\n') not in usernames:
+                        f.write('@' + user.username + '\n')
+    if id:
+        with open('userids.txt', 'r+') as f:
+            userids = f.readlines()
+            for user in participants:
+                if (str(user.id) + '\n') not in userids:
+                    f.write(str(user.id) + '\n')
+
+
+def _participants(n: int, offset: int):
+    # Half of the group is already known, half is new
+    return [SimpleNamespace(id=offset + i, username=f'user{offset + i}' if i % 4 else None)
+            for i in range(n)]
+
+
+def _prepare(existing: int) -> None:
+    with open('userids.txt', 'w') as f:
+        f.writelines(f'{i}\n' for i in range(existing))
+    with open('usernames.txt', 'w') as f:
+        f.writelines(f'@user{i}\n' for i in range(existing) if i % 4)
+
+
+def run(n: int, legacy: bool) -> tuple[float, float | None]:
+    existing = 10 * n
+    participants = _participants(n, existing - n // 2)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        _prepare(existing)
+        user_store._default_store = user_store.UserStore(os.path.join(tmp, 'users.db'))
+        started = time.perf_counter()
+        defunc.parsing(_Client(participants), None, True, True)
+        store_time = time.perf_counter() - started
+        user_store._default_store.close()
+        user_store._default_store = None
+
+        legacy_time = None
+        if legacy:
+            _prepare(existing)
+            started = time.perf_counter()
+            _legacy_parsing(participants, True, True)
+            legacy_time = time.perf_counter() - started
+        os.chdir('/')
+    return store_time, legacy_time
+
+
+def main(argv: list[str]) -> None:
+    sizes = [int(a) for a in argv] or [1_000, 5_000, 20_000, 50_000, 100_000]
+    print(f"{'N':>9} {'existing':>10} {'store s':>9} {'us/user':>8} {'legacy s':>9} {'us/user':>8}")
+    for n in sizes:
+        store_time, legacy_time = run(n, legacy=n <= 5_000)
+        legacy_cols = (f"{legacy_time:>9.3f} {legacy_time / n * 1e6:>8.1f}" if legacy_time is not None
+                       else f"{'-':>9} {'-':>8}")
+        print(f"{n:>9} {10 * n:>10} {store_time:>9.3f} {store_time / n * 1e6:>8.1f} {legacy_cols}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,77 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+"""Run the parse paths over a recorded RPC fixture.
+
+Record on a live account by setting RPC_RECORD_PATH for a bot or main.py run
+(pooled clients then append every dialogs / participants / history / GetUsers
+answer to that file). Remove <session>.catalog.json first so the full dialog
+list is recorded rather than a "not modified" answer. Then replay it offline,
+with the recorded network time (--speed 1), faster (--speed 10) or none
+(--speed 0, parse-path CPU only):
+
+    RPC_RECORD_PATH=groups.rpc.gz python bot.py
+    python benchmarks/bench_replay.py groups.rpc.gz --session my.session --speed 0 \\
+        [--active] [--filters "noadmins seen:7"] [--group CHANNEL_ID]
+
+Each run starts from an empty store and caches in a temporary directory.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import session_pool  # noqa: E402
+from rpc_fixtures import Fixture, ReplayClient  # noqa: E402
+
+
+def main(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(description='Run the parse paths over a recorded RPC fixture.')
+    parser.add_argument('fixture')
+    parser.add_argument('--session', default='replay.session', help='session the fixture was recorded with')
+    parser.add_argument('--speed', type=float, default=1.0, help='delay scale: 1 = recorded timing, 0 = none')
+    parser.add_argument('--active', action='store_true', help='parse message senders instead of members')
+    parser.add_argument('--filters', default='', help='filter spec, as in /parse_sessions')
+    parser.add_argument('--group', type=int, default=None, help='only this channel id')
+    parser.add_argument('--limit', type=int, default=None, help='message limit for --active')
+    args = parser.parse_args(argv)
+
+    fixture = Fixture(os.path.abspath(args.fixture))
+    print('fixture:', fixture.summary())
+    session_pool.TelegramClient = lambda name, *a, **kw: ReplayClient(fixture, name, args.speed)
+    os.chdir(tempfile.mkdtemp(prefix='replay-'))
+    open('usernames.txt', 'w').close()
+    open('userids.txt', 'w').close()
+
+    import defunc
+    from user_filters import FilterSpec
+    spec = FilterSpec.parse(args.filters)
+    tracemalloc.start()
+    started = time.perf_counter()
+    if args.active:
+        result = defunc.parse_session_group_active_filtered(args.session, 0, '', None, True, True,
+                                                            message_limit=args.limit, group_id=args.group,
+                                                            resume=False, filters=spec)
+        handled = result.get('messages_scanned', 0)
+    else:
+        result = defunc.parse_session_group_filtered(args.session, 0, '', None, True, True, group_id=args.group,
+                                                     stream=True, resume=False, filters=spec)
+        handled = result.get('participants_total', 0)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('result:', result)
+    print(f"wall {elapsed:.2f} s, peak traced {peak / 2**20:.1f} MB, "
+          f"{handled / elapsed if elapsed else 0:.0f} {'messages' if args.active else 'users'}/s")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,110 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+"""Offline throughput benchmarks of the parse paths.
+
+Every scenario runs against benchmarks/fake_client.py (one synthetic
+megagroup of N members and N messages of history) in its own subprocess and
+temporary directory, so stores and caches start empty and peak memory is
+the scenario's own:
+
+    parsing   defunc.parsing(): full member list, no filters (main.py path)
+    filtered  parse_session_group_filtered(stream=True) with noadmins seen:7 nobots
+    members   the same filters without streaming (whole member list at once)
+    active    parse_session_group_active_filtered() over N messages, same filters
+    writer    defunc._write_users() of N (id, username) pairs into an empty store
+
+The writer scenario stands in for the old _append_unique, which the user
+store replaced. Columns: wall time, peak RSS of the process and the part of
+it above the fixture (the interpreter with everything imported), and
+users/s: members (or messages, for active) handled per second.
+
+    python benchmarks/bench_suite.py [N ...] [--only scenario,...]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+SCENARIOS = ('parsing', 'filtered', 'members', 'active', 'writer')
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+FILTERS = 'noadmins seen:7 nobots'
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _child(scenario: str, n: int) -> dict:
+    os.chdir(tempfile.mkdtemp(prefix='bench-'))
+    open('usernames.txt', 'w').close()
+    open('userids.txt', 'w').close()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import fake_client
+    import defunc
+    from user_filters import FilterSpec
+
+    world = fake_client.SyntheticWorld(groups=1, members=n, messages=n)
+    fake_client.install(world)
+    spec = FilterSpec.parse(FILTERS)
+    pairs = [(fake_client.FIRST_USER_ID + i, f'user{i}' if i % 3 else None) for i in range(n)] \
+        if scenario == 'writer' else None
+    baseline = _rss_mb()
+
+    started = time.perf_counter()
+    if scenario == 'parsing':
+        client = fake_client.FakeClient(world)
+        result = defunc.parsing(client, world.channel(0), True, True)
+    elif scenario in ('filtered', 'members'):
+        result = defunc.parse_session_group_filtered('bench.session', 1, 'hash', 0, True, True,
+                                                     stream=scenario == 'filtered', resume=False, filters=spec)
+    elif scenario == 'active':
+        result = defunc.parse_session_group_active_filtered('bench.session', 1, 'hash', 0, True, True,
+                                                            message_limit=None, resume=False, filters=spec)
+    else:
+        written_ids, written_names = defunc._write_users(pairs, world.channel(0), True, True)
+        result = {'written_userids': written_ids, 'written_usernames': written_names}
+    elapsed = time.perf_counter() - started
+    return {'seconds': elapsed, 'peak_mb': _rss_mb(), 'baseline_mb': baseline,
+            'matched': result.get('matched', result.get('written_userids', 0))}
+
+
+def run(scenario: str, n: int) -> dict:
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', scenario, str(n)],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f'{scenario} N={n} failed:\n{proc.stderr}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv: list[str]) -> None:
+    if argv[:1] == ['--child']:
+        print(json.dumps(_child(argv[1], int(argv[2]))))
+        return
+    parser = argparse.ArgumentParser(description='Offline throughput benchmarks of the parse paths.')
+    parser.add_argument('sizes', nargs='*', type=int, metavar='N',
+                        help=f"members / messages per run (default: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument('--only', type=lambda value: tuple(value.split(',')), default=SCENARIOS,
+                        help=f"comma-separated scenarios out of {','.join(SCENARIOS)}")
+    args = parser.parse_args(argv)
+    scenarios = args.only
+    sizes = args.sizes or list(DEFAULT_SIZES)
+    print(f"{'scenario':<9} {'N':>9} {'wall s':>9} {'peak MB':>9} {'+MB':>8} {'users/s':>10} {'matched':>9}")
+    for scenario in scenarios:
+        for n in sizes:
+            r = run(scenario, n)
+            print(f"{scenario:<9} {n:>9} {r['seconds']:>9.2f} {r['peak_mb']:>9.1f} "
+                  f"{r['peak_mb'] - r['baseline_mb']:>8.1f} {n / r['seconds']:>10.0f} {r['matched']:>9}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
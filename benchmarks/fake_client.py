@@ -0,0 +1,196 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+"""Local stand-in for TelegramClient, backed by synthetic megagroups.
+
+Answers the requests the parse paths make (dialogs, participant pages, admin
+lists, history, users.GetUsers) from generated data, so they can be run and
+timed without an account. Users and messages are generated from their index
+on demand: a paged parse only ever holds the page it is on, while calls that
+return whole lists (get_participants) build them, as Telethon would.
+
+    world = SyntheticWorld(groups=1, members=100_000, messages=100_000)
+    install(world)   # session_pool now hands out FakeClient instances
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import session_pool  # noqa: E402
+from telethon.tl.functions.channels import GetParticipantsRequest  # noqa: E402
+from telethon.tl.functions.messages import GetDialogsRequest  # noqa: E402
+from telethon.tl.functions.users import GetUsersRequest  # noqa: E402
+from telethon.tl.types import (  # noqa: E402
+    Channel, ChannelParticipant, ChatPhotoEmpty, InputPeerChannel, Message, PeerChannel, PeerUser, User,
+    UserStatusOnline, UserStatusOffline, UserStatusRecently, UserStatusLastWeek, UserStatusLastMonth,
+)
+from telethon.tl.types.channels import ChannelParticipants  # noqa: E402
+from telethon.tl.types.messages import Dialogs  # noqa: E402
+
+FIRST_CHANNEL_ID = 1_000_000
+FIRST_USER_ID = 10_000_000
+HISTORY_PAGE_SIZE = 100
+
+
+class SyntheticWorld:
+    """``groups`` megagroups of ``members`` users each, with ``messages`` messages of history.
+
+    Status mix per user (by index): 55% offline up to 60 days ago, 5% online,
+    15% recently, 10% last week, 10% last month, 5% hidden. A third of the
+    users have no username, 2% are bots, 1% deleted, 5% premium; the first
+    ``admins`` members of each group are its admins. One message in ten comes
+    without its sender attached and has to be resolved through GetUsers.
+    """
+
+    def __init__(self, groups: int = 1, members: int = 1000, messages: int = 1000, admins: int = 10):
+        self.groups = groups
+        self.members = members
+        self.messages = messages
+        self.admins = min(admins, members)
+        self.now = datetime.now(timezone.utc)
+
+    def channel(self, g: int) -> Channel:
+        channel_id = FIRST_CHANNEL_ID + g
+        return Channel(id=channel_id, title=f'group {g}', photo=ChatPhotoEmpty(), date=self.now,
+                       megagroup=True, access_hash=channel_id * 7, username=f'group{g}')
+
+    def group_of(self, channel_id: int) -> int:
+        return channel_id - FIRST_CHANNEL_ID
+
+    def user_id(self, g: int, i: int) -> int:
+        # Consecutive groups share half their members, as real groups of one niche do
+        return FIRST_USER_ID + g * (self.members // 2) + i
+
+    def user(self, user_id: int) -> User:
+        i = user_id - FIRST_USER_ID
+        roll = i * 7919 % 100
+        if roll < 55:
+            status = UserStatusOffline(was_online=self.now - timedelta(seconds=i * 104729 % (60 * 86400)))
+        elif roll < 60:
+            status = UserStatusOnline(expires=self.now + timedelta(minutes=5))
+        elif roll < 75:
+            status = UserStatusRecently()
+        elif roll < 85:
+            status = UserStatusLastWeek()
+        elif roll < 95:
+            status = UserStatusLastMonth()
+        else:
+            status = None
+        bot = i % 50 == 7
+        return User(id=user_id, access_hash=user_id * 31, username=f'user{i}' if i % 3 else None,
+                    status=status, bot=bot, bot_info_version=1 if bot else None, deleted=i % 100 == 13,
+                    premium=i % 20 == 3)
+
+    def members_page(self, g: int, offset: int, limit: int) -> list[User]:
+        return [self.user(self.user_id(g, i)) for i in range(offset, min(self.members, offset + limit))]
+
+    def admin_ids(self, g: int) -> list[int]:
+        return [self.user_id(g, i) for i in range(self.admins)]
+
+    def message(self, g: int, msg_id: int):
+        """Message ``msg_id`` (1 = oldest) of group ``g``; senders spread over the members."""
+        sender_id = self.user_id(g, msg_id * 2654435761 % self.members)
+        message = Message(id=msg_id, peer_id=PeerChannel(FIRST_CHANNEL_ID + g), date=self.now, message='',
+                          from_id=PeerUser(sender_id))
+        # Telethon attaches senders from the users bundled with the history page
+        message._sender = self.user(sender_id) if msg_id % 10 else None
+        return message
+
+
+class _History:
+    """iter_messages stand-in. Like Telethon's RequestIter, a retried __anext__ returns the same message."""
+
+    def __init__(self, world: SyntheticWorld, g: int, limit: int | None, min_id: int, offset_id: int):
+        self.world = world
+        self.g = g
+        self.next_id = min(world.messages, offset_id - 1) if offset_id else world.messages
+        self.min_id = min_id
+        self.left = limit
+        self.served = 0
+        # Swapped for every HISTORY_PAGE_SIZE messages, as by Telethon's RequestIter
+        self.buffer = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.next_id <= self.min_id or self.next_id < 1 or self.left == 0:
+            raise StopAsyncIteration
+        if self.served % HISTORY_PAGE_SIZE == 0:
+            self.buffer = []
+        message = self.world.message(self.g, self.next_id)
+        self.next_id -= 1
+        self.served += 1
+        if self.left is not None:
+            self.left -= 1
+        return message
+
+
+class FakeClient:
+    """The TelegramClient surface defunc uses, answered from a SyntheticWorld."""
+
+    def __init__(self, world: SyntheticWorld, session_name: str = 'bench.session'):
+        self.world = world
+        self.session = SimpleNamespace(filename=session_name)
+        self.requests: dict[str, int] = {}
+        self._connected = False
+
+    def _count(self, name: str) -> None:
+        self.requests[name] = self.requests.get(name, 0) + 1
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def start(self):
+        self._connected = True
+        return self
+
+    async def connect(self):
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    async def get_input_entity(self, target):
+        channel_id = getattr(target, 'channel_id', None) or target.id
+        return InputPeerChannel(channel_id=channel_id, access_hash=channel_id * 7)
+
+    async def __call__(self, request):
+        self._count(type(request).__name__)
+        if isinstance(request, GetDialogsRequest):
+            return Dialogs(dialogs=[], messages=[], chats=[self.world.channel(g) for g in range(self.world.groups)],
+                           users=[])
+        if isinstance(request, GetParticipantsRequest):
+            g = self.world.group_of(request.channel.channel_id)
+            users = self.world.members_page(g, request.offset, request.limit)
+            return ChannelParticipants(count=self.world.members,
+                                       participants=[ChannelParticipant(user_id=u.id, date=self.world.now)
+                                                     for u in users],
+                                       chats=[], users=users)
+        if isinstance(request, GetUsersRequest):
+            return [self.world.user(getattr(u, 'user_id', None)) for u in request.id]
+        raise NotImplementedError(type(request).__name__)
+
+    async def get_participants(self, target, filter=None, **kwargs):
+        self._count('get_participants')
+        g = self.world.group_of(getattr(target, 'channel_id', None) or target.id)
+        if filter is not None:
+            return [self.world.user(uid) for uid in self.world.admin_ids(g)]
+        return self.world.members_page(g, 0, self.world.members)
+
+    def iter_messages(self, target, limit=None, min_id=0, offset_id=0, **kwargs):
+        self._count('iter_messages')
+        g = self.world.group_of(getattr(target, 'channel_id', None) or target.id)
+        return _History(self.world, g, limit, min_id, offset_id)
+
+
+def install(world: SyntheticWorld) -> None:
+    """Make the session pool open FakeClients over ``world`` instead of TelegramClients."""
+    session_pool.TelegramClient = lambda name, *args, **kwargs: FakeClient(world, name)
@@ -6,21 +6,31 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import os
 import sys
+import time
+import asyncio
+from collections import deque
 from telethon import TelegramClient
 from telethon import events, Button
-from telethon.errors.rpcerrorlist import SessionPasswordNeededError, PhoneCodeInvalidError, PhoneCodeExpiredError
+from telethon.errors.rpcerrorlist import SessionPasswordNeededError, PhoneCodeInvalidError, PhoneCodeExpiredError, FloodWaitError
 from defunc import (
 	getoptions,
 	list_sessions,
-	list_groups_for_session,
-	parse_session_group,
-	parse_session_group_filtered,
-	parse_session_group_active,
-	parse_session_group_active_filtered,
-	invite_from_usernames,
-	invite_from_usernames_with_summary,
+	list_groups_for_session_async,
+	parse_session_group_async,
+	parse_session_group_filtered_async,
+	parse_session_group_active_async,
+	parse_session_group_active_filtered_async,
+	parse_all_sessions_async,
+	invite_from_usernames_async,
+	invite_from_usernames_with_summary_async,
 	toggle_option,
+	clear_collected_users,
 )
+from session_pool import get_pool
+from request_scheduler import get_scheduler
+from user_filters import FilterSpec, FILTER_ORDER, FILTER_LABELS
+from parse_stats import STAGE_LABELS
+from metrics import REGISTRY, metrics_address, serve_metrics, timed_handler
 from dotenv import load_dotenv
 
 # Load environment variables from .env if present
@@ -47,6 +57,246 @@ def is_allowed_user(sender_id: int) -> bool:
 	return sender_id == owner_id
 
 
+try:
+	PROGRESS_EDIT_INTERVAL = max(1.0, float(os.getenv('BOT_PROGRESS_INTERVAL', '3')))
+except ValueError:
+	PROGRESS_EDIT_INTERVAL = 3.0
+
+
+class BotJob:
+	"""A parse started from the bot, running as a background task."""
+
+	def __init__(self, job_id: int, title: str):
+		self.id = job_id
+		self.title = title
+		self.progress = {'processed': 0, 'total': 0}
+		self.state = 'running'
+		self.started = time.monotonic()
+		self.finished: float | None = None
+		self.result = None
+		self.error: BaseException | None = None
+		self.task: asyncio.Task | None = None
+
+	def elapsed(self) -> float:
+		return (self.finished or time.monotonic()) - self.started
+
+	def status_line(self) -> str:
+		return (f"#{self.id} [{JOB_STATES.get(self.state, self.state)}] {self.title} — "
+				f"{int(self.elapsed())} с, {self.progress.get('processed', 0)}/{self.progress.get('total', 0)}")
+
+
+JOB_STATES = {'running': 'выполняется', 'done': 'готово', 'failed': 'ошибка', 'cancelled': 'отменено'}
+
+
+class JobManager:
+	"""Background parse jobs of the bot, addressed by a numeric id.
+
+	Handlers return as soon as a job is started, so the bot keeps answering
+	while parses run. Cancelling a job cancels its task: the parse stops at its
+	next await and leaves ``async with get_pool().client(...)``, which releases
+	the client lease (and keeps the parse job checkpoint for a later resume).
+	"""
+
+	def __init__(self, keep_finished: int = 20):
+		self.keep_finished = keep_finished
+		self._jobs: dict[int, BotJob] = {}
+		self._next_id = 1
+
+	def start(self, title: str, run, on_finish=None) -> BotJob:
+		"""Run ``run(progress)`` in the background; ``on_finish(job)`` is awaited once it ends."""
+		job = BotJob(self._next_id, title)
+		self._next_id += 1
+		self._jobs[job.id] = job
+
+		async def runner():
+			try:
+				job.result = await run(job.progress)
+				job.state = 'done'
+			except asyncio.CancelledError:
+				job.state = 'cancelled'
+			except Exception as exc:
+				job.state = 'failed'
+				job.error = exc
+			finally:
+				job.finished = time.monotonic()
+				self._prune()
+			if on_finish is not None:
+				try:
+					await on_finish(job)
+				except Exception:
+					pass
+
+		job.task = asyncio.get_running_loop().create_task(runner())
+		return job
+
+	def get(self, job_id: int) -> BotJob | None:
+		return self._jobs.get(job_id)
+
+	def list(self) -> list[BotJob]:
+		return list(self._jobs.values())
+
+	def cancel(self, job_id: int) -> bool:
+		job = self._jobs.get(job_id)
+		if job is None or job.state != 'running' or job.task is None:
+			return False
+		job.task.cancel()
+		return True
+
+	def cancel_all(self) -> None:
+		for job in self._jobs.values():
+			if job.state == 'running' and job.task is not None:
+				job.task.cancel()
+
+	def _prune(self) -> None:
+		finished = [j for j in self._jobs.values() if j.state != 'running']
+		for job in finished[:max(0, len(finished) - self.keep_finished)]:
+			del self._jobs[job.id]
+
+
+def register_runtime_metrics(jobs: JobManager) -> None:
+	"""Scrape-time metrics of the bot's jobs, the request schedulers and the client pool."""
+	def per_session(key: str):
+		return lambda: {(os.path.basename(name),): s[key] for name, s in get_scheduler().stats().items()}
+
+	REGISTRY.callback('bot_jobs', 'Parse jobs of the bot by state', 'gauge', ('state',),
+		lambda: {(state,): sum(1 for j in jobs.list() if j.state == state) for state in JOB_STATES})
+	REGISTRY.callback('telegram_requests_total', 'Parse-path requests sent, per session', 'counter', ('session',),
+		per_session('requests'))
+	REGISTRY.callback('telegram_flood_waits_total', 'FloodWait errors received, per session', 'counter', ('session',),
+		per_session('flood_waits'))
+	REGISTRY.callback('telegram_flood_wait_seconds_total', 'Seconds slept out for FloodWait, per session', 'counter',
+		('session',), per_session('waited_seconds'))
+	REGISTRY.callback('session_pool_clients', 'Pooled userbot clients: connected and leased', 'gauge', ('state',),
+		lambda: {(state,): get_pool().stats()[state] for state in ('connected', 'leased')})
+
+
+def format_duration(seconds: float) -> str:
+	seconds = int(seconds)
+	if seconds >= 3600:
+		return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+	return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class ProgressReporter:
+	"""Live status of a running job, written into its status message.
+
+	The job's ``progress`` dict is sampled every ``interval`` seconds and the
+	message is edited only when the text changed, so a job never causes more
+	than one edit per interval however often the parse updates its counters.
+	``processed`` may drop back to 0 when a parse moves to the next group; the
+	rate counts only forward steps, over the last ``window`` samples.
+	"""
+
+	def __init__(self, job: BotJob, edit, buttons=None, interval: float = PROGRESS_EDIT_INTERVAL, window: int = 10):
+		self.job = job
+		self.edit = edit
+		self.buttons = buttons
+		self.interval = interval
+		self._samples = deque([(job.started, 0)], maxlen=window)
+		self._last_processed = 0
+		self._counted = 0
+		self._last_text: str | None = None
+
+	def sample(self) -> float:
+		"""Record the current counters; return items per second over the window."""
+		processed = self.job.progress.get('processed', 0)
+		step = processed - self._last_processed
+		self._counted += step if step >= 0 else processed
+		self._last_processed = processed
+		now = time.monotonic()
+		self._samples.append((now, self._counted))
+		first_time, first_count = self._samples[0]
+		return (self._counted - first_count) / (now - first_time) if now > first_time else 0.0
+
+	def render(self, rate: float) -> str:
+		processed = self.job.progress.get('processed', 0)
+		total = self.job.progress.get('total', 0)
+		lines = [f'Задача #{self.job.id}: {self.job.title}']
+		if total:
+			lines.append(f'Обработано: {processed}/{total} ({min(100, processed * 100 // total)}%)')
+		else:
+			lines.append(f'Обработано: {processed}')
+		lines.append(f'Скорость: {rate:.1f}/с')
+		if total and rate > 0 and processed < total:
+			lines.append(f'Осталось: ~{format_duration((total - processed) / rate)}')
+		lines.append(f'Прошло: {format_duration(self.job.elapsed())}')
+		return '\n'.join(lines)
+
+	async def run(self) -> None:
+		while self.job.state == 'running':
+			await asyncio.sleep(self.interval)
+			if self.job.state != 'running':
+				break
+			text = self.render(self.sample())
+			if text == self._last_text:
+				continue
+			try:
+				await self.edit(text, buttons=self.buttons)
+				self._last_text = text
+			except FloodWaitError as exc:
+				# The bot account itself is rate limited: skip updates until it may edit again
+				await asyncio.sleep(exc.seconds)
+			except Exception:
+				pass
+
+
+def format_parse_summary(res: dict, active: bool) -> str:
+	if active:
+		head = (
+			f"Групп: {res['groups_processed']}\n"
+			f"Сообщений просмотрено: {res['messages_scanned']}\n"
+			f"Уникальных отправителей: {res['unique_senders']}\n"
+		)
+	else:
+		head = (
+			f"Групп: {res['groups_processed']}\n"
+			f"Участников всего: {res['participants_total']}\n"
+		)
+	return head + (
+		f"Подходят фильтрам: {res['matched']}\n"
+		f"user-id записано: {res['written_userids']}\n"
+		f"username записано: {res['written_usernames']}\n"
+		+ format_excluded(res) +
+		f"Ошибок: {res['errors']}\n"
+		f"Ожидание FloodWait: {res.get('flood_wait_seconds', 0)} с\n"
+		+ format_memory(res)
+	)
+
+
+def format_excluded(res: dict) -> str:
+	# One line per filter that rejected anyone, in evaluation order
+	return ''.join(f"Исключено ({FILTER_LABELS[name]}): {res[f'excluded_{name}']}\n"
+				   for name in FILTER_ORDER if res.get(f'excluded_{name}'))
+
+
+def format_memory(res: dict) -> str:
+	# Only present when the parse ran with MEMORY_PROFILE on
+	memory = res.get('memory')
+	if not memory:
+		return ''
+	return (
+		f"Память: пик RSS {memory['peak_rss_mb']} МБ (процесс {memory['process_peak_rss_mb']} МБ), "
+		f"Python {memory['traced_peak_mb']} МБ\n"
+		+ ''.join(f"  {site['site']} — {site['size_kb']} КБ, {site['count']} объектов\n" for site in memory['top_sites'])
+	)
+
+
+def format_stages(stages: dict) -> str:
+	return ''.join(
+		f"{STAGE_LABELS.get(name, name)}: {s['seconds']:.2f} с, RPC {s['rpcs']}, "
+		f"FloodWait {s['flood_wait_seconds']} с, записано {s['bytes_written'] / 1024:.1f} КБ\n"
+		for name, s in stages.items())
+
+
+def format_runtime_stats() -> str:
+	pool = get_pool().stats()
+	lines = [f"Клиенты: подключено {pool['connected']}, занято {pool['leased']} из {pool['max_clients']}\n"]
+	for name, s in get_scheduler().stats().items():
+		lines.append(f"{os.path.basename(name)}: запросов {s['requests']}, FloodWait {s['flood_waits']} "
+					 f"({s['waited_seconds']} с, осталось {s['wait_left']} с)\n")
+	return ''.join(lines)
+
+
 HELP_TEXT = (
 	"Команды:\n"
 	"/start - помощь\n"
@@ -55,6 +305,11 @@ HELP_TEXT = (
 	"/groups <s_idx> - группы аккаунта\n"
 	"/parse <s_idx> <g_idx|all> - парсить группу или все\n"
 	"/parse_active <s_idx> <g_idx|all> [limit] - парсить по отправителям сообщений\n"
+	"/parse_sessions [active] [limit] [фильтры] - парсить группы всех аккаунтов параллельно "
+	"(фильтры: noadmins seen:N norecent nobots username nodeleted premium nopremium)\n"
+	"/jobs - фоновые задачи парсинга\n"
+	"/cancel <id> - отменить задачу\n"
+	"/stats [id] - замеры по этапам последнего парсинга (или задачи id)\n"
 	"/invite <s_idx> <channel> [limit] - инвайт из usernames.txt\n"
 	"/toggle_id - вкл/выкл парсинг user-id\n"
 	"/toggle_name - вкл/выкл парсинг user-name\n"
@@ -78,14 +333,49 @@ def main():
 	client = TelegramClient('bot_session', api_id, api_hash)
 	# Ensure the async start coroutine is executed before registering handlers
 	client.loop.run_until_complete(client.start(bot_token=bot_token))
+	# Disconnect pooled userbot clients that sit idle past SESSION_POOL_IDLE_SECONDS
+	client.loop.create_task(get_pool().reap_forever())
 
 	# Simple in-memory state for asking text input and filters
 	user_states: dict[int, dict] = {}
+	jobs = JobManager()
+
+	address = metrics_address()
+	if address is not None:
+		register_runtime_metrics(jobs)
+		client.loop.run_until_complete(serve_metrics(*address))
+		print(f"[bot] Метрики: http://{address[0]}:{address[1]}/metrics")
+
+	def on(builder, command: str):
+		# client.on that also times the handler as bot_handler_seconds{command}
+		def register(handler):
+			client.add_event_handler(timed_handler(command, handler), builder)
+			return handler
+		return register
 
 	# ===== UI helpers =====
 	def cb(*parts: object) -> bytes:
 		return ('|'.join(str(p) for p in parts)).encode()
 
+	def filter_buttons(s_idx: int, active: bool) -> list:
+		buttons = [
+			[Button.inline('Все', cb('F_ALL'))],
+			[Button.inline('Без админов', cb('F_NOADM'))],
+			[Button.inline('Онлайн <= 7 дней', cb('F_7'))],
+			[Button.inline('Онлайн <= 14 дней', cb('F_14'))],
+			[Button.inline('Онлайн <= 30 дней', cb('F_30'))],
+			[Button.inline('Учитывать «Недавно» (вкл/выкл)', cb('F_REC'))],
+			[Button.inline('Без ботов (вкл/выкл)', cb('F_BOTS'))],
+			[Button.inline('Только с username (вкл/выкл)', cb('F_UNAME'))],
+			[Button.inline('Без удалённых (вкл/выкл)', cb('F_DEL'))],
+			[Button.inline('Premium: все / только / без', cb('F_PREM'))],
+		]
+		if active:
+			buttons.append([Button.inline('Полный пересмотр истории (вкл/выкл)', cb('F_FULL'))])
+		buttons.append([Button.inline('Старт', cb('F_GO'))])
+		buttons.append([Button.inline('Назад', cb('SESS_SEL', s_idx))])
+		return buttons
+
 	async def show_main(event):
 		buttons = [
 			[Button.inline('Сессии', cb('SESS'))],
@@ -131,13 +421,14 @@ def main():
 		]
 		await event.edit(f'Сессия: {name}', buttons=buttons)
 
-	async def show_groups(event, s_idx: int, page: int = 0):
+	async def show_groups(event, s_idx: int, page: int = 0, refresh: bool = False):
 		sessions = list_sessions()
 		if s_idx < 0 or s_idx >= len(sessions):
 			await event.edit('Неверный индекс сессии', buttons=[[Button.inline('Назад', cb('SESS'))]])
 			return
 		try:
-			all_groups = list_groups_for_session(sessions[s_idx], api_id, api_hash)
+			# Served from the catalog cache; only the first page (or «Обновить») hits Telegram
+			all_groups = await list_groups_for_session_async(sessions[s_idx], api_id, api_hash, refresh=refresh)
 		except Exception as exc:
 			await event.edit(f'Ошибка получения групп: {exc}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
 			return
@@ -145,13 +436,14 @@ def main():
 		start = page * per_page
 		chunk = all_groups[start:start + per_page]
 		rows = []
-		for idx, title, username in chunk:
+		# Buttons carry the channel id, so a parse targets the group directly from the peer catalog
+		for idx, title, username, channel_id in chunk:
 			label = f'[{idx}] {title}' if username == '-' else f'[{idx}] {title} @{username}'
 			rows.append([
-				Button.inline(label, cb('PARSE_ONE', s_idx, idx)),
-				Button.inline('Фильтр', cb('PARSE_ONE_FILTERS', s_idx, idx)),
-				Button.inline('Активные', cb('PARSE_ACTIVE_ONE', s_idx, idx)),
-				Button.inline('Активные (фильтр)', cb('PARSE_ACTIVE_ONE_FILTERS', s_idx, idx)),
+				Button.inline(label, cb('PARSE_ONE', s_idx, channel_id)),
+				Button.inline('Фильтр', cb('PARSE_ONE_FILTERS', s_idx, channel_id)),
+				Button.inline('Активные', cb('PARSE_ACTIVE_ONE', s_idx, channel_id)),
+				Button.inline('Активные (фильтр)', cb('PARSE_ACTIVE_ONE_FILTERS', s_idx, channel_id)),
 			])
 		nav = []
 		if start > 0:
@@ -160,16 +452,59 @@ def main():
 			nav.append(Button.inline('➡️', cb('GRP', s_idx, page + 1)))
 		if nav:
 			rows.append(nav)
+		rows.append([Button.inline('🔄 Обновить', cb('GRP_REFRESH', s_idx, page))])
 		rows.append([Button.inline('Назад', cb('SESS_SEL', s_idx))])
 		await event.edit('Группы:', buttons=rows)
 
-	@client.on(events.NewMessage(pattern=r'^/start$'))
+	async def launch(edit, title: str, run, render, back: list | None = None) -> BotJob:
+		# ``edit`` updates the status message; it shows a cancel button until the job ends
+		started = asyncio.Event()
+		reporter_task: asyncio.Task | None = None
+
+		async def on_finish(job: BotJob):
+			await started.wait()
+			if reporter_task is not None:
+				# Stop live updates first so none lands after the final text
+				reporter_task.cancel()
+				await asyncio.gather(reporter_task, return_exceptions=True)
+			if job.state == 'done':
+				text = render(job.result)
+			elif job.state == 'cancelled':
+				text = f'Задача #{job.id} отменена'
+			elif isinstance(job.error, FloodWaitError):
+				text = f'FloodWait {job.error.seconds} с. Прогресс сохранён — повторный запуск продолжит с места остановки.'
+			else:
+				text = f'Ошибка: {job.error}'
+			await edit(text, buttons=back)
+
+		job = jobs.start(title, run, on_finish)
+		buttons = [[Button.inline('Отмена', cb('JOB_CANCEL', job.id))], *(back or [])]
+		try:
+			await edit(f'Задача #{job.id}: {title}\nЗапущена...', buttons=buttons)
+			if job.state == 'running':
+				reporter_task = asyncio.get_running_loop().create_task(ProgressReporter(job, edit, buttons).run())
+		finally:
+			started.set()
+		return job
+
+	async def group_id_for_index(session_file: str, g_idx: int) -> int | None:
+		# Indexes shown by /groups refer to the cached catalog, not a fresh dialog fetch
+		try:
+			groups = await list_groups_for_session_async(session_file, api_id, api_hash)
+		except Exception:
+			return None
+		for idx, _title, _username, channel_id in groups:
+			if idx == g_idx:
+				return channel_id
+		return None
+
+	@on(events.NewMessage(pattern=r'^/start$'), 'start')
 	async def start_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
 		await show_main(event)
 
-	@client.on(events.CallbackQuery)
+	@on(events.CallbackQuery, 'callback')
 	async def callbacks(event):
 		if not is_allowed_user(event.sender_id):
 			await event.answer('Недоступно', alert=True)
@@ -210,166 +545,127 @@ def main():
 		elif key == 'GRP':
 			s_idx = int(parts[1]); page = int(parts[2])
 			await show_groups(event, s_idx, page)
+		elif key == 'GRP_REFRESH':
+			s_idx = int(parts[1]); page = int(parts[2])
+			await show_groups(event, s_idx, page, refresh=True)
 		elif key == 'PARSE_ONE':
-			s_idx = int(parts[1]); g_idx = int(parts[2])
+			s_idx = int(parts[1]); group_id = int(parts[2])
 			options = getoptions()
 			parse_user_id = options[2] == 'True\n'
 			parse_user_name = options[3] == 'True\n'
-			try:
-				res = parse_session_group(list_sessions()[s_idx], api_id, api_hash, g_idx, parse_user_id, parse_user_name)
-			except Exception as exc:
-				await event.answer('Ошибка'); await event.edit(f'Ошибка: {exc}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]]); return
-			await event.edit(f'Готово: {res}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
+			session_file = list_sessions()[s_idx]
+			await launch(event.edit, f'парсинг {session_file}, группа {group_id}',
+				lambda progress: parse_session_group_async(session_file, api_id, api_hash, None, parse_user_id, parse_user_name, group_id=group_id, progress=progress),
+				lambda res: f'Готово: {res}', [[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
 		elif key == 'PARSE_ONE_FILTERS':
-			s_idx = int(parts[1]); g_idx = int(parts[2])
-			user_states[event.sender_id] = {'action': 'parse_filters', 's_idx': s_idx, 'g_idx': g_idx, 'active': False}
-			await event.edit('Фильтры: выберите вариант', buttons=[
-				[Button.inline('Все', cb('F_ALL'))],
-				[Button.inline('Без админов', cb('F_NOADM'))],
-				[Button.inline('Онлайн <= 7 дней', cb('F_7'))],
-				[Button.inline('Онлайн <= 14 дней', cb('F_14'))],
-				[Button.inline('Онлайн <= 30 дней', cb('F_30'))],
-				[Button.inline('Учитывать «Недавно» (вкл/выкл)', cb('F_REC'))],
-				[Button.inline('Старт', cb('F_GO'))],
-				[Button.inline('Назад', cb('SESS_SEL', s_idx))],
-			])
+			s_idx = int(parts[1]); group_id = int(parts[2])
+			user_states[event.sender_id] = {'action': 'parse_filters', 's_idx': s_idx, 'group_id': group_id, 'active': False, 'filters': FilterSpec().as_dict()}
+			await event.edit('Фильтры: выберите вариант', buttons=filter_buttons(s_idx, False))
 		elif key == 'PARSE_ALL':
 			s_idx = int(parts[1])
 			options = getoptions()
 			parse_user_id = options[2] == 'True\n'
 			parse_user_name = options[3] == 'True\n'
-			try:
-				res = parse_session_group(list_sessions()[s_idx], api_id, api_hash, None, parse_user_id, parse_user_name)
-			except Exception as exc:
-				await event.edit(f'Ошибка: {exc}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]]); return
-			await event.edit(f'Готово: {res}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
+			session_file = list_sessions()[s_idx]
+			await launch(event.edit, f'парсинг {session_file}, все группы',
+				lambda progress: parse_session_group_async(session_file, api_id, api_hash, None, parse_user_id, parse_user_name, progress=progress),
+				lambda res: f'Готово: {res}', [[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
 		elif key == 'PARSE_ALL_FILTERS':
 			s_idx = int(parts[1])
-			user_states[event.sender_id] = {'action': 'parse_filters', 's_idx': s_idx, 'g_idx': None, 'active': False}
-			await event.edit('Фильтры: выберите вариант', buttons=[
-				[Button.inline('Все', cb('F_ALL'))],
-				[Button.inline('Без админов', cb('F_NOADM'))],
-				[Button.inline('Онлайн <= 7 дней', cb('F_7'))],
-				[Button.inline('Онлайн <= 14 дней', cb('F_14'))],
-				[Button.inline('Онлайн <= 30 дней', cb('F_30'))],
-				[Button.inline('Учитывать «Недавно» (вкл/выкл)', cb('F_REC'))],
-				[Button.inline('Старт', cb('F_GO'))],
-				[Button.inline('Назад', cb('SESS_SEL', s_idx))],
-			])
+			user_states[event.sender_id] = {'action': 'parse_filters', 's_idx': s_idx, 'group_id': None, 'active': False, 'filters': FilterSpec().as_dict()}
+			await event.edit('Фильтры: выберите вариант', buttons=filter_buttons(s_idx, False))
 		elif key == 'PARSE_ACTIVE_ONE':
-			s_idx = int(parts[1]); g_idx = int(parts[2])
+			s_idx = int(parts[1]); group_id = int(parts[2])
 			options = getoptions()
 			parse_user_id = options[2] == 'True\n'
 			parse_user_name = options[3] == 'True\n'
-			try:
-				res = parse_session_group_active(list_sessions()[s_idx], api_id, api_hash, g_idx, parse_user_id, parse_user_name)
-			except Exception as exc:
-				await event.edit(f'Ошибка: {exc}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]]); return
-			await event.edit(f'Готово: {res}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
+			session_file = list_sessions()[s_idx]
+			await launch(event.edit, f'активные {session_file}, группа {group_id}',
+				lambda progress: parse_session_group_active_async(session_file, api_id, api_hash, None, parse_user_id, parse_user_name, group_id=group_id, progress=progress),
+				lambda res: f'Готово: {res}', [[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
 		elif key == 'PARSE_ACTIVE_ALL':
 			s_idx = int(parts[1])
 			options = getoptions()
 			parse_user_id = options[2] == 'True\n'
 			parse_user_name = options[3] == 'True\n'
-			try:
-				res = parse_session_group_active(list_sessions()[s_idx], api_id, api_hash, None, parse_user_id, parse_user_name)
-			except Exception as exc:
-				await event.edit(f'Ошибка: {exc}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]]); return
-			await event.edit(f'Готово: {res}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
+			session_file = list_sessions()[s_idx]
+			await launch(event.edit, f'активные {session_file}, все группы',
+				lambda progress: parse_session_group_active_async(session_file, api_id, api_hash, None, parse_user_id, parse_user_name, progress=progress),
+				lambda res: f'Готово: {res}', [[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
 		elif key == 'PARSE_ACTIVE_ONE_FILTERS':
-			s_idx = int(parts[1]); g_idx = int(parts[2])
-			user_states[event.sender_id] = {'action': 'parse_filters', 's_idx': s_idx, 'g_idx': g_idx, 'active': True}
-			await event.edit('Фильтры: выберите вариант', buttons=[
-				[Button.inline('Все', cb('F_ALL'))],
-				[Button.inline('Без админов', cb('F_NOADM'))],
-				[Button.inline('Онлайн <= 7 дней', cb('F_7'))],
-				[Button.inline('Онлайн <= 14 дней', cb('F_14'))],
-				[Button.inline('Онлайн <= 30 дней', cb('F_30'))],
-				[Button.inline('Учитывать «Недавно» (вкл/выкл)', cb('F_REC'))],
-				[Button.inline('Старт', cb('F_GO'))],
-				[Button.inline('Назад', cb('SESS_SEL', s_idx))],
-			])
+			s_idx = int(parts[1]); group_id = int(parts[2])
+			user_states[event.sender_id] = {'action': 'parse_filters', 's_idx': s_idx, 'group_id': group_id, 'active': True, 'filters': FilterSpec().as_dict()}
+			await event.edit('Фильтры: выберите вариант', buttons=filter_buttons(s_idx, True))
 		elif key == 'PARSE_ACTIVE_ALL_FILTERS':
 			s_idx = int(parts[1])
-			user_states[event.sender_id] = {'action': 'parse_filters', 's_idx': s_idx, 'g_idx': None, 'active': True}
-			await event.edit('Фильтры: выберите вариант', buttons=[
-				[Button.inline('Все', cb('F_ALL'))],
-				[Button.inline('Без админов', cb('F_NOADM'))],
-				[Button.inline('Онлайн <= 7 дней', cb('F_7'))],
-				[Button.inline('Онлайн <= 14 дней', cb('F_14'))],
-				[Button.inline('Онлайн <= 30 дней', cb('F_30'))],
-				[Button.inline('Учитывать «Недавно» (вкл/выкл)', cb('F_REC'))],
-				[Button.inline('Старт', cb('F_GO'))],
-				[Button.inline('Назад', cb('SESS_SEL', s_idx))],
-			])
-		elif key in ('F_ALL','F_NOADM','F_7','F_14','F_30','F_REC','F_GO'):
+			user_states[event.sender_id] = {'action': 'parse_filters', 's_idx': s_idx, 'group_id': None, 'active': True, 'filters': FilterSpec().as_dict()}
+			await event.edit('Фильтры: выберите вариант', buttons=filter_buttons(s_idx, True))
+		elif key in ('F_ALL','F_NOADM','F_7','F_14','F_30','F_REC','F_BOTS','F_UNAME','F_DEL','F_PREM','F_FULL','F_GO'):
 			st = user_states.get(event.sender_id, {})
 			if not st or st.get('action') != 'parse_filters':
 				await event.answer(); return
-			if key == 'F_REC':
-				st['include_recently'] = not st.get('include_recently', True)
+			spec = FilterSpec.from_dict(st.get('filters'))
+			if key in ('F_REC', 'F_BOTS', 'F_UNAME', 'F_DEL', 'F_PREM'):
+				if key == 'F_REC':
+					spec.include_recently = not spec.include_recently
+				elif key == 'F_BOTS':
+					spec.exclude_bots = not spec.exclude_bots
+				elif key == 'F_UNAME':
+					spec.require_username = not spec.require_username
+				elif key == 'F_DEL':
+					spec.exclude_deleted = not spec.exclude_deleted
+				else:
+					spec.premium = {None: True, True: False, False: None}[spec.premium]
+				st['filters'] = spec.as_dict()
+				user_states[event.sender_id] = st
+				await event.answer(f'Фильтры: {spec.describe()}', alert=False)
+				return
+			if key == 'F_FULL':
+				# Active parses normally scan only messages after the group's checkpoint
+				st['full_rescan'] = not st.get('full_rescan', False)
 				user_states[event.sender_id] = st
-				await event.answer(f"Недавно: {'Да' if st['include_recently'] else 'Нет'}", alert=False)
+				await event.answer(f"Полный пересмотр: {'Да' if st['full_rescan'] else 'Нет'}", alert=False)
 				return
 			if key == 'F_ALL':
-				st['exclude_admins'] = False; st['last_seen_days'] = None
+				spec = FilterSpec(include_recently=spec.include_recently)
 			elif key == 'F_NOADM':
-				st['exclude_admins'] = True
+				spec.exclude_admins = True
 			elif key == 'F_7':
-				st['last_seen_days'] = 7
+				spec.last_seen_days = 7
 			elif key == 'F_14':
-				st['last_seen_days'] = 14
+				spec.last_seen_days = 14
 			elif key == 'F_30':
-				st['last_seen_days'] = 30
+				spec.last_seen_days = 30
+			st['filters'] = spec.as_dict()
 			user_states[event.sender_id] = st
 			if key != 'F_GO':
 				await event.answer('Фильтр применён', alert=False)
 				return
 			# GO
-			s_idx = int(st['s_idx']); g_idx = st['g_idx']; active = bool(st.get('active'))
-			exclude_admins = bool(st.get('exclude_admins', False))
-			last_seen_days = st.get('last_seen_days', None)
-			include_recently = st.get('include_recently', True)
+			s_idx = int(st['s_idx']); group_id = st['group_id']; active = bool(st.get('active'))
+			full_rescan = bool(st.get('full_rescan', False))
 			options = getoptions()
 			parse_user_id = options[2] == 'True\n'
 			parse_user_name = options[3] == 'True\n'
-			try:
-				progress = {'processed': 0, 'total': 0}
-				await event.edit(f"Старт... 0/0", buttons=[[Button.inline('Отмена', cb('SESS_SEL', s_idx))]])
+			session_file = list_sessions()[s_idx]
+
+			async def run(progress):
 				if active:
-					res = parse_session_group_active_filtered(list_sessions()[s_idx], api_id, api_hash, g_idx, parse_user_id, parse_user_name, exclude_admins, last_seen_days, include_recently, progress=progress)
-				else:
-					res = parse_session_group_filtered(list_sessions()[s_idx], api_id, api_hash, g_idx, parse_user_id, parse_user_name, exclude_admins, last_seen_days, include_recently, progress=progress)
-				await event.edit(f"Готово: {progress.get('processed',0)}/{progress.get('total',0)}", buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
+					return await parse_session_group_active_filtered_async(session_file, api_id, api_hash, None, parse_user_id, parse_user_name, progress=progress, group_id=group_id, full_rescan=full_rescan, filters=spec)
+				return await parse_session_group_filtered_async(session_file, api_id, api_hash, None, parse_user_id, parse_user_name, progress=progress, group_id=group_id, stream=True, filters=spec)
+
+			def render(res):
 				if isinstance(res, dict) and res.get('error') == 'invalid_index':
-					await event.edit('Неверный индекс', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]]); return
-			except Exception as exc:
-				await event.edit(f'Ошибка: {exc}', buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]]); return
-			# Summarize
-			if active:
-				text = (
-					f"Групп: {res['groups_processed']}\n"
-					f"Сообщений просмотрено: {res['messages_scanned']}\n"
-					f"Уникальных отправителей: {res['unique_senders']}\n"
-					f"Подходят фильтрам: {res['matched']}\n"
-					f"user-id записано: {res['written_userids']}\n"
-					f"username записано: {res['written_usernames']}\n"
-					f"Исключено админов: {res['excluded_admins']}\n"
-					f"Исключено по неактивности: {res['excluded_inactive']}\n"
-					f"Ошибок: {res['errors']}\n"
-				)
+					return 'Неверный индекс'
+				return format_parse_summary(res, active)
+
+			title = f"{'активные' if active else 'участники'} ({spec.describe()}) {session_file}, {'все группы' if group_id is None else f'группа {group_id}'}"
+			await launch(event.edit, title, run, render, [[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
+		elif key == 'JOB_CANCEL':
+			if jobs.cancel(int(parts[1])):
+				await event.answer('Отменяется...', alert=False)
 			else:
-				text = (
-					f"Групп: {res['groups_processed']}\n"
-					f"Участников всего: {res['participants_total']}\n"
-					f"Подходят фильтрам: {res['matched']}\n"
-					f"user-id записано: {res['written_userids']}\n"
-					f"username записано: {res['written_usernames']}\n"
-					f"Исключено админов: {res['excluded_admins']}\n"
-					f"Исключено по неактивности: {res['excluded_inactive']}\n"
-					f"Ошибок: {res['errors']}\n"
-				)
-			await event.edit(text, buttons=[[Button.inline('Назад', cb('SESS_SEL', s_idx))]])
+				await event.answer('Задача уже завершена', alert=False)
 		elif key == 'INV':
 			s_idx = int(parts[1])
 			user_states[event.sender_id] = {'action': 'invite', 's_idx': s_idx}
@@ -395,7 +691,7 @@ def main():
 			]
 			await event.edit('Опции:', buttons=b)
 		elif key == 'CLR':
-			open('usernames.txt', 'w').close(); open('userids.txt', 'w').close()
+			clear_collected_users()
 			await event.edit('Очищено usernames.txt и userids.txt', buttons=[[Button.inline('Назад', cb('MAIN'))]])
 		elif key == 'CFG':
 			options = getoptions()
@@ -407,7 +703,7 @@ def main():
 		else:
 			await event.answer()
 
-	@client.on(events.NewMessage)
+	@on(events.NewMessage, 'text')
 	async def stateful_text_handler(event):
 		# Handle text input after button prompts (e.g., invite channel)
 		if not event.is_private:
@@ -438,7 +734,7 @@ def main():
 			try:
 				progress = {'processed': 0, 'total': 0}
 				await event.respond('Инвайт запущен... 0/0')
-				summary = invite_from_usernames_with_summary(sessions[s_idx], api_id, api_hash, channel, limit, progress=progress)
+				summary = await invite_from_usernames_with_summary_async(sessions[s_idx], api_id, api_hash, channel, limit, progress=progress)
 			except Exception as exc:
 				await event.respond(f'Ошибка инвайта: {exc}')
 				user_states.pop(event.sender_id, None)
@@ -530,7 +826,7 @@ def main():
 					user_states.pop(event.sender_id, None)
 		return
 
-	@client.on(events.NewMessage(pattern=r'^/sessions$'))
+	@on(events.NewMessage(pattern=r'^/sessions$'), 'sessions')
 	async def sessions_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
@@ -541,7 +837,7 @@ def main():
 		text_lines = [f"[{idx}] {name}" for idx, name in enumerate(sessions)]
 		await event.respond("Сессии:\n" + "\n".join(text_lines))
 
-	@client.on(events.NewMessage(pattern=r'^/groups\s+(\d+)$'))
+	@on(events.NewMessage(pattern=r'^/groups\s+(\d+)$'), 'groups')
 	async def groups_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
@@ -555,7 +851,7 @@ def main():
 			await event.respond('Неверный индекс сессии')
 			return
 		try:
-			groups = list_groups_for_session(sessions[s_idx], api_id, api_hash)
+			groups = await list_groups_for_session_async(sessions[s_idx], api_id, api_hash)
 		except Exception as exc:
 			await event.respond(f'Ошибка получения групп: {exc}')
 			return
@@ -563,10 +859,10 @@ def main():
 			await event.respond('Группы не найдены')
 			return
 		text_lines = [f"[{idx}] {title} @{username}" if username != '-' else f"[{idx}] {title}"
-					 for idx, title, username in groups]
+					 for idx, title, username, _channel_id in groups]
 		await event.respond("Группы:\n" + "\n".join(text_lines))
 
-	@client.on(events.NewMessage(pattern=r'^/parse\s+(\d+)\s+(\d+|all)$'))
+	@on(events.NewMessage(pattern=r'^/parse\s+(\d+)\s+(\d+|all)$'), 'parse')
 	async def parse_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
@@ -584,20 +880,22 @@ def main():
 			await event.respond('Неверный индекс сессии')
 			return
 		g_arg = parts[2]
-		group_index = None if g_arg == 'all' else int(g_arg)
+		group_id = None
+		if g_arg != 'all':
+			group_id = await group_id_for_index(sessions[s_idx], int(g_arg))
+			if group_id is None:
+				await event.respond('Неверный индекс группы')
+				return
 		options = getoptions()
 		parse_user_id = options[2] == 'True\n'
 		parse_user_name = options[3] == 'True\n'
-		try:
-			result = parse_session_group(
-				sessions[s_idx], api_id, api_hash, group_index, parse_user_id, parse_user_name
-			)
-		except Exception as exc:
-			await event.respond(f'Ошибка парсинга: {exc}')
-			return
-		await event.respond(f'Готово: {result}')
+		session_file = sessions[s_idx]
+		status = await event.respond('Запуск...')
+		await launch(status.edit, f"парсинг {session_file}, {'все группы' if group_id is None else f'группа {group_id}'}",
+			lambda progress: parse_session_group_async(session_file, api_id, api_hash, None, parse_user_id, parse_user_name, group_id=group_id, progress=progress),
+			lambda result: f'Готово: {result}')
 
-	@client.on(events.NewMessage(pattern=r'^/invite\s+(\d+)\s+(@?[A-Za-z0-9_]+)(?:\s+(\d+))?$'))
+	@on(events.NewMessage(pattern=r'^/invite\s+(\d+)\s+(@?[A-Za-z0-9_]+)(?:\s+(\d+))?$'), 'invite')
 	async def invite_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
@@ -619,13 +917,13 @@ def main():
 			channel_username = channel_username[1:]
 		max_invites = int(parts[3]) if len(parts) >= 4 else 20
 		try:
-			count = invite_from_usernames(sessions[s_idx], api_id, api_hash, channel_username, max_invites)
+			count = await invite_from_usernames_async(sessions[s_idx], api_id, api_hash, channel_username, max_invites)
 		except Exception as exc:
 			await event.respond(f'Ошибка инвайта: {exc}')
 			return
 		await event.respond(f'Инвайтов отправлено: {count}')
 
-	@client.on(events.NewMessage(pattern=r'^/parse_active\s+(\d+)\s+(\d+|all)(?:\s+(\d+))?$'))
+	@on(events.NewMessage(pattern=r'^/parse_active\s+(\d+)\s+(\d+|all)(?:\s+(\d+))?$'), 'parse_active')
 	async def parse_active_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
@@ -643,7 +941,12 @@ def main():
 			await event.respond('Неверный индекс сессии')
 			return
 		g_arg = parts[2]
-		group_index = None if g_arg == 'all' else int(g_arg)
+		group_id = None
+		if g_arg != 'all':
+			group_id = await group_id_for_index(sessions[s_idx], int(g_arg))
+			if group_id is None:
+				await event.respond('Неверный индекс группы')
+				return
 		limit = None
 		if len(parts) >= 4:
 			try:
@@ -653,16 +956,87 @@ def main():
 		options = getoptions()
 		parse_user_id = options[2] == 'True\n'
 		parse_user_name = options[3] == 'True\n'
+		session_file = sessions[s_idx]
+		status = await event.respond('Запуск...')
+		await launch(status.edit, f"активные {session_file}, {'все группы' if group_id is None else f'группа {group_id}'}",
+			lambda progress: parse_session_group_active_async(session_file, api_id, api_hash, None, parse_user_id, parse_user_name, limit, group_id=group_id, progress=progress),
+			lambda result: f'Готово: {result}')
+
+	@on(events.NewMessage(pattern=r'^/parse_sessions(?:\s+(active))?(?:\s+(\d+))?(?:\s+(.+))?$'), 'parse_sessions')
+	async def parse_sessions_handler(event):
+		if not is_allowed_user(event.sender_id):
+			return
+		active = event.pattern_match.group(1) is not None
+		limit = int(event.pattern_match.group(2)) if event.pattern_match.group(2) else 10000
 		try:
-			result = parse_session_group_active(
-				sessions[s_idx], api_id, api_hash, group_index, parse_user_id, parse_user_name, limit
-			)
-		except Exception as exc:
-			await event.respond(f'Ошибка парсинга: {exc}')
+			spec = FilterSpec.parse(event.pattern_match.group(3) or '')
+		except ValueError as exc:
+			await event.respond(f'{exc}. Фильтры: noadmins seen:N norecent nobots username nodeleted premium nopremium')
+			return
+		if not list_sessions():
+			await event.respond('Нет .session файлов')
+			return
+		options = getoptions()
+		parse_user_id = options[2] == 'True\n'
+		parse_user_name = options[3] == 'True\n'
+		status = await event.respond('Запуск...')
+		await launch(status.edit, f"все аккаунты{' (активные)' if active else ''}, {spec.describe()}",
+			lambda progress: parse_all_sessions_async(api_id, api_hash, parse_user_id, parse_user_name, active=active, message_limit=limit, progress=progress, filters=spec),
+			lambda res: (
+				f"Аккаунтов: {res['sessions']}\n"
+				f"Групп: {res['groups_processed']} (общих пропущено: {res['groups_shared']})\n"
+				f"Подходят фильтрам: {res['matched']}\n"
+				f"user-id записано: {res['written_userids']}\n"
+				f"username записано: {res['written_usernames']}\n"
+				+ format_excluded(res) +
+				f"Ошибок: {res['errors']}\n"
+				f"Ожидание FloodWait: {res['flood_wait_seconds']} с\n"
+				+ format_memory(res)
+			))
+
+	@on(events.NewMessage(pattern=r'^/jobs$'), 'jobs')
+	async def jobs_handler(event):
+		if not is_allowed_user(event.sender_id):
+			return
+		listed = jobs.list()
+		if not listed:
+			await event.respond('Задач нет')
 			return
-		await event.respond(f'Готово: {result}')
+		await event.respond('Задачи:\n' + '\n'.join(job.status_line() for job in listed))
+
+	@on(events.NewMessage(pattern=r'^/cancel\s+(\d+)$'), 'cancel')
+	async def cancel_handler(event):
+		if not is_allowed_user(event.sender_id):
+			return
+		job_id = int(event.pattern_match.group(1))
+		if jobs.cancel(job_id):
+			await event.respond(f'Задача #{job_id} отменяется')
+		elif jobs.get(job_id) is not None:
+			await event.respond(f'Задача #{job_id} уже завершена')
+		else:
+			await event.respond('Нет такой задачи')
 
-	@client.on(events.NewMessage(pattern=r'^/toggle_id$'))
+	@on(events.NewMessage(pattern=r'^/stats(?:\s+(\d+))?$'), 'stats')
+	async def stats_handler(event):
+		if not is_allowed_user(event.sender_id):
+			return
+		if event.pattern_match.group(1):
+			job = jobs.get(int(event.pattern_match.group(1)))
+			if job is None:
+				await event.respond('Нет такой задачи')
+				return
+		else:
+			measured = [j for j in jobs.list() if isinstance(j.result, dict) and j.result.get('stages')]
+			job = measured[-1] if measured else None
+		if job is None:
+			text = 'Замеров по этапам пока нет\n'
+		elif not (isinstance(job.result, dict) and job.result.get('stages')):
+			text = f'У задачи #{job.id} нет замеров по этапам\n'
+		else:
+			text = f"Задача #{job.id}: {job.title}, {format_duration(job.elapsed())}\n" + format_stages(job.result['stages'])
+		await event.respond(text + '\n' + format_runtime_stats())
+
+	@on(events.NewMessage(pattern=r'^/toggle_id$'), 'toggle_id')
 	async def toggle_id_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
@@ -672,7 +1046,7 @@ def main():
 			return
 		await event.respond(f"parse user-id: {options[2].strip()}")
 
-	@client.on(events.NewMessage(pattern=r'^/toggle_name$'))
+	@on(events.NewMessage(pattern=r'^/toggle_name$'), 'toggle_name')
 	async def toggle_name_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
@@ -682,15 +1056,14 @@ def main():
 			return
 		await event.respond(f"parse user-name: {options[3].strip()}")
 
-	@client.on(events.NewMessage(pattern=r'^/clear$'))
+	@on(events.NewMessage(pattern=r'^/clear$'), 'clear')
 	async def clear_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
-		open('usernames.txt', 'w').close()
-		open('userids.txt', 'w').close()
+		clear_collected_users()
 		await event.respond('Очищено usernames.txt и userids.txt')
 
-	@client.on(events.NewMessage(pattern=r'^/config$'))
+	@on(events.NewMessage(pattern=r'^/config$'), 'config')
 	async def config_handler(event):
 		if not is_allowed_user(event.sender_id):
 			return
@@ -702,7 +1075,7 @@ def main():
 			f"parse user-id: {options[2].strip()}\nparse user-name: {options[3].strip()}"
 		)
 
-	@client.on(events.NewMessage(pattern=r'^/add_session$'))
+	@on(events.NewMessage(pattern=r'^/add_session$'), 'add_session')
 	async def add_session_cmd(event):
 		if not is_allowed_user(event.sender_id):
 			return
@@ -710,7 +1083,11 @@ def main():
 		await event.respond('Введите имя сессии (латиница/цифры . _ -). Можно без .session')
 
 	print('[bot] Бот запущен. Ожидаю команды...')
-	client.run_until_disconnected()
+	try:
+		client.run_until_disconnected()
+	finally:
+		jobs.cancel_all()
+		client.loop.run_until_complete(get_pool().close_all())
 
 
 if __name__ == '__main__':
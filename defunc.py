@@ -4,61 +4,102 @@ Public License, v. 2.0. If a copy of the MPL was not distributed
 with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 '''
 
-from telethon.tl.functions.channels import InviteToChannelRequest
+from telethon.tl.functions.channels import InviteToChannelRequest, GetParticipantsRequest
 from telethon.sync import TelegramClient
 from telethon.tl.functions.messages import GetDialogsRequest
-from telethon.tl.types import InputPeerEmpty
+from telethon.tl.types import InputPeerEmpty, InputUserFromMessage
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.types.messages import Dialogs, DialogsNotModified
+from telethon import utils
+from telethon.extensions import BinaryReader
 import os
+import math
+import base64
 import time
 import random
+import asyncio
+from datetime import datetime, timezone
+from session_pool import get_pool
+from request_scheduler import get_scheduler
+from user_store import get_store, append_lines, scan_scope
+from parse_jobs import ParseJob, job_key
+from entity_cache import get_entity_cache
+from user_filters import FilterSpec, EXCLUDED_KEYS
+from parse_stats import instrumented, stage, record, merge_stages
+from metrics import RPC_SECONDS, USERS_WRITTEN
+from memory_profile import MemoryProfile, memory_profiling_enabled
+from group_catalog import get_catalog_cache, update_catalog_groups, catalog_group, catalog_peer, load_catalog, catalog_channels
+from group_catalog import catalog_admin_ids, store_admin_ids
 from dotenv import load_dotenv, find_dotenv
-from datetime import datetime, timezone, timedelta
-from telethon.tl.types import UserStatusOnline, UserStatusOffline, UserStatusRecently, UserStatusLastWeek, UserStatusLastMonth
-from telethon.tl.types import ChannelParticipantsAdmins
-from telethon.errors.rpcerrorlist import PeerFloodError, UserPrivacyRestrictedError, ChatAdminRequiredError, UserAlreadyParticipantError
+from telethon.tl.types import ChannelParticipantsAdmins, ChannelParticipantsSearch
+from telethon.errors.rpcerrorlist import PeerFloodError, UserPrivacyRestrictedError, ChatAdminRequiredError, UserAlreadyParticipantError, FloodWaitError
 
 # Load environment variables from .env if present
 load_dotenv()
 
-def inviting(client, channel, users):
+
+def _run_sync(coro):
+    """Run a coroutine to completion on the default loop (the one telethon.sync uses).
+
+    Sync wrappers must not be called from inside a running loop: async code
+    (bot.py) should await the *_async variants instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        policy = asyncio.get_event_loop_policy()
+        try:
+            loop = policy.get_event_loop()
+        except RuntimeError:
+            loop = policy.new_event_loop()
+            policy.set_event_loop(loop)
+        return loop.run_until_complete(coro)
+    coro.close()
+    raise RuntimeError("Sync wrapper called from a running event loop; await the *_async variant instead.")
+
+
+async def inviting_async(client, channel, users):
     """Invite a user to a channel by resolving entities first."""
     try:
-        channel_entity = client.get_entity(channel)
+        channel_entity = await client.get_entity(channel)
     except Exception:
         channel_entity = channel
     try:
-        user_entity = client.get_entity(users)
+        user_entity = await client.get_entity(users)
     except Exception:
         user_entity = users
-    client(InviteToChannelRequest(
+    await client(InviteToChannelRequest(
         channel=channel_entity,
         users=[user_entity]
     ))
 
 
-def parsing(client, index: int, id: bool, name: bool):
-    all_participants = []
-    all_participants = client.get_participants(index)
-    if name:
-        with open('usernames.txt', 'r+') as f:
-            usernames = f.readlines()
-            for user in all_participants:
-                if user.username:
-                    if ('Bot' not in user.username) and ('bot' not in user.username):
-                        if (('@' + user.username + '\n') not in usernames):
-                            f.write('@' + user.username + '\n')
-                        else:
-                            continue
-                    else:
-                        continue
-                else:
-                    continue
-    if id:
-        with open('userids.txt', 'r+') as f:
-            userids = f.readlines()
-            for user in all_participants:
-                if (str(user.id) + '\n') not in userids:
-                    f.write(str(user.id) + '\n')
+def inviting(client, channel, users):
+    return _run_sync(inviting_async(client, channel, users))
+
+
+async def parsing_async(client, index, id: bool, name: bool, filters: FilterSpec | None = None,
+                        progress: dict | None = None) -> dict:
+    all_participants = await _get_participants(client, index)
+    summary = {'participants_total': len(all_participants)}
+    _progress_set(progress, total=len(all_participants), processed=0)
+    if filters is not None:
+        session_file = getattr(getattr(client, 'session', None), 'filename', None)
+        admin_ids = await _fetch_admin_ids(client, session_file, index) if filters.exclude_admins else set()
+        user_filter = filters.compile(admin_ids)
+        all_participants = user_filter.select(all_participants)
+        user_filter.take_rejected(summary)
+    # Dedup goes through the user store's indexes, which are updated as rows are
+    # written, instead of scanning the txt files line by line for every user.
+    summary['matched'] = len(all_participants)
+    summary['written_userids'], summary['written_usernames'] = _write_users(
+        [(user.id, user.username) for user in all_participants], index, id, name)
+    _progress_set(progress, processed=summary['participants_total'])
+    return summary
+
+
+def parsing(client, index, id: bool, name: bool, filters: FilterSpec | None = None) -> dict:
+    return _run_sync(parsing_async(client, index, id, name, filters))
 
 
 def _env_path() -> str:
@@ -122,6 +163,21 @@ def _progress_set(progress: dict | None, **kwargs) -> None:
     progress.update(kwargs)
 
 
+def _memory_profile() -> MemoryProfile | None:
+    """A started MemoryProfile when MEMORY_PROFILE is on, else None."""
+    if not memory_profiling_enabled():
+        return None
+    profile = MemoryProfile()
+    profile.start()
+    return profile
+
+
+def _memory_mark(profile: MemoryProfile | None, label: str) -> None:
+    if profile is None:
+        return
+    profile.mark(label)
+
+
 def _progress_inc(progress: dict | None, key: str, amount: int = 1) -> None:
     if progress is None:
         return
@@ -264,8 +320,14 @@ def getoptions():
         f"{'True' if parse_user_name else 'False'}\n",
     ]
 
-
 # ===== Helpers for non-interactive (bot) control =====
+#
+# Every Telegram-facing helper below is a coroutine (``*_async``) so bot.py can
+# await it without freezing its event loop. The plain-named functions are thin
+# sync wrappers kept for main.py and scripts.
+#
+# Clients are leased from session_pool, so repeated calls on the same .session
+# reuse one connection instead of reconnecting and re-authorizing every time.
 
 def list_sessions() -> list:
     sessions = []
@@ -275,419 +337,1091 @@ def list_sessions() -> list:
     return sessions
 
 
-def list_groups_for_session(session_file: str, api_id: int, api_hash: str):
-    client = TelegramClient(session_file.replace('\n', ''), api_id, api_hash).start()
-    chats = []
-    groups = []
-    result = client(GetDialogsRequest(
-        offset_date=None,
-        offset_id=0,
-        offset_peer=InputPeerEmpty(),
-        limit=200,
-        hash=0
-    ))
-    chats.extend(result.chats)
-    for chat in chats:
-        try:
-            if chat.megagroup is True:
-                groups.append(chat)
-        except:
-            continue
-    # Return lightweight data: (index, title, username or '-')
-    export = []
-    for index, chat in enumerate(groups):
-        username = getattr(chat, 'username', None)
-        export.append((index, chat.title, username if username else '-'))
-    return export
+DIALOGS_PAGE_SIZE = 100
 
 
-def parse_session_group(session_file: str, api_id: int, api_hash: str, group_index: int | None,
-                        parse_user_id: bool, parse_user_name: bool) -> str:
-    client = TelegramClient(session_file.replace('\n', ''), api_id, api_hash).start()
-    chats = []
-    groups = []
-    result = client(GetDialogsRequest(
-        offset_date=None,
-        offset_id=0,
-        offset_peer=InputPeerEmpty(),
-        limit=200,
-        hash=0
-    ))
-    chats.extend(result.chats)
-    for chat in chats:
-        try:
-            if chat.megagroup is True:
-                groups.append(chat)
-        except:
+def _dialogs_hash(dialogs: list, messages: dict) -> int:
+    """Telegram's 64-bit vector hash over (peer, top message, date) of the listed dialogs."""
+    acc = 0
+    for dialog in dialogs:
+        peer_id = utils.get_peer_id(dialog.peer)
+        message = messages.get((peer_id, dialog.top_message))
+        date = int(message.date.timestamp()) if message is not None and message.date else 0
+        for value in (abs(peer_id), dialog.top_message, date):
+            acc ^= acc >> 21
+            acc ^= (acc << 35) & 0xFFFFFFFFFFFFFFFF
+            acc ^= acc >> 4
+            acc = (acc + value) & 0xFFFFFFFFFFFFFFFF
+    # The API takes a signed long
+    return acc - (1 << 64) if acc >= (1 << 63) else acc
+
+
+def _offset_key(offset_date, offset_id: int, offset_peer) -> list:
+    """JSON form of a GetDialogsRequest offset, as stored with the pages of the dialogs snapshot."""
+    return [int(offset_date.timestamp()) if offset_date else 0, offset_id,
+            base64.b64encode(bytes(offset_peer)).decode()]
+
+
+def _offset_from_key(key: list) -> tuple:
+    stamp, offset_id, peer = key
+    return (datetime.fromtimestamp(stamp, timezone.utc) if stamp else None, offset_id,
+            BinaryReader(base64.b64decode(peer)).tgread_object())
+
+
+async def _enumerate_dialog_chats(client, known_pages: list | None = None,
+                                  known_chats: dict | None = None) -> tuple[list, list[dict]]:
+    """Page through every dialog and return (chats, pages).
+
+    ``pages`` describes each response: the offset it was requested at, the
+    hash of the dialogs it listed, the ids of the megagroups it added and the
+    offset of the next page (None after the last one). Given the
+    ``known_pages`` of an earlier call, a page requested at the same offset as
+    then is sent with its hash; if Telegram answers
+    messages.DialogsNotModified, its megagroups are taken from ``known_chats``
+    (by id) and paging goes on from the stored next offset. Once a page has
+    changed, the offsets of the following ones no longer match and they are
+    fetched in full.
+    """
+    known_pages = known_pages or []
+    known_chats = known_chats or {}
+    chats: list = []
+    pages: list[dict] = []
+    seen_dialogs: set[int] = set()
+    seen_chats: set[int] = set()
+    offset_date, offset_id, offset_peer = None, 0, InputPeerEmpty()
+    while True:
+        key = _offset_key(offset_date, offset_id, offset_peer)
+        known = known_pages[len(pages)] if len(pages) < len(known_pages) else None
+        if known is not None and known.get('offset') != key:
+            known = None
+        request = GetDialogsRequest(
+            offset_date=offset_date,
+            offset_id=offset_id,
+            offset_peer=offset_peer,
+            limit=DIALOGS_PAGE_SIZE,
+            hash=known['hash'] if known is not None else 0
+        )
+        result = await _rpc(client, lambda: client(request))
+        if isinstance(result, DialogsNotModified):
+            if known is None:
+                break
+            pages.append(known)
+            for chat_id in known['chat_ids']:
+                if chat_id in known_chats and chat_id not in seen_chats:
+                    seen_chats.add(chat_id)
+                    chats.append(known_chats[chat_id])
+            if known['next'] is None:
+                break
+            offset_date, offset_id, offset_peer = _offset_from_key(known['next'])
             continue
+        messages = {(utils.get_peer_id(m.peer_id), m.id): m for m in result.messages}
+        page = {'offset': key, 'hash': _dialogs_hash(result.dialogs, messages), 'chat_ids': [], 'next': None}
+        pages.append(page)
+        for chat in result.chats:
+            if chat.id not in seen_chats:
+                seen_chats.add(chat.id)
+                chats.append(chat)
+                if getattr(chat, 'megagroup', False) is True:
+                    page['chat_ids'].append(chat.id)
+        new_dialogs = [d for d in result.dialogs if utils.get_peer_id(d.peer) not in seen_dialogs]
+        seen_dialogs.update(utils.get_peer_id(d.peer) for d in new_dialogs)
+        if isinstance(result, Dialogs) or len(result.dialogs) < DIALOGS_PAGE_SIZE or not new_dialogs:
+            break
+        last = result.dialogs[-1]
+        last_message = messages.get((utils.get_peer_id(last.peer), last.top_message))
+        entities = {utils.get_peer_id(e): e for e in [*result.users, *result.chats]}
+        last_entity = entities.get(utils.get_peer_id(last.peer))
+        if last_message is None or last_entity is None:
+            break
+        offset_date, offset_id = last_message.date, last_message.id
+        offset_peer = utils.get_input_peer(last_entity)
+        page['next'] = _offset_key(offset_date, offset_id, offset_peer)
+    return chats, pages
+
+
+async def _fetch_megagroups(client, session_file: str | None = None) -> list:
+    """All megagroups of the account; with ``session_file`` the stored catalog doubles as a dialogs snapshot."""
+    with stage('dialogs'):
+        known_pages, known_chats = None, None
+        if session_file is not None:
+            catalog = load_catalog(session_file)
+            if catalog['groups']:
+                known_pages = catalog.get('dialog_pages')
+                known_chats = {chat.id: chat for chat in catalog_channels(session_file)}
+        chats, pages = await _enumerate_dialog_chats(client, known_pages, known_chats)
+        groups = [chat for chat in chats if getattr(chat, 'megagroup', False) is True]
+        if session_file is not None:
+            update_catalog_groups(session_file, groups, pages)
+        return groups
+
+
+async def fetch_megagroups_async(client) -> list:
+    return await _fetch_megagroups(client)
+
+
+def fetch_megagroups(client) -> list:
+    return _run_sync(fetch_megagroups_async(client))
+
+
+async def _resolve_targets(client, session_file: str, group_index: int | None, group_id: int | None = None) -> list:
+    """Peers to parse: one group by channel id, one by dialog index, or all megagroups.
 
+    A channel id found in the session's peer catalog becomes an InputPeerChannel
+    directly, with no GetDialogsRequest round trip.
+    """
+    if group_id is not None:
+        entry = catalog_group(session_file, group_id)
+        peer = catalog_peer(group_id, entry) if entry else None
+        if peer is not None:
+            return [peer]
+    groups = await _fetch_megagroups(client, session_file)
+    if group_id is not None:
+        return [g for g in groups if g.id == group_id]
     if group_index is None:
-        for g in groups:
-            parsing(client, g, parse_user_id, parse_user_name)
-        return 'parsed_all'
-    else:
-        if 0 <= group_index < len(groups):
-            target_group = groups[group_index]
-            parsing(client, target_group, parse_user_id, parse_user_name)
-            return f'parsed_{group_index}'
+        return groups
+    return [groups[group_index]] if 0 <= group_index < len(groups) else []
+
+
+async def list_groups_for_session_async(session_file: str, api_id: int, api_hash: str, refresh: bool = False):
+    """Megagroups of a session, served from the catalog cache unless stale or ``refresh`` is set."""
+    cache = get_catalog_cache()
+    if not refresh:
+        cached = cache.get(session_file)
+        if cached is not None:
+            return cached
+    async with get_pool().client(session_file, api_id, api_hash) as client:
+        groups = await _fetch_megagroups(client, session_file)
+        # Return lightweight data: (index, title, username or '-', channel id)
+        export = []
+        for index, chat in enumerate(groups):
+            username = getattr(chat, 'username', None)
+            export.append((index, chat.title, username if username else '-', chat.id))
+        cache.put(session_file, export)
+        return export
+
+
+def list_groups_for_session(session_file: str, api_id: int, api_hash: str, refresh: bool = False):
+    return _run_sync(list_groups_for_session_async(session_file, api_id, api_hash, refresh))
+
+
+try:
+    GROUP_CONCURRENCY = max(1, int(os.getenv('PARSE_GROUP_CONCURRENCY', '1')))
+except ValueError:
+    GROUP_CONCURRENCY = 1
+
+
+async def _rpc(client, call, requests=1):
+    """Send a parse-path request through the session's FloodWait scheduler.
+
+    ``requests`` RPCs (or a callable returning how many the call made), and
+    the FloodWait slept out meanwhile, are counted towards the current parse
+    stage (see parse_stats). The latency of calls that made a request, minus
+    that wait, goes to telegram_rpc_seconds{session}.
+    """
+    scheduler = get_scheduler().for_client(client)
+    started = time.monotonic()
+    waited = scheduler.waited_seconds
+    try:
+        return await scheduler.call(call)
+    finally:
+        waited = scheduler.waited_seconds - waited
+        if callable(requests):
+            requests = requests()
+        record(rpcs=requests, flood_wait_seconds=waited)
+        if requests:
+            RPC_SECONDS.observe(max(0.0, time.monotonic() - started - waited), session=os.path.basename(scheduler.name))
+
+
+async def _run_groups(targets: list, collect, commit, concurrency: int) -> None:
+    """Run ``collect(group)`` for up to ``concurrency`` groups at once and ``commit(group, result)`` in target order.
+
+    Commits are made in the order a sequential loop would make them, so the
+    store sees the same write sequence and the summaries come out identical.
+    """
+    if concurrency <= 1 or len(targets) <= 1:
+        for g in targets:
+            await commit(g, await collect(g))
+        return
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(g):
+        async with semaphore:
+            return await collect(g)
+
+    tasks = [asyncio.ensure_future(run(g)) for g in targets]
+    try:
+        for g, task in zip(targets, tasks):
+            await commit(g, await task)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def parse_session_group_async(session_file: str, api_id: int, api_hash: str, group_index: int | None,
+                                    parse_user_id: bool, parse_user_name: bool,
+                                    group_id: int | None = None,
+                                    concurrency: int | None = None,
+                                    progress: dict | None = None) -> str:
+    """concurrency: groups fetched at once when parsing all of them (default PARSE_GROUP_CONCURRENCY).
+
+    ``progress`` counts participants: fetched ones add to ``total``, written groups to ``processed``.
+    """
+    async with get_pool().client(session_file, api_id, api_hash) as client:
+        targets = await _resolve_targets(client, session_file, group_index, group_id)
+
+        if group_index is None and group_id is None:
+            concurrency = concurrency or GROUP_CONCURRENCY
+
+            async def collect(g) -> list:
+                participants = await _get_participants(client, g)
+                _progress_inc(progress, 'total', len(participants))
+                return [(user.id, user.username) for user in participants]
+
+            async def commit(g, users: list) -> None:
+                _write_users(users, g, parse_user_id, parse_user_name)
+                _progress_inc(progress, 'processed', len(users))
+
+            await _run_groups(targets, collect, commit, concurrency)
+            return 'parsed_all'
         else:
-            return 'invalid_index'
+            if targets:
+                await parsing_async(client, targets[0], parse_user_id, parse_user_name, progress=progress)
+                return f'parsed_{group_id if group_id is not None else group_index}'
+            else:
+                return 'invalid_index'
 
 
-def _user_passes_last_seen(user, last_seen_days: int | None, include_recently: bool) -> bool:
-    if last_seen_days is None:
-        return True
-    status = getattr(user, 'status', None)
-    now = datetime.now(timezone.utc)
-    threshold = timedelta(days=last_seen_days)
-    if isinstance(status, UserStatusOnline):
-        return True
-    if isinstance(status, UserStatusOffline):
-        was_online = getattr(status, 'was_online', None)
-        if not was_online:
-            return False
-        if was_online.tzinfo is None:
-            was_online = was_online.replace(tzinfo=timezone.utc)
-        return (now - was_online) <= threshold
-    if isinstance(status, UserStatusRecently):
-        return include_recently
-    if isinstance(status, UserStatusLastWeek):
-        return last_seen_days >= 7
-    if isinstance(status, UserStatusLastMonth):
-        return last_seen_days >= 30
-    # Unknown status
-    return False
+def parse_session_group(session_file: str, api_id: int, api_hash: str, group_index: int | None,
+                        parse_user_id: bool, parse_user_name: bool,
+                        group_id: int | None = None, concurrency: int | None = None) -> str:
+    return _run_sync(parse_session_group_async(session_file, api_id, api_hash, group_index,
+                                               parse_user_id, parse_user_name, group_id, concurrency))
 
 
-def parse_session_group_filtered(session_file: str, api_id: int, api_hash: str, group_index: int | None,
-                                 parse_user_id: bool, parse_user_name: bool,
-                                 exclude_admins: bool = False,
-                                 last_seen_days: int | None = None,
-                                 include_recently: bool = True,
-                                 progress: dict | None = None) -> dict:
-    client = TelegramClient(session_file.replace('\n', ''), api_id, api_hash).start()
-    chats = []
-    groups = []
-    result = client(GetDialogsRequest(
-        offset_date=None,
-        offset_id=0,
-        offset_peer=InputPeerEmpty(),
-        limit=200,
-        hash=0
-    ))
-    chats.extend(result.chats)
-    for chat in chats:
-        try:
-            if chat.megagroup is True:
-                groups.append(chat)
-        except:
-            continue
+def _filter_spec(filters: FilterSpec | None, exclude_admins: bool, last_seen_days: int | None,
+                 include_recently: bool) -> FilterSpec:
+    """``filters`` if given, else the spec the older keyword arguments describe."""
+    if filters is not None:
+        return filters
+    return FilterSpec(exclude_admins=exclude_admins, last_seen_days=last_seen_days, include_recently=include_recently)
 
-    def collect_for_group(target_group) -> dict:
-        summary = {
+
+try:
+    STREAM_BATCH_SIZE = max(1, int(os.getenv('PARSE_STREAM_BATCH_SIZE', '1000')))
+except ValueError:
+    STREAM_BATCH_SIZE = 1000
+
+
+PARTICIPANTS_PAGE_SIZE = 200
+
+
+async def _iter_participant_pages(client, target_group, offset: int = 0):
+    """Yield (total, users, next_offset) for each channels.GetParticipants page from ``offset`` on.
+
+    Same requests iter_participants makes, but the offset is exposed so a
+    stream can be checkpointed and resumed in the middle of a group.
+    """
+    channel = await client.get_input_entity(target_group)
+    while True:
+        request = GetParticipantsRequest(channel, ChannelParticipantsSearch(''), offset, PARTICIPANTS_PAGE_SIZE, hash=0)
+        with stage('fetch'):
+            result = await _rpc(client, lambda: client(request))
+        if not result.participants:
+            return
+        users = {u.id: u for u in result.users}
+        page = [users[p.user_id] for p in result.participants if getattr(p, 'user_id', None) in users]
+        offset += len(result.participants)
+        yield result.count, page, offset
+        if offset >= result.count:
+            return
+
+
+async def _get_participants(client, target_group, filter=None) -> list:
+    """client.get_participants through _rpc, counting the PARTICIPANTS_PAGE_SIZE pages Telethon requests for it."""
+    fetched = {}
+
+    async def call():
+        fetched['users'] = await client.get_participants(target_group, filter=filter)
+        return fetched['users']
+
+    return await _rpc(client, call,
+                      requests=lambda: max(1, math.ceil(len(fetched.get('users', ())) / PARTICIPANTS_PAGE_SIZE)))
+
+
+async def _fetch_admin_ids(client, session_file: str | None, target_group) -> set[int]:
+    """Admin ids of a group, from the session's catalog while fresh (ADMIN_CACHE_TTL_SECONDS)."""
+    channel_id = _peer_channel_id(target_group)
+    if session_file and channel_id is not None:
+        cached = catalog_admin_ids(session_file, channel_id)
+        if cached is not None:
+            return cached
+    try:
+        with stage('admins'):
+            admins = await _get_participants(client, target_group, ChannelParticipantsAdmins)
+    except Exception:
+        return set()
+    admin_ids = {u.id for u in admins}
+    if session_file and channel_id is not None:
+        store_admin_ids(session_file, channel_id, admin_ids)
+    return admin_ids
+
+
+@instrumented
+async def parse_session_group_filtered_async(session_file: str, api_id: int, api_hash: str, group_index: int | None,
+                                             parse_user_id: bool, parse_user_name: bool,
+                                             exclude_admins: bool = False,
+                                             last_seen_days: int | None = None,
+                                             include_recently: bool = True,
+                                             progress: dict | None = None,
+                                             group_id: int | None = None,
+                                             stream: bool = False,
+                                             resume: bool = True,
+                                             concurrency: int | None = None,
+                                             filters: FilterSpec | None = None) -> dict:
+    """Parse group members with filters.
+
+    filters: the FilterSpec to apply; without it exclude_admins, last_seen_days
+    and include_recently make one. Users rejected by each filter are reported
+    as excluded_<filter>.
+
+    stream: read participants page by page and write matches in batches of
+    STREAM_BATCH_SIZE instead of loading the whole member list first.
+    resume: keep a ParseJob for the run. Finished groups are recorded, and in
+    stream mode so is the participant offset at every flush; a FloodWait longer
+    than FLOOD_WAIT_MAX_SECONDS stops the run there and calling again with the
+    same arguments continues from that point instead of group 0. Shorter waits
+    are slept out by the request scheduler and reported as flood_wait_seconds.
+    concurrency: groups fetched at once (default PARSE_GROUP_CONCURRENCY). Each
+    group's matches are held until the groups before it are written, so the
+    result is the same as a sequential run.
+    The summary's ``stages`` gives wall time, RPCs, FloodWait seconds and bytes
+    written per stage (dialogs, admins, fetch, filter, write; see parse_stats).
+    With MEMORY_PROFILE on, ``memory`` has traced and resident memory at each
+    group's stage boundaries, the peak RSS and the top allocation sites.
+    """
+    async with get_pool().client(session_file, api_id, api_hash) as client:
+        targets = await _resolve_targets(client, session_file, group_index, group_id)
+        spec = _filter_spec(filters, exclude_admins, last_seen_days, include_recently)
+        job = ParseJob(job_key('members', session_file, group_index, group_id, parse_user_id, parse_user_name,
+                               spec.as_dict(), stream)) if resume else None
+        concurrency = concurrency or GROUP_CONCURRENCY
+        concurrent = concurrency > 1 and len(targets) > 1
+
+        async def collect_for_group(target_group) -> tuple[dict, list]:
+            summary = {
+                'participants_total': 0,
+                'matched': 0,
+                'written_userids': 0,
+                'written_usernames': 0,
+                **dict.fromkeys(EXCLUDED_KEYS, 0),
+                'errors': 0,
+            }
+            channel_id = _peer_channel_id(target_group)
+            cursor = job.cursor(channel_id) if job is not None else {}
+            summary.update(cursor.get('summary', {}))
+            admin_ids = await _fetch_admin_ids(client, session_file, target_group) if spec.exclude_admins else set()
+            user_filter = spec.compile(admin_ids)
+            _memory_mark(profile, 'admins')
+            matched_users: list[tuple[int, str | None]] = []
+
+            def consider(users) -> None:
+                try:
+                    with stage('filter'):
+                        for user in user_filter.select(users):
+                            summary['matched'] += 1
+                            matched_users.append((user.id, getattr(user, 'username', None)))
+                except Exception:
+                    summary['errors'] += 1
+                finally:
+                    _progress_inc(progress, 'processed', len(users))
+
+            def flush() -> None:
+                user_filter.take_rejected(summary)
+                # Concurrent groups keep their matches for the in-order commit
+                if concurrent:
+                    return
+                written_ids, written_names = _write_users(matched_users, target_group, parse_user_id, parse_user_name)
+                summary['written_userids'] += written_ids
+                summary['written_usernames'] += written_names
+                matched_users.clear()
+
+            def set_total(total: int) -> None:
+                if concurrent:
+                    _progress_inc(progress, 'total', total)
+                else:
+                    _progress_set(progress, total=total)
+
+            if stream:
+                # Participants are consumed page by page and matches flushed every
+                # STREAM_BATCH_SIZE users, so memory does not grow with the group.
+                # Each flush is also the resume point of the job.
+                offset = cursor.get('offset', 0)
+                if not concurrent:
+                    _progress_set(progress, total=0, processed=offset)
+                first_page = True
+                try:
+                    async for total, users, offset in _iter_participant_pages(client, target_group, offset):
+                        if first_page or not concurrent:
+                            set_total(total)
+                            first_page = False
+                        summary['participants_total'] += len(users)
+                        consider(users)
+                        if len(matched_users) >= STREAM_BATCH_SIZE and not concurrent:
+                            flush()
+                            if job is not None:
+                                job.save_cursor(channel_id, offset=offset, summary=summary)
+                except FloodWaitError:
+                    flush()
+                    if job is None:
+                        summary['errors'] += 1
+                        return summary, matched_users
+                    # A concurrent group has written nothing yet, so it restarts from its old cursor
+                    if not concurrent:
+                        job.save_cursor(channel_id, offset=offset, summary=summary)
+                    raise
+                except Exception:
+                    summary['errors'] += 1
+                _memory_mark(profile, 'fetched')
+                flush()
+                _memory_mark(profile, 'written')
+                return summary, matched_users
+
+            try:
+                with stage('fetch'):
+                    participants = await _get_participants(client, target_group)
+            except FloodWaitError:
+                if job is not None:
+                    raise
+                participants = []
+            except Exception:
+                participants = []
+            _memory_mark(profile, 'fetched')
+            summary['participants_total'] = len(participants)
+            if concurrent:
+                set_total(len(participants))
+            else:
+                _progress_set(progress, total=len(participants), processed=0)
+            for start in range(0, len(participants), STREAM_BATCH_SIZE):
+                consider(participants[start:start + STREAM_BATCH_SIZE])
+            _memory_mark(profile, 'filtered')
+            flush()
+            _memory_mark(profile, 'written')
+            return summary, matched_users
+
+        overall = {
+            'groups_processed': 0,
             'participants_total': 0,
             'matched': 0,
             'written_userids': 0,
             'written_usernames': 0,
-            'excluded_admins': 0,
-            'excluded_inactive': 0,
+            **dict.fromkeys(EXCLUDED_KEYS, 0),
             'errors': 0,
+            'flood_wait_seconds': 0.0,
         }
-        admin_ids: set[int] = set()
-        if exclude_admins:
-            try:
-                admins = client.get_participants(target_group, filter=ChannelParticipantsAdmins)
-                admin_ids = {u.id for u in admins}
-            except Exception:
-                pass
+        if not targets:
+            return {'error': 'invalid_index'}
+        if job is not None and job.overall:
+            overall.update(job.overall)
+        scheduler = get_scheduler().for_client(client)
+        waited_before = scheduler.waited_seconds
+        profile = _memory_profile()
+
+        async def commit(g, result: tuple[dict, list]) -> None:
+            s, matched_users = result
+            if matched_users:
+                written_ids, written_names = _write_users(matched_users, g, parse_user_id, parse_user_name)
+                s['written_userids'] += written_ids
+                s['written_usernames'] += written_names
+            overall['groups_processed'] += 1
+            for k in s:
+                overall[k] += s[k]
+            if job is not None:
+                job.finish_group(_peer_channel_id(g), overall)
+
+        pending = [g for g in targets if job is None or not job.is_done(_peer_channel_id(g))]
         try:
-            participants = client.get_participants(target_group)
-        except Exception:
-            participants = []
-        summary['participants_total'] = len(participants)
-        to_write_ids: list[str] = []
-        to_write_names: list[str] = []
-        _progress_set(progress, total=len(participants), processed=0)
-        for user in participants:
+            await _run_groups(pending, collect_for_group, commit, concurrency)
+        finally:
+            memory = profile.stop() if profile is not None else None
+        if job is not None:
+            job.complete()
+        overall['flood_wait_seconds'] = round(overall['flood_wait_seconds'] + scheduler.waited_seconds - waited_before, 1)
+        if memory is not None:
+            overall['memory'] = memory
+        return overall
+
+
+def parse_session_group_filtered(session_file: str, api_id: int, api_hash: str, group_index: int | None,
+                                 parse_user_id: bool, parse_user_name: bool,
+                                 exclude_admins: bool = False,
+                                 last_seen_days: int | None = None,
+                                 include_recently: bool = True,
+                                 progress: dict | None = None,
+                                 group_id: int | None = None,
+                                 stream: bool = False,
+                                 resume: bool = True,
+                                 concurrency: int | None = None,
+                                 filters: FilterSpec | None = None) -> dict:
+    return _run_sync(parse_session_group_filtered_async(session_file, api_id, api_hash, group_index,
+                                                        parse_user_id, parse_user_name, exclude_admins,
+                                                        last_seen_days, include_recently, progress, group_id,
+                                                        stream, resume, concurrency, filters))
+
+
+def _peer_channel_id(target_group) -> int | None:
+    """Channel id of a Channel or InputPeerChannel target."""
+    return getattr(target_group, 'id', None) or getattr(target_group, 'channel_id', None)
+
+
+def _write_users(users: list[tuple[int, str | None]], target_group,
+                 parse_user_id: bool, parse_user_name: bool) -> tuple[int, int]:
+    """Record ``(user_id, username)`` pairs in the user store and append only new values to the txt exports.
+
+    Returns how many user-ids and usernames were newly written.
+    """
+    if not users:
+        return 0, 0
+    with stage('write'):
+        new_ids, new_names = get_store().add_users(users, _peer_channel_id(target_group), parse_user_id, parse_user_name)
+        record(bytes_written=append_lines('userids.txt', new_ids) + append_lines('usernames.txt', new_names))
+    USERS_WRITTEN.inc(len(new_ids), field='userid')
+    USERS_WRITTEN.inc(len(new_names), field='username')
+    return len(new_ids), len(new_names)
+
+
+def clear_collected_users() -> None:
+    """Empty usernames.txt / userids.txt and the user store behind them."""
+    open('usernames.txt', 'w').close()
+    open('userids.txt', 'w').close()
+    get_store().clear()
+
+
+GET_USERS_BATCH = 100
+
+
+async def _resolve_senders(client, target_group, pending: list[tuple[int, int]]) -> dict:
+    """Look up senders missing from history batches.
+
+    The on-disk entity cache answers first; only misses and expired entries go
+    to Telegram, one users.GetUsers call per GET_USERS_BATCH.
+    """
+    with stage('resolve'):
+        cache = get_entity_cache()
+        resolved: dict = cache.get_many(uid for uid, _ in pending)
+        missing = [(uid, msg_id) for uid, msg_id in pending if uid not in resolved]
+        if not missing:
+            return resolved
+        chat_peer = await client.get_input_entity(target_group)
+        fetched = []
+        for start in range(0, len(missing), GET_USERS_BATCH):
+            chunk = missing[start:start + GET_USERS_BATCH]
+            input_users = [InputUserFromMessage(peer=chat_peer, msg_id=msg_id, user_id=uid) for uid, msg_id in chunk]
             try:
-                if exclude_admins and user.id in admin_ids:
-                    summary['excluded_admins'] += 1
-                    _progress_inc(progress, 'processed')
-                    continue
-                if not _user_passes_last_seen(user, last_seen_days, include_recently):
-                    summary['excluded_inactive'] += 1
-                    _progress_inc(progress, 'processed')
-                    continue
-                summary['matched'] += 1
-                if parse_user_id:
-                    to_write_ids.append(str(user.id))
-                if parse_user_name and getattr(user, 'username', None):
-                    uname = user.username
-                    if ('Bot' not in uname) and ('bot' not in uname):
-                        to_write_names.append('@' + uname)
+                fetched.extend(await _rpc(client, lambda: client(GetUsersRequest(input_users))))
             except Exception:
-                summary['errors'] += 1
-            finally:
-                _progress_inc(progress, 'processed')
-        if parse_user_id:
-            before = 0
-            _append_unique('userids.txt', to_write_ids)
-            summary['written_userids'] = len(to_write_ids)
-        if parse_user_name:
-            _append_unique('usernames.txt', to_write_names)
-            summary['written_usernames'] = len(to_write_names)
-        return summary
+                pass
+        cache.put_many(fetched)
+        for user in fetched:
+            resolved[user.id] = user
+        return resolved
 
-    overall = {
-        'groups_processed': 0,
-        'participants_total': 0,
-        'matched': 0,
-        'written_userids': 0,
-        'written_usernames': 0,
-        'excluded_admins': 0,
-        'excluded_inactive': 0,
-        'errors': 0,
-    }
-    targets = groups if group_index is None else [groups[group_index]] if 0 <= group_index < len(groups) else []
-    if not targets:
-        return {'error': 'invalid_index'}
-    for g in targets:
-        s = collect_for_group(g)
-        overall['groups_processed'] += 1
-        for k in s:
-            overall[k] += s[k]
-    return overall
 
+async def _iter_unique_senders(client, target_group, message_limit: int | None, on_message=None, min_id: int = 0,
+                               offset_id: int = 0, position: dict | None = None):
+    """Yield (sender_id, sender entity or None) once per distinct author of the scanned messages.
 
-def _append_unique(filepath: str, values: list[str]) -> None:
-    """Append unique values to a file, one per line, preserving existing entries."""
-    if not values:
-        return
-    existing: set[str] = set()
-    if os.path.exists(filepath):
-        with open(filepath, 'r') as f:
-            existing = {line.strip() for line in f if line.strip()}
-    new_values = [v for v in values if v and v not in existing]
-    if not new_values:
-        return
-    with open(filepath, 'a') as f:
-        for v in new_values:
-            f.write(f"{v}\n")
+    Only messages newer than ``min_id`` (and older than ``offset_id``, if set)
+    are fetched; ``on_message`` is called with each one. ``position['offset_id']``
+    is kept at a message id such that every sender of a message at or above it
+    has already been yielded, i.e. the offset_id to resume a scan from.
 
+    Senders are taken from the users/chats bundled with each history batch
+    (message.sender), so no per-user get_entity round trip is made. Authors
+    missing from the batch are resolved in bulk via users.GetUsers.
 
-def parse_session_group_active(session_file: str, api_id: int, api_hash: str, group_index: int | None,
-                               parse_user_id: bool, parse_user_name: bool, message_limit: int | None = 10000) -> str:
+    History pages go through the session's request scheduler; a page that
+    fails with FloodWaitError is requested again once the wait is over.
+    """
+    seen: set[int] = set()
+    pending: list[tuple[int, int]] = []
+    batch_senders: list = []
+    if position is None:
+        position = {}
+    position.setdefault('offset_id', offset_id)
+    messages = client.iter_messages(target_group, limit=message_limit, min_id=min_id, offset_id=offset_id)
+    while True:
+        # Telethon's RequestIter re-sends the same page request when __anext__ is retried
+        # and swaps in a new buffer for every page, which is what counts as an RPC here
+        buffer = getattr(messages, 'buffer', None)
+        with stage('fetch'):
+            try:
+                message = await _rpc(client, messages.__anext__,
+                                     requests=lambda: int(getattr(messages, 'buffer', None) is not buffer))
+            except StopAsyncIteration:
+                break
+        if on_message is not None:
+            on_message(message)
+        uid = getattr(message, 'sender_id', None)
+        if uid is not None and uid not in seen:
+            seen.add(uid)
+            sender = getattr(message, 'sender', None)
+            if sender is not None or uid < 0:
+                if sender is not None:
+                    batch_senders.append(sender)
+                position['offset_id'] = pending[0][1] + 1 if pending else message.id
+                yield uid, sender
+                continue
+            pending.append((uid, message.id))
+            if len(pending) >= GET_USERS_BATCH:
+                with stage('resolve'):
+                    get_entity_cache().put_many(batch_senders)
+                batch_senders = []
+                resolved = await _resolve_senders(client, target_group, pending)
+                position['offset_id'] = pending[0][1] + 1
+                for pending_uid, _ in pending:
+                    yield pending_uid, resolved.get(pending_uid)
+                pending = []
+        if not pending:
+            position['offset_id'] = message.id
+    with stage('resolve'):
+        get_entity_cache().put_many(batch_senders)
+    if pending:
+        resolved = await _resolve_senders(client, target_group, pending)
+        position['offset_id'] = pending[0][1] + 1
+        for pending_uid, _ in pending:
+            yield pending_uid, resolved.get(pending_uid)
+
+
+async def parse_session_group_active_async(session_file: str, api_id: int, api_hash: str, group_index: int | None,
+                                           parse_user_id: bool, parse_user_name: bool,
+                                           message_limit: int | None = 10000,
+                                           group_id: int | None = None,
+                                           full_rescan: bool = False,
+                                           concurrency: int | None = None,
+                                           progress: dict | None = None) -> str:
     """Collect users who sent at least one message in the group by scanning messages.
 
     message_limit: limit number of recent messages to scan per group (None = no limit; use carefully).
+    Only messages newer than the group's checkpoint in the user store are scanned
+    unless full_rescan is set; checkpoints are kept per parse_user_id / parse_user_name.
+    concurrency: groups scanned at once when parsing all of them (default PARSE_GROUP_CONCURRENCY).
+    ``progress`` counts scanned messages against message_limit per group.
     """
-    client = TelegramClient(session_file.replace('\n', ''), api_id, api_hash).start()
-    chats = []
-    groups = []
-    result = client(GetDialogsRequest(
-        offset_date=None,
-        offset_id=0,
-        offset_peer=InputPeerEmpty(),
-        limit=200,
-        hash=0
-    ))
-    chats.extend(result.chats)
-    for chat in chats:
-        try:
-            if chat.megagroup is True:
-                groups.append(chat)
-        except:
-            continue
+    async with get_pool().client(session_file, api_id, api_hash) as client:
+        targets = await _resolve_targets(client, session_file, group_index, group_id)
+        concurrency = concurrency or GROUP_CONCURRENCY
+        scope = scan_scope('active', parse_user_id, parse_user_name)
+
+        async def collect_for_group(target_group) -> tuple[list, int]:
+            store = get_store()
+            channel_id = _peer_channel_id(target_group)
+            min_id = 0 if full_rescan else store.get_checkpoint(channel_id, scope)
+            newest = [0]
+            _progress_inc(progress, 'total', message_limit or 0)
+
+            def track(message) -> None:
+                newest[0] = max(newest[0], message.id)
+                _progress_inc(progress, 'processed')
 
-    def collect_for_group(target_group) -> None:
-        seen_user_ids: set[int] = set()
-        collected_user_ids: list[str] = []
-        collected_usernames: list[str] = []
-        for message in client.iter_messages(target_group, limit=message_limit):
-            uid = getattr(message, 'sender_id', None)
-            if uid is None or uid in seen_user_ids:
-                continue
-            seen_user_ids.add(uid)
-            if parse_user_id:
-                collected_user_ids.append(str(uid))
-            if parse_user_name:
-                try:
-                    entity = client.get_entity(uid)
-                    username = getattr(entity, 'username', None)
-                    if username and ('Bot' not in username) and ('bot' not in username):
-                        collected_usernames.append('@' + username)
-                except Exception:
-                    pass
-        if parse_user_id:
-            _append_unique('userids.txt', collected_user_ids)
-        if parse_user_name:
-            _append_unique('usernames.txt', collected_usernames)
+            collected_users: list[tuple[int, str | None]] = []
+            async for uid, entity in _iter_unique_senders(client, target_group, message_limit, track, min_id):
+                collected_users.append((uid, getattr(entity, 'username', None)))
+            return collected_users, newest[0]
 
-    if group_index is None:
-        for g in groups:
-            collect_for_group(g)
-        return 'parsed_active_all'
-    else:
-        if 0 <= group_index < len(groups):
-            target_group = groups[group_index]
-            collect_for_group(target_group)
-            return f'parsed_active_{group_index}'
+        async def commit(target_group, result: tuple[list, int]) -> None:
+            collected_users, newest = result
+            _write_users(collected_users, target_group, parse_user_id, parse_user_name)
+            get_store().set_checkpoint(_peer_channel_id(target_group), newest, scope)
+
+        if group_index is None and group_id is None:
+            await _run_groups(targets, collect_for_group, commit, concurrency)
+            return 'parsed_active_all'
         else:
-            return 'invalid_index'
+            if targets:
+                await commit(targets[0], await collect_for_group(targets[0]))
+                return f'parsed_active_{group_id if group_id is not None else group_index}'
+            else:
+                return 'invalid_index'
 
 
-def parse_session_group_active_filtered(session_file: str, api_id: int, api_hash: str, group_index: int | None,
-                                        parse_user_id: bool, parse_user_name: bool,
-                                        exclude_admins: bool = False,
-                                        last_seen_days: int | None = None,
-                                        include_recently: bool = True,
-                                        message_limit: int | None = 10000,
-                                        progress: dict | None = None) -> dict:
-    client = TelegramClient(session_file.replace('\n', ''), api_id, api_hash).start()
-    chats = []
-    groups = []
-    result = client(GetDialogsRequest(
-        offset_date=None,
-        offset_id=0,
-        offset_peer=InputPeerEmpty(),
-        limit=200,
-        hash=0
-    ))
-    chats.extend(result.chats)
-    for chat in chats:
-        try:
-            if chat.megagroup is True:
-                groups.append(chat)
-        except:
-            continue
+def parse_session_group_active(session_file: str, api_id: int, api_hash: str, group_index: int | None,
+                               parse_user_id: bool, parse_user_name: bool, message_limit: int | None = 10000,
+                               group_id: int | None = None, full_rescan: bool = False,
+                               concurrency: int | None = None) -> str:
+    return _run_sync(parse_session_group_active_async(session_file, api_id, api_hash, group_index,
+                                                      parse_user_id, parse_user_name, message_limit, group_id,
+                                                      full_rescan, concurrency))
+
+
+@instrumented
+async def parse_session_group_active_filtered_async(session_file: str, api_id: int, api_hash: str,
+                                                    group_index: int | None,
+                                                    parse_user_id: bool, parse_user_name: bool,
+                                                    exclude_admins: bool = False,
+                                                    last_seen_days: int | None = None,
+                                                    include_recently: bool = True,
+                                                    message_limit: int | None = 10000,
+                                                    progress: dict | None = None,
+                                                    group_id: int | None = None,
+                                                    full_rescan: bool = False,
+                                                    resume: bool = True,
+                                                    concurrency: int | None = None,
+                                                    filters: FilterSpec | None = None) -> dict:
+    """Collect message senders that pass the filters (``filters`` as in parse_session_group_filtered_async).
+
+    Scanning resumes after the group's message checkpoint, so routine re-parses
+    only read new traffic; full_rescan ignores the checkpoint. Each filter spec
+    has its own checkpoints, since senders it rejected are still new to others.
+    resume: keep a ParseJob for the run. Matches are flushed every
+    STREAM_BATCH_SIZE senders together with the message id reached; after a
+    FloodWait too long to sleep out the same call continues from there and
+    skips finished groups.
+    concurrency: groups scanned at once (default PARSE_GROUP_CONCURRENCY), with
+    in-order writes as in parse_session_group_filtered_async.
+    ``stages`` and ``memory`` in the summary as there, with ``resolve`` for
+    senders looked up through the entity cache and users.GetUsers.
+    """
+    async with get_pool().client(session_file, api_id, api_hash) as client:
+        targets = await _resolve_targets(client, session_file, group_index, group_id)
+        spec = _filter_spec(filters, exclude_admins, last_seen_days, include_recently)
+        job = ParseJob(job_key('active', session_file, group_index, group_id, parse_user_id, parse_user_name,
+                               spec.as_dict(), message_limit, full_rescan)) if resume else None
+        scope = scan_scope('active', parse_user_id, parse_user_name, spec.as_dict())
+        concurrency = concurrency or GROUP_CONCURRENCY
+        concurrent = concurrency > 1 and len(targets) > 1
+
+        async def collect_for_group(target_group) -> tuple[dict, list, int]:
+            summary = {
+                'messages_scanned': 0,
+                'unique_senders': 0,
+                'matched': 0,
+                'written_userids': 0,
+                'written_usernames': 0,
+                **dict.fromkeys(EXCLUDED_KEYS, 0),
+                'errors': 0,
+            }
+            store = get_store()
+            channel_id = _peer_channel_id(target_group)
+            cursor = job.cursor(channel_id) if job is not None else {}
+            summary.update(cursor.get('summary', {}))
+            admin_ids = await _fetch_admin_ids(client, session_file, target_group) if spec.exclude_admins else set()
+            user_filter = spec.compile(admin_ids)
+            _memory_mark(profile, 'admins')
+            min_id = 0 if full_rescan else store.get_checkpoint(channel_id, scope)
+            newest = [cursor.get('newest', 0)]
+            position = {'offset_id': cursor.get('offset_id', 0)}
+            limit = message_limit
+            if limit and cursor:
+                limit = max(0, limit - summary['messages_scanned'])
+            matched_users: list[tuple[int, str | None]] = []
+            if concurrent:
+                _progress_inc(progress, 'total', message_limit or 0)
+            else:
+                _progress_set(progress, total=message_limit if message_limit else 0,
+                              processed=summary['messages_scanned'])
 
-    def collect_for_group(target_group) -> dict:
-        summary = {
+            def count_message(message) -> None:
+                summary['messages_scanned'] += 1
+                newest[0] = max(newest[0], message.id)
+                _progress_inc(progress, 'processed')
+
+            def flush() -> None:
+                user_filter.take_rejected(summary)
+                # Concurrent groups keep their matches for the in-order commit
+                if concurrent:
+                    return
+                written_ids, written_names = _write_users(matched_users, target_group, parse_user_id, parse_user_name)
+                summary['written_userids'] += written_ids
+                summary['written_usernames'] += written_names
+                matched_users.clear()
+                if job is not None:
+                    job.save_cursor(channel_id, offset_id=position['offset_id'], newest=newest[0], summary=summary)
+
+            try:
+                if limit != 0:
+                    async for uid, entity in _iter_unique_senders(client, target_group, limit, count_message, min_id,
+                                                                  position['offset_id'], position):
+                        summary['unique_senders'] += 1
+                        if entity is None:
+                            summary['errors'] += 1
+                            continue
+                        try:
+                            with stage('filter'):
+                                passed = user_filter(entity)
+                            if not passed:
+                                continue
+                            summary['matched'] += 1
+                            matched_users.append((uid, getattr(entity, 'username', None)))
+                        except Exception:
+                            summary['errors'] += 1
+                        if job is not None and not concurrent and len(matched_users) >= STREAM_BATCH_SIZE:
+                            flush()
+            except FloodWaitError:
+                flush()
+                raise
+            _memory_mark(profile, 'scanned')
+            flush()
+            _memory_mark(profile, 'written')
+            return summary, matched_users, newest[0]
+
+        overall = {
+            'groups_processed': 0,
             'messages_scanned': 0,
             'unique_senders': 0,
             'matched': 0,
             'written_userids': 0,
             'written_usernames': 0,
-            'excluded_admins': 0,
-            'excluded_inactive': 0,
+            **dict.fromkeys(EXCLUDED_KEYS, 0),
             'errors': 0,
+            'flood_wait_seconds': 0.0,
         }
-        admin_ids: set[int] = set()
-        if exclude_admins:
-            try:
-                admins = client.get_participants(target_group, filter=ChannelParticipantsAdmins)
-                admin_ids = {u.id for u in admins}
-            except Exception:
-                pass
-        seen_user_ids: set[int] = set()
-        collected_user_ids: list[str] = []
-        collected_usernames: list[str] = []
-        _progress_set(progress, total=message_limit if message_limit else 0, processed=0)
-        for message in client.iter_messages(target_group, limit=message_limit):
-            summary['messages_scanned'] += 1
-            _progress_inc(progress, 'processed')
-            uid = getattr(message, 'sender_id', None)
-            if uid is None or uid in seen_user_ids:
-                continue
-            seen_user_ids.add(uid)
-            summary['unique_senders'] += 1
-            try:
-                entity = client.get_entity(uid)
-                if exclude_admins and getattr(entity, 'id', None) in admin_ids:
-                    summary['excluded_admins'] += 1
-                    continue
-                if not _user_passes_last_seen(entity, last_seen_days, include_recently):
-                    summary['excluded_inactive'] += 1
-                    continue
-                summary['matched'] += 1
-                if parse_user_id:
-                    collected_user_ids.append(str(uid))
-                if parse_user_name:
-                    username = getattr(entity, 'username', None)
-                    if username and ('Bot' not in username) and ('bot' not in username):
-                        collected_usernames.append('@' + username)
-            except Exception:
-                summary['errors'] += 1
-        if parse_user_id:
-            _append_unique('userids.txt', collected_user_ids)
-            summary['written_userids'] = len(collected_user_ids)
-        if parse_user_name:
-            _append_unique('usernames.txt', collected_usernames)
-            summary['written_usernames'] = len(collected_usernames)
-        return summary
+        if not targets:
+            return {'error': 'invalid_index'}
+        if job is not None and job.overall:
+            overall.update(job.overall)
+        scheduler = get_scheduler().for_client(client)
+        waited_before = scheduler.waited_seconds
+        profile = _memory_profile()
+
+        async def commit(g, result: tuple[dict, list, int]) -> None:
+            s, matched_users, newest = result
+            if matched_users:
+                written_ids, written_names = _write_users(matched_users, g, parse_user_id, parse_user_name)
+                s['written_userids'] += written_ids
+                s['written_usernames'] += written_names
+            # The scan checkpoint only moves once the whole range below ``newest`` has been read
+            get_store().set_checkpoint(_peer_channel_id(g), newest, scope)
+            overall['groups_processed'] += 1
+            for k in s:
+                overall[k] += s[k]
+            if job is not None:
+                job.finish_group(_peer_channel_id(g), overall)
+
+        pending = [g for g in targets if job is None or not job.is_done(_peer_channel_id(g))]
+        try:
+            await _run_groups(pending, collect_for_group, commit, concurrency)
+        finally:
+            memory = profile.stop() if profile is not None else None
+        if job is not None:
+            job.complete()
+        overall['flood_wait_seconds'] = round(overall['flood_wait_seconds'] + scheduler.waited_seconds - waited_before, 1)
+        if memory is not None:
+            overall['memory'] = memory
+        return overall
 
+
+def parse_session_group_active_filtered(session_file: str, api_id: int, api_hash: str, group_index: int | None,
+                                        parse_user_id: bool, parse_user_name: bool,
+                                        exclude_admins: bool = False,
+                                        last_seen_days: int | None = None,
+                                        include_recently: bool = True,
+                                        message_limit: int | None = 10000,
+                                        progress: dict | None = None,
+                                        group_id: int | None = None,
+                                        full_rescan: bool = False,
+                                        resume: bool = True,
+                                        concurrency: int | None = None,
+                                        filters: FilterSpec | None = None) -> dict:
+    return _run_sync(parse_session_group_active_filtered_async(session_file, api_id, api_hash, group_index,
+                                                               parse_user_id, parse_user_name, exclude_admins,
+                                                               last_seen_days, include_recently, message_limit,
+                                                               progress, group_id, full_rescan, resume,
+                                                               concurrency, filters))
+
+
+def _assign_groups(session_groups: dict[str, list[int]]) -> dict[str, list[int]]:
+    """Give every group to exactly one of the sessions that are in it.
+
+    Groups with fewer candidate sessions are placed first, each on the
+    candidate with the fewest groups so far, which keeps the busiest account
+    (and so the whole run) as short as possible.
+    """
+    holders: dict[int, list[str]] = {}
+    for session_file, group_ids in session_groups.items():
+        for gid in group_ids:
+            holders.setdefault(gid, []).append(session_file)
+    assigned: dict[str, list[int]] = {session_file: [] for session_file in session_groups}
+    for gid in sorted(holders, key=lambda g: len(holders[g])):
+        owner = min(holders[gid], key=lambda session_file: len(assigned[session_file]))
+        assigned[owner].append(gid)
+    return assigned
+
+
+@instrumented
+async def parse_all_sessions_async(api_id: int, api_hash: str, parse_user_id: bool, parse_user_name: bool,
+                                   exclude_admins: bool = False,
+                                   last_seen_days: int | None = None,
+                                   include_recently: bool = True,
+                                   active: bool = False,
+                                   message_limit: int | None = 10000,
+                                   progress: dict | None = None,
+                                   sessions: list | None = None,
+                                   filters: FilterSpec | None = None) -> dict:
+    """Parse the groups of every session in parallel, one worker per session.
+
+    A group shared by several accounts is parsed once, by one of them (see
+    _assign_groups). All workers write into the same user store, so results
+    are deduplicated across accounts. Each account waits out its own FloodWaits
+    through the request scheduler; one whose wait exceeds FLOOD_WAIT_MAX_SECONDS
+    stops, leaving job checkpoints for the next run. ``progress`` counts groups.
+    Sessions are leased from the client pool, so at most
+    SESSION_POOL_MAX_CLIENTS of them run at the same time. ``stages`` adds up
+    those of every group parse and of the dialog listing.
+    """
+    sessions = list_sessions() if sessions is None else sessions
+    listed = await asyncio.gather(*(list_groups_for_session_async(s, api_id, api_hash) for s in sessions),
+                                  return_exceptions=True)
     overall = {
+        'sessions': 0,
         'groups_processed': 0,
-        'messages_scanned': 0,
-        'unique_senders': 0,
+        'groups_shared': 0,
+        **({'messages_scanned': 0, 'unique_senders': 0} if active else {'participants_total': 0}),
         'matched': 0,
         'written_userids': 0,
         'written_usernames': 0,
-        'excluded_admins': 0,
-        'excluded_inactive': 0,
+        **dict.fromkeys(EXCLUDED_KEYS, 0),
         'errors': 0,
+        'flood_wait_seconds': 0.0,
     }
-    targets = groups if group_index is None else [groups[group_index]] if 0 <= group_index < len(groups) else []
-    if not targets:
-        return {'error': 'invalid_index'}
-    for g in targets:
-        s = collect_for_group(g)
-        overall['groups_processed'] += 1
-        for k in s:
-            overall[k] += s[k]
+    session_groups: dict[str, list[int]] = {}
+    for session_file, groups in zip(sessions, listed):
+        if isinstance(groups, BaseException):
+            overall['errors'] += 1
+            continue
+        session_groups[session_file] = [channel_id for _, _, _, channel_id in groups]
+    assigned = _assign_groups(session_groups)
+    total_listed = sum(len(group_ids) for group_ids in session_groups.values())
+    total_assigned = sum(len(group_ids) for group_ids in assigned.values())
+    overall['groups_shared'] = total_listed - total_assigned
+    _progress_set(progress, total=total_assigned, processed=0)
+
+    async def parse_group(session_file: str, gid: int) -> bool:
+        """Parse one group into ``overall``; False once the session has to stop."""
+        try:
+            if active:
+                s = await parse_session_group_active_filtered_async(
+                    session_file, api_id, api_hash, None, parse_user_id, parse_user_name, exclude_admins,
+                    last_seen_days, include_recently, message_limit, group_id=gid, filters=filters)
+            else:
+                s = await parse_session_group_filtered_async(
+                    session_file, api_id, api_hash, None, parse_user_id, parse_user_name, exclude_admins,
+                    last_seen_days, include_recently, group_id=gid, stream=True, filters=filters)
+        except FloodWaitError:
+            # Too long to wait out; the group's job checkpoint is kept for the next run
+            overall['errors'] += 1
+            return False
+        except Exception:
+            s = {'errors': 1}
+        if 'error' in s:
+            s = {'errors': 1}
+        merge_stages(s.get('stages'))
+        for k in overall:
+            if k not in ('sessions', 'groups_shared', 'memory'):
+                overall[k] += s.get(k, 0)
+        # Keep the memory report of the most memory-hungry group
+        if s.get('memory', {}).get('peak_rss_mb', 0) > overall.get('memory', {}).get('peak_rss_mb', 0):
+            overall['memory'] = s['memory']
+        _progress_inc(progress, 'processed')
+        return True
+
+    async def worker(session_file: str, group_ids: list[int]) -> None:
+        # One lease for the whole group list: the group parses re-lease the same client, so a
+        # session is not evicted and reconnected between its groups when sessions outnumber the pool
+        try:
+            async with get_pool().client(session_file, api_id, api_hash):
+                for gid in group_ids:
+                    if not await parse_group(session_file, gid):
+                        return
+        except Exception:
+            # The session could not be started
+            overall['errors'] += 1
+
+    workers = [worker(session_file, group_ids) for session_file, group_ids in assigned.items() if group_ids]
+    overall['sessions'] = len(workers)
+    await asyncio.gather(*workers)
+    overall['flood_wait_seconds'] = round(overall['flood_wait_seconds'], 1)
     return overall
 
 
-def invite_from_usernames(session_file: str, api_id: int, api_hash: str, channel_username: str,
-                          max_invites: int = 20) -> int:
+def parse_all_sessions(api_id: int, api_hash: str, parse_user_id: bool, parse_user_name: bool,
+                       exclude_admins: bool = False,
+                       last_seen_days: int | None = None,
+                       include_recently: bool = True,
+                       active: bool = False,
+                       message_limit: int | None = 10000,
+                       progress: dict | None = None,
+                       sessions: list | None = None,
+                       filters: FilterSpec | None = None) -> dict:
+    return _run_sync(parse_all_sessions_async(api_id, api_hash, parse_user_id, parse_user_name, exclude_admins,
+                                              last_seen_days, include_recently, active, message_limit, progress,
+                                              sessions, filters))
+
+
+async def invite_from_usernames_async(session_file: str, api_id: int, api_hash: str, channel_username: str,
+                                      max_invites: int = 20) -> int:
     # Backward-compatible wrapper
-    summary = invite_from_usernames_with_summary(session_file, api_id, api_hash, channel_username, max_invites)
+    summary = await invite_from_usernames_with_summary_async(session_file, api_id, api_hash, channel_username,
+                                                             max_invites)
     return summary.get('invited', 0)
 
 
+def invite_from_usernames(session_file: str, api_id: int, api_hash: str, channel_username: str,
+                          max_invites: int = 20) -> int:
+    return _run_sync(invite_from_usernames_async(session_file, api_id, api_hash, channel_username, max_invites))
+
+
+async def invite_from_usernames_with_summary_async(session_file: str, api_id: int, api_hash: str,
+                                                   channel_username: str,
+                                                   max_invites: int = 20,
+                                                   progress: dict | None = None) -> dict:
+    async with get_pool().client(session_file, api_id, api_hash) as client:
+        with open('usernames.txt', 'r') as f:
+            users = [line.strip() for line in f if line.strip()]
+        users = users[:max_invites]
+        summary = {
+            'channel': channel_username,
+            'attempted': len(users),
+            'invited': 0,
+            'skipped_privacy': 0,
+            'already_member': 0,
+            'admin_required': 0,
+            'flood_wait': 0,
+            'errors': 0,
+            'last_error': '',
+        }
+        _progress_set(progress, total=len(users), processed=0)
+        for user in users:
+            try:
+                await _rpc(client, lambda: inviting_async(client, channel_username, user))
+                summary['invited'] += 1
+                await asyncio.sleep(random.randrange(15, 40))
+            except UserPrivacyRestrictedError:
+                summary['skipped_privacy'] += 1
+                continue
+            except UserAlreadyParticipantError:
+                summary['already_member'] += 1
+                continue
+            except ChatAdminRequiredError:
+                summary['admin_required'] += 1
+                break
+            except PeerFloodError:
+                summary['flood_wait'] += 1
+                break
+            except Exception as exc:
+                summary['errors'] += 1
+                summary['last_error'] = str(exc)
+                break
+            finally:
+                _progress_inc(progress, 'processed')
+        return summary
+
+
 def invite_from_usernames_with_summary(session_file: str, api_id: int, api_hash: str, channel_username: str,
                                        max_invites: int = 20,
                                        progress: dict | None = None) -> dict:
-    client = TelegramClient(session_file.replace('\n', ''), api_id, api_hash).start()
-    with open('usernames.txt', 'r') as f:
-        users = [line.strip() for line in f if line.strip()]
-    users = users[:max_invites]
-    summary = {
-        'channel': channel_username,
-        'attempted': len(users),
-        'invited': 0,
-        'skipped_privacy': 0,
-        'already_member': 0,
-        'admin_required': 0,
-        'flood_wait': 0,
-        'errors': 0,
-        'last_error': '',
-    }
-    _progress_set(progress, total=len(users), processed=0)
-    for user in users:
-        try:
-            inviting(client, channel_username, user)
-            summary['invited'] += 1
-            time.sleep(random.randrange(15, 40))
-        except UserPrivacyRestrictedError:
-            summary['skipped_privacy'] += 1
-            continue
-        except UserAlreadyParticipantError:
-            summary['already_member'] += 1
-            continue
-        except ChatAdminRequiredError:
-            summary['admin_required'] += 1
-            break
-        except PeerFloodError:
-            summary['flood_wait'] += 1
-            break
-        except Exception as exc:
-            summary['errors'] += 1
-            summary['last_error'] = str(exc)
-            break
-        finally:
-            _progress_inc(progress, 'processed')
-    return summary
+    return _run_sync(invite_from_usernames_with_summary_async(session_file, api_id, api_hash, channel_username,
+                                                              max_invites, progress))
 
 
 def toggle_option(index: int) -> tuple[bool, list]:
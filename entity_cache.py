@@ -0,0 +1,188 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import time
+import sqlite3
+from datetime import datetime, timezone
+from telethon.tl.types import (
+    User, UserStatusOnline, UserStatusOffline, UserStatusRecently, UserStatusLastWeek, UserStatusLastMonth,
+)
+
+
+DEFAULT_DB_PATH = 'entities.db'
+DEFAULT_MAX_ENTRIES = 200_000
+DEFAULT_TTL_SECONDS = 86400.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    status_kind TEXT,
+    status_time REAL,
+    bot INTEGER NOT NULL DEFAULT 0,
+    premium INTEGER NOT NULL DEFAULT 0,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    cached_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entities_last_used ON entities(last_used);
+"""
+
+_STATUS_KINDS = {
+    UserStatusOnline: 'online',
+    UserStatusOffline: 'offline',
+    UserStatusRecently: 'recently',
+    UserStatusLastWeek: 'last_week',
+    UserStatusLastMonth: 'last_month',
+}
+
+
+def _status_to_row(status) -> tuple[str | None, float | None]:
+    kind = _STATUS_KINDS.get(type(status))
+    if kind == 'online':
+        return kind, status.expires.timestamp() if status.expires else None
+    if kind == 'offline':
+        return kind, status.was_online.timestamp() if status.was_online else None
+    return kind, None
+
+
+def _status_from_row(kind: str | None, when: float | None):
+    stamp = datetime.fromtimestamp(when, timezone.utc) if when is not None else None
+    if kind == 'online':
+        # An expired "online" is what the user looked like at that moment: last seen then
+        if stamp is not None and stamp < datetime.now(timezone.utc):
+            return UserStatusOffline(was_online=stamp)
+        return UserStatusOnline(expires=stamp)
+    if kind == 'offline':
+        return UserStatusOffline(was_online=stamp)
+    if kind == 'recently':
+        return UserStatusRecently()
+    if kind == 'last_week':
+        return UserStatusLastWeek()
+    if kind == 'last_month':
+        return UserStatusLastMonth()
+    return None
+
+
+class CachedUser:
+    """Cached subset of a Telethon User; duck-types the attributes the parse filters read."""
+
+    __slots__ = ('id', 'username', 'status', 'bot', 'premium', 'deleted')
+
+    def __init__(self, id: int, username: str | None, status, bot: bool, premium: bool = False,
+                 deleted: bool = False):
+        self.id = id
+        self.username = username
+        self.status = status
+        self.bot = bot
+        self.premium = premium
+        self.deleted = deleted
+
+
+class EntityCache:
+    """On-disk user-id -> (username, status, bot, premium, deleted) cache shared across runs.
+
+    Entries older than ``ttl_seconds`` count as misses. When the table grows
+    past ``max_entries`` the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._drop_outdated_table()
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _drop_outdated_table(self) -> None:
+        """Rows from before premium / deleted were cached would pass as neither: start the cache over."""
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(entities)')]
+        if columns and 'deleted' not in columns:
+            with self._conn:
+                self._conn.execute('DROP TABLE entities')
+
+    def get_many(self, user_ids) -> dict[int, CachedUser]:
+        """Fresh entries for ``user_ids``; touches their LRU timestamp."""
+        ids = list(user_ids)
+        if not ids:
+            return {}
+        now = time.time()
+        found: dict[int, CachedUser] = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            rows = self._conn.execute(
+                f'SELECT user_id, username, status_kind, status_time, bot, premium, deleted FROM entities '
+                f'WHERE user_id IN ({marks}) AND cached_at >= ?', (*chunk, now - self.ttl_seconds))
+            for user_id, username, kind, when, bot, premium, deleted in rows:
+                found[user_id] = CachedUser(user_id, username, _status_from_row(kind, when), bool(bot),
+                                            bool(premium), bool(deleted))
+        if found:
+            with self._conn:
+                self._conn.executemany('UPDATE entities SET last_used = ? WHERE user_id = ?',
+                                       [(now, uid) for uid in found])
+        self.hits += len(found)
+        self.misses += len(ids) - len(found)
+        return found
+
+    def get(self, user_id: int) -> CachedUser | None:
+        return self.get_many([user_id]).get(user_id)
+
+    def put_many(self, users) -> None:
+        """Store Telethon User objects (other entity types are ignored) and evict past the size cap."""
+        now = time.time()
+        rows = []
+        for user in users:
+            if not isinstance(user, (User, CachedUser)):
+                continue
+            kind, when = _status_to_row(getattr(user, 'status', None))
+            rows.append((user.id, getattr(user, 'username', None), kind, when,
+                         int(bool(getattr(user, 'bot', False))), int(bool(getattr(user, 'premium', False))),
+                         int(bool(getattr(user, 'deleted', False))), now, now))
+        if not rows:
+            return
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO entities(user_id, username, status_kind, status_time, bot, premium, '
+                'deleted, cached_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._evict()
+
+    def _evict(self) -> None:
+        excess = self.count() - self.max_entries
+        if excess > 0:
+            self._conn.execute('DELETE FROM entities WHERE user_id IN '
+                               '(SELECT user_id FROM entities ORDER BY last_used LIMIT ?)', (excess,))
+
+    def count(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+
+
+_default_cache: EntityCache | None = None
+
+
+def get_entity_cache() -> EntityCache:
+    """Process-wide cache from ENTITY_CACHE_PATH / ENTITY_CACHE_MAX_ENTRIES / ENTITY_CACHE_TTL_SECONDS."""
+    global _default_cache
+    if _default_cache is None:
+        try:
+            max_entries = int(os.getenv('ENTITY_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+        except ValueError:
+            max_entries = DEFAULT_MAX_ENTRIES
+        try:
+            ttl = float(os.getenv('ENTITY_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+        except ValueError:
+            ttl = DEFAULT_TTL_SECONDS
+        _default_cache = EntityCache(os.getenv('ENTITY_CACHE_PATH', DEFAULT_DB_PATH), max_entries, ttl)
+    return _default_cache
@@ -0,0 +1,191 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import json
+import time
+from telethon.tl.types import InputPeerChannel, Channel, ChatPhotoEmpty
+
+
+DEFAULT_TTL_SECONDS = 600.0
+DEFAULT_ADMIN_TTL_SECONDS = 86400.0
+
+
+class GroupCatalogCache:
+    """Per-session list of megagroups with a time-to-live.
+
+    Lets the bot page through a session's groups without fetching the dialog
+    list again on every page click.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[str, tuple[float, list]] = {}
+
+    @staticmethod
+    def _key(session_file: str) -> str:
+        return session_file.replace('\n', '')
+
+    def get(self, session_file: str) -> list | None:
+        entry = self._entries.get(self._key(session_file))
+        if entry is None:
+            return None
+        stored_at, groups = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            return None
+        return groups
+
+    def put(self, session_file: str, groups: list) -> None:
+        self._entries[self._key(session_file)] = (time.monotonic(), groups)
+
+    def age(self, session_file: str) -> float | None:
+        entry = self._entries.get(self._key(session_file))
+        if entry is None:
+            return None
+        return time.monotonic() - entry[0]
+
+    def invalidate(self, session_file: str | None = None) -> None:
+        if session_file is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(self._key(session_file), None)
+
+
+_default_cache: GroupCatalogCache | None = None
+
+
+def get_catalog_cache() -> GroupCatalogCache:
+    """Process-wide cache configured from GROUP_CATALOG_TTL_SECONDS."""
+    global _default_cache
+    if _default_cache is None:
+        try:
+            ttl = float(os.getenv('GROUP_CATALOG_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+        except ValueError:
+            ttl = DEFAULT_TTL_SECONDS
+        _default_cache = GroupCatalogCache(ttl)
+    return _default_cache
+
+
+# ===== Persistent peer catalog =====
+#
+# Megagroups of each session are stored on disk keyed by channel id together
+# with their access_hash, so a group can be targeted directly as an
+# InputPeerChannel without fetching the dialog list to resolve an index.
+
+def catalog_path(session_file: str) -> str:
+    name = session_file.replace('\n', '')
+    if name.endswith('.session'):
+        name = name[:-len('.session')]
+    return f"{name}.catalog.json"
+
+
+def load_catalog(session_file: str) -> dict:
+    """Return {'updated_at': ts, 'groups': {channel_id: {...}}} or an empty catalog."""
+    path = catalog_path(session_file)
+    if not os.path.exists(path):
+        return {'updated_at': 0, 'groups': {}}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {'updated_at': 0, 'groups': {}}
+    data['groups'] = {int(k): v for k, v in data.get('groups', {}).items()}
+    return data
+
+
+def save_catalog(session_file: str, catalog: dict) -> None:
+    path = catalog_path(session_file)
+    data = dict(catalog)
+    data['groups'] = {str(k): v for k, v in catalog.get('groups', {}).items()}
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def update_catalog_groups(session_file: str, chats: list, dialog_pages: list | None = None) -> dict:
+    """Replace the stored megagroup set with ``chats`` (Telethon Channel objects), keeping dialog order.
+
+    ``dialog_pages`` are the GetDialogs pages the chats came from (offset,
+    hash, megagroup ids, next offset); the next listing sends each page's hash
+    so unchanged pages are answered with messages.DialogsNotModified.
+    """
+    catalog = load_catalog(session_file)
+    groups: dict[int, dict] = {}
+    for position, chat in enumerate(chats):
+        previous = catalog['groups'].get(chat.id, {})
+        groups[chat.id] = {
+            'access_hash': getattr(chat, 'access_hash', None),
+            'title': getattr(chat, 'title', ''),
+            'username': getattr(chat, 'username', None),
+            'position': position,
+        }
+        # A refreshed dialog list says nothing about admins: keep the cached set
+        if 'admin_ids' in previous:
+            groups[chat.id]['admin_ids'] = previous['admin_ids']
+            groups[chat.id]['admins_at'] = previous.get('admins_at', 0)
+    catalog['groups'] = groups
+    catalog['dialog_pages'] = dialog_pages
+    # Written by older versions: the hash of the first page only
+    catalog.pop('dialogs_hash', None)
+    catalog.pop('dialogs_complete', None)
+    catalog['updated_at'] = time.time()
+    save_catalog(session_file, catalog)
+    return catalog
+
+
+def catalog_group(session_file: str, channel_id: int) -> dict | None:
+    return load_catalog(session_file)['groups'].get(int(channel_id))
+
+
+def catalog_peer(channel_id: int, entry: dict) -> InputPeerChannel | None:
+    if entry.get('access_hash') is None:
+        return None
+    return InputPeerChannel(channel_id=int(channel_id), access_hash=int(entry['access_hash']))
+
+
+def catalog_channels(session_file: str) -> list:
+    """Stored megagroups rebuilt as Channel objects, in dialog order (the snapshot behind dialog_pages)."""
+    groups = load_catalog(session_file)['groups']
+    ordered = sorted(groups.items(), key=lambda item: item[1].get('position', 0))
+    return [
+        Channel(id=channel_id, title=entry.get('title', ''), photo=ChatPhotoEmpty(), date=None,
+                megagroup=True, access_hash=entry.get('access_hash'), username=entry.get('username'))
+        for channel_id, entry in ordered
+    ]
+
+
+# ===== Admin sets =====
+#
+# Admin ids of a group are kept in its catalog entry, so filtered parses that
+# exclude admins do not request the admin list of every group on every run.
+
+def _admin_ttl() -> float:
+    try:
+        return float(os.getenv('ADMIN_CACHE_TTL_SECONDS', DEFAULT_ADMIN_TTL_SECONDS))
+    except ValueError:
+        return DEFAULT_ADMIN_TTL_SECONDS
+
+
+def catalog_admin_ids(session_file: str, channel_id: int, max_age: float | None = None) -> set[int] | None:
+    """Cached admin ids of a group, or None if there are none younger than ``max_age`` (ADMIN_CACHE_TTL_SECONDS)."""
+    entry = catalog_group(session_file, channel_id)
+    if entry is None or 'admin_ids' not in entry:
+        return None
+    if time.time() - entry.get('admins_at', 0) > (_admin_ttl() if max_age is None else max_age):
+        return None
+    return set(entry['admin_ids'])
+
+
+def store_admin_ids(session_file: str, channel_id: int, admin_ids) -> None:
+    """Remember the admin ids of a group that is in the catalog (others are not cached)."""
+    catalog = load_catalog(session_file)
+    entry = catalog['groups'].get(int(channel_id))
+    if entry is None:
+        return
+    entry['admin_ids'] = sorted(admin_ids)
+    entry['admins_at'] = time.time()
+    save_catalog(session_file, catalog)
@@ -5,10 +5,10 @@ with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 '''
 
 from telethon.sync import TelegramClient
-from telethon.tl.functions.messages import GetDialogsRequest
-from telethon.tl.types import InputPeerEmpty
 from telethon.errors.rpcerrorlist import PeerFloodError, UserPrivacyRestrictedError
-from defunc import inviting, parsing, config, getoptions
+from defunc import inviting, parsing, config, getoptions, fetch_megagroups, clear_collected_users, parse_all_sessions
+from user_filters import FilterSpec
+from rpc_fixtures import recording_client
 import time
 import random
 import os
@@ -50,11 +50,6 @@ if __name__ == "__main__":
 
 
         elif selection == '2':
-            chats = []
-            last_date = None    
-            size_chats = 200
-            groups = []         
-
             print("Выберите юзер-бота для парсинга.\n"
                 "(Аккаунт который состоит в группах, которые нужно спарсить)\n")
 
@@ -71,8 +66,11 @@ if __name__ == "__main__":
 
             for i in range(len(sessions)):
                 print(f"[{i}] -", sessions[i], '\n')
+            print("[a] - Все аккаунты сразу (общие группы парсятся один раз)\n")
             while True:
                 raw = input("Ввод: ")
+                if raw == 'a':
+                    break
                 try:
                     i = int(raw)
                 except ValueError:
@@ -81,24 +79,29 @@ if __name__ == "__main__":
                 if 0 <= i < len(sessions):
                     break
                 print("Некорректный индекс. Повторите ввод.")
-            
-            client = TelegramClient(sessions[i].replace('\n', ''), api_id, api_hash).start()
 
-            result = client(GetDialogsRequest(
-                offset_date=last_date,
-                offset_id=0,
-                offset_peer=InputPeerEmpty(),
-                limit=size_chats,
-                hash=0
-            ))
-            chats.extend(result.chats)
-
-            for chat in chats:
+            # Same filter spec as the bot's /parse_sessions
+            while True:
+                raw_filters = input("Фильтры через пробел (Enter - без фильтров):\n"
+                                    "noadmins seen:N norecent nobots username nodeleted premium nopremium\n"
+                                    "Ввод: ")
                 try:
-                    if chat.megagroup is True:
-                        groups.append(chat)         
-                except:
-                    continue
+                    filters = FilterSpec.parse(raw_filters) if raw_filters.strip() else None
+                    break
+                except ValueError as error:
+                    print(error)
+
+            if raw == 'a':
+                summary = parse_all_sessions(api_id, api_hash, user_id, user_name, sessions=sessions, filters=filters)
+                print(f"Спаршено. Аккаунтов: {summary['sessions']}, групп: {summary['groups_processed']}, "
+                      f"новых user-id: {summary['written_userids']}, новых username: {summary['written_usernames']}")
+                time.sleep(2)
+                continue
+            
+            # Parse-path RPCs are recorded with RPC_RECORD_PATH set, as for pooled clients
+            client = recording_client(TelegramClient(sessions[i].replace('\n', ''), api_id, api_hash).start())
+
+            groups = fetch_megagroups(client)
 
             # Ensure storage files exist
             if not os.path.exists('usernames.txt'):
@@ -116,20 +119,20 @@ if __name__ == "__main__":
             g_index = input()
 
             if g_index == 'clear':
-                f = open('usernames.txt', 'w')
-                f.close()
-                f = open('userids.txt', 'w')
-                f.close()
+                clear_collected_users()
 
             elif g_index.isdigit() and int(g_index) < i:
                 target_group = groups[int(g_index)]
-                parsing(client, target_group, user_id, user_name)
-                print('Спаршено.')
+                summary = parsing(client, target_group, user_id, user_name, filters)
+                print(f"Спаршено. Подходят фильтрам: {summary['matched']} из {summary['participants_total']}")
 
             elif g_index.isdigit() and int(g_index) == i:
+                matched = total = 0
                 for g_index in groups:
-                    parsing(client, g_index, user_id, user_name)
-                print('Спаршено.')
+                    summary = parsing(client, g_index, user_id, user_name, filters)
+                    matched += summary['matched']
+                    total += summary['participants_total']
+                print(f"Спаршено. Подходят фильтрам: {matched} из {total}")
 
             
 
@@ -0,0 +1,129 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import tracemalloc
+
+
+DEFAULT_TOP_SITES = 10
+
+
+def memory_profiling_enabled() -> bool:
+    """MEMORY_PROFILE=1 turns profiling on for the filtered parses (it slows them down noticeably)."""
+    return os.getenv('MEMORY_PROFILE', '').strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+
+
+def _top_sites() -> int:
+    try:
+        return max(1, int(os.getenv('MEMORY_PROFILE_TOP', DEFAULT_TOP_SITES)))
+    except ValueError:
+        return DEFAULT_TOP_SITES
+
+
+def _rss_mb() -> float:
+    """Current resident set size; the process peak where /proc is not available, 0 where neither is."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _max_rss_mb()
+
+
+def _max_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        return 0.0
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+_EXCLUDED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<unknown>')
+
+
+def _site(filename: str, lineno: int) -> str:
+    # Last two path components keep sites readable: package/defunc.py, types/__init__.py
+    return f"{os.sep.join(filename.split(os.sep)[-2:])}:{lineno}"
+
+
+def top_sites(snapshot: tracemalloc.Snapshot, top: int) -> list[dict]:
+    """Allocation sites (file:line) of ``snapshot`` holding the most memory."""
+    sites = []
+    for stat in snapshot.statistics('lineno'):
+        frame = stat.traceback[0]
+        if frame.filename in _EXCLUDED_FILES:
+            continue
+        sites.append({'site': _site(frame.filename, frame.lineno), 'size_kb': round(stat.size / 1024, 1),
+                      'count': stat.count})
+        if len(sites) == top:
+            break
+    return sites
+
+
+# Profiles running now, and whether tracemalloc was started by them (and so is theirs to stop)
+_active_profiles = 0
+_started_tracing = False
+
+
+class MemoryProfile:
+    """tracemalloc + RSS readings at the stage boundaries of one parse call.
+
+    ``mark(label)`` records traced and resident memory; whenever traced memory
+    is the highest seen so far, a snapshot is taken, and ``stop`` reports the
+    top allocation sites (by line) of the last one. tracemalloc is
+    process-wide: it runs while any profile is active, and with concurrent
+    jobs the readings include each other's allocations.
+    """
+
+    def __init__(self, top: int | None = None):
+        self.top = top or _top_sites()
+        self.stages: dict[str, dict] = {}
+        self.peak_rss_mb = 0.0
+        self._peak_traced = 0
+        self._snapshot: tracemalloc.Snapshot | None = None
+
+    def start(self) -> None:
+        global _active_profiles, _started_tracing
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        elif _active_profiles == 0:
+            tracemalloc.reset_peak()
+        _active_profiles += 1
+        self.mark('start')
+
+    def mark(self, label: str) -> None:
+        current = tracemalloc.get_traced_memory()[0]
+        rss = _rss_mb()
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        entry = self.stages.setdefault(label, {'traced_mb': 0.0, 'rss_mb': 0.0})
+        entry['traced_mb'] = max(entry['traced_mb'], round(current / 2**20, 1))
+        entry['rss_mb'] = max(entry['rss_mb'], round(rss, 1))
+        if current > self._peak_traced:
+            self._peak_traced = current
+            # Drop the old snapshot first: it can be as large as the traced memory itself
+            self._snapshot = None
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def stop(self) -> dict:
+        """Final reading and the report for the job summary."""
+        global _active_profiles, _started_tracing
+        self.mark('end')
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        _active_profiles = max(0, _active_profiles - 1)
+        if _started_tracing and _active_profiles == 0:
+            tracemalloc.stop()
+            _started_tracing = False
+        sites = top_sites(self._snapshot, self.top) if self._snapshot is not None else []
+        self._snapshot = None
+        return {
+            'peak_rss_mb': round(self.peak_rss_mb, 1),
+            'process_peak_rss_mb': round(_max_rss_mb(), 1),
+            'traced_peak_mb': round(traced_peak / 2**20, 1),
+            'stages': self.stages,
+            'top_sites': sites,
+        }
@@ -0,0 +1,231 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import time
+import asyncio
+import functools
+from bisect import bisect_left
+
+
+# Seconds; covers both bot handlers and Telegram RPCs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DEFAULT_HOST = '127.0.0.1'
+LOOP_LAG_INTERVAL_SECONDS = 1.0
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric family with fixed label names; samples are keyed by label values."""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[n] for n in self.labelnames)
+
+    def samples(self):
+        """(suffix, label values, extra label, value) of every sample."""
+        for key, value in list(self._values.items()):
+            yield '', key, '', value
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for suffix, key, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_labels(self.labelnames, key, extra)} {_number(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        # First bucket whose upper bound is >= value; past the last one it is +Inf
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for key, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                yield '_bucket', key, f'le="{_number(bound)}"', cumulative
+            yield '_sum', key, '', series[-1]
+            yield '_count', key, '', cumulative
+
+
+class CallbackMetric(Metric):
+    """Values computed at scrape time by ``collect()`` -> {label values tuple: value}."""
+
+    def __init__(self, name: str, help: str, type: str, labelnames: tuple, collect):
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self._collect = collect
+
+    def samples(self):
+        try:
+            collected = self._collect()
+        except Exception:
+            return
+        for key, value in collected.items():
+            yield '', key, '', value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, type: str, labelnames: tuple, collect) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, type, labelnames, collect))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+HANDLER_SECONDS = REGISTRY.histogram('bot_handler_seconds', 'Time spent in a bot command handler', ('command',))
+RPC_SECONDS = REGISTRY.histogram('telegram_rpc_seconds', 'Parse-path RPC latency, FloodWait sleeps excluded',
+                                 ('session',))
+USERS_WRITTEN = REGISTRY.counter('parse_users_written_total', 'New user-ids / usernames written to the exports',
+                                 ('field',))
+LOOP_LAG = REGISTRY.histogram('bot_event_loop_lag_seconds', 'How late the event-loop lag probes woke up',
+                              buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+LOOP_LAG_LAST = REGISTRY.gauge('bot_event_loop_lag_last_seconds', 'Lag of the latest event-loop probe')
+
+
+def timed_handler(command: str, handler):
+    """Wrap an event handler so its run time is observed in bot_handler_seconds{command}."""
+    @functools.wraps(handler)
+    async def wrapper(event):
+        started = time.perf_counter()
+        try:
+            return await handler(event)
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, command=command)
+    return wrapper
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL_SECONDS) -> None:
+    """Sleep ``interval`` over and over; any extra delay before waking up is event-loop lag."""
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.monotonic() - started - interval)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request = await asyncio.wait_for(reader.readline(), 10)
+        # Headers are not needed, but are read so the client sees a clean close
+        while await asyncio.wait_for(reader.readline(), 10) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] in ('GET', 'HEAD') and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', REGISTRY.render().encode()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            status, body, content_type = '404 Not Found', b'Not Found\n', 'text/plain; charset=utf-8'
+        head = (f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode()
+        writer.write(head if parts[:1] == ['HEAD'] else head + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError, UnicodeDecodeError, ValueError, asyncio.LimitOverrunError,
+            asyncio.IncompleteReadError):
+        # A bad or oversized request (readline raises ValueError past the stream limit) just gets closed
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+def metrics_address() -> tuple[str, int] | None:
+    """(host, port) from METRICS_HOST / METRICS_PORT, or None when the endpoint is off."""
+    try:
+        port = int(os.getenv('METRICS_PORT', '0') or 0)
+    except ValueError:
+        return None
+    if port <= 0:
+        return None
+    return os.getenv('METRICS_HOST', DEFAULT_HOST) or DEFAULT_HOST, port
+
+
+async def serve_metrics(host: str, port: int) -> asyncio.AbstractServer:
+    """Serve REGISTRY at http://host:port/metrics and start the event-loop lag probe."""
+    server = await asyncio.start_server(_handle, host, port)
+    asyncio.get_running_loop().create_task(monitor_loop_lag())
+    return server
@@ -0,0 +1,72 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import json
+from user_store import UserStore, get_store
+
+
+DEFAULT_MAX_AGE_SECONDS = 86400.0
+
+
+def job_key(kind: str, session_file: str, *params) -> str:
+    """Key of a parse run: the same call with the same parameters maps to the same job."""
+    name = session_file.replace('\n', '')
+    return f"{kind}:{name}:{json.dumps(params)}"
+
+
+def _max_age() -> float:
+    try:
+        return float(os.getenv('PARSE_JOB_MAX_AGE_SECONDS', DEFAULT_MAX_AGE_SECONDS))
+    except ValueError:
+        return DEFAULT_MAX_AGE_SECONDS
+
+
+class ParseJob:
+    """Progress of a multi-group parse that survives a crash or FloodWait abort.
+
+    The state lives in the user store: the groups already finished, the totals
+    accumulated over them, and a cursor (participant offset or message id plus
+    the partial group summary) for the group that was in progress. Running the
+    same parse again picks the state up; ``complete`` drops it.
+    """
+
+    def __init__(self, key: str, store: UserStore | None = None, max_age: float | None = None):
+        self.key = key
+        self.store = store if store is not None else get_store()
+        state = self.store.load_job(key, _max_age() if max_age is None else max_age)
+        self.resumed = state is not None
+        self.state = state or {'done': [], 'current': None, 'cursor': {}, 'overall': None}
+
+    @property
+    def overall(self) -> dict | None:
+        """Totals over the finished groups, as saved by ``finish_group``."""
+        return self.state['overall']
+
+    def is_done(self, group_id) -> bool:
+        return group_id in self.state['done']
+
+    def cursor(self, group_id) -> dict:
+        """Where the previous run stopped inside ``group_id`` ({} to start from the top)."""
+        if self.state['current'] != group_id:
+            return {}
+        return dict(self.state['cursor'])
+
+    def save_cursor(self, group_id, **cursor) -> None:
+        """Record the position inside ``group_id``; everything before it has been written."""
+        self.state['current'] = group_id
+        self.state['cursor'] = cursor
+        self.store.save_job(self.key, self.state)
+
+    def finish_group(self, group_id, overall: dict) -> None:
+        self.state['done'].append(group_id)
+        self.state['current'] = None
+        self.state['cursor'] = {}
+        self.state['overall'] = dict(overall)
+        self.store.save_job(self.key, self.state)
+
+    def complete(self) -> None:
+        self.store.delete_job(self.key)
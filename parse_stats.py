@@ -0,0 +1,133 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import time
+import functools
+from contextvars import ContextVar
+
+
+# Stages of a parse, in pipeline order
+STAGES = ('dialogs', 'admins', 'fetch', 'resolve', 'filter', 'write')
+STAGE_LABELS = {
+    'dialogs': 'список групп',
+    'admins': 'админы',
+    'fetch': 'загрузка участников/истории',
+    'resolve': 'поиск отправителей',
+    'filter': 'фильтры',
+    'write': 'запись',
+    'other': 'прочее',
+}
+
+
+class ParseStats:
+    """Wall time, RPCs, FloodWait seconds and bytes written per stage of one parse call.
+
+    Times are summed over groups, so with concurrent groups a stage can add up
+    to more than the run's wall time.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, dict] = {}
+
+    def entry(self, stage: str) -> dict:
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = {'seconds': 0.0, 'rpcs': 0, 'bytes_written': 0, 'flood_wait_seconds': 0.0}
+        return entry
+
+    def add(self, stage: str, seconds: float = 0.0, rpcs: int = 0, bytes_written: int = 0,
+            flood_wait_seconds: float = 0.0) -> None:
+        entry = self.entry(stage)
+        entry['seconds'] += seconds
+        entry['rpcs'] += rpcs
+        entry['bytes_written'] += bytes_written
+        entry['flood_wait_seconds'] += flood_wait_seconds
+
+    def merge(self, stages: dict | None) -> None:
+        """Add the ``as_dict`` output of another parse (e.g. one group of parse_all_sessions)."""
+        for name, entry in (stages or {}).items():
+            self.add(name, **entry)
+
+    def as_dict(self) -> dict:
+        order = {name: i for i, name in enumerate(STAGES)}
+        return {
+            name: {**entry, 'seconds': round(entry['seconds'], 3),
+                   'flood_wait_seconds': round(entry['flood_wait_seconds'], 1)}
+            for name, entry in sorted(self.stages.items(), key=lambda item: order.get(item[0], len(order)))
+        }
+
+
+# (stats, current stage or None, [start of the stage's current slice]) of the running task
+_active: ContextVar[tuple | None] = ContextVar('parse_stage', default=None)
+
+
+class stage:
+    """Charge the time of the block, and RPCs made in it, to stage ``name``.
+
+    Nested stages are exclusive: the outer stage is paused while an inner one
+    runs. A no-op outside an instrumented call. Do not hold it across a yield
+    of an async generator.
+    """
+
+    __slots__ = ('name', '_frame', '_token', '_started')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    # Entered once per message on history scans, so both ends stay as cheap as possible
+    def __enter__(self):
+        frame = self._frame = _active.get()
+        if frame is None:
+            return
+        stats, outer, outer_started = frame
+        started = self._started = [time.perf_counter()]
+        if outer is not None:
+            stats.entry(outer)['seconds'] += started[0] - outer_started[0]
+        self._token = _active.set((stats, self.name, started))
+
+    def __exit__(self, *exc_info):
+        frame = self._frame
+        if frame is None:
+            return
+        ended = time.perf_counter()
+        frame[0].entry(self.name)['seconds'] += ended - self._started[0]
+        _active.reset(self._token)
+        if frame[1] is not None:
+            frame[2][0] = ended
+
+
+def record(rpcs: int = 0, bytes_written: int = 0, flood_wait_seconds: float = 0.0) -> None:
+    """Count RPCs / bytes / FloodWait time towards the current stage ('other' outside one)."""
+    if not (rpcs or bytes_written or flood_wait_seconds):
+        return
+    frame = _active.get()
+    if frame is None:
+        return
+    stats, name, _ = frame
+    stats.add(name or 'other', rpcs=rpcs, bytes_written=bytes_written, flood_wait_seconds=flood_wait_seconds)
+
+
+def merge_stages(stages: dict | None) -> None:
+    """Fold the stages of an inner instrumented call into the enclosing one."""
+    frame = _active.get()
+    if frame is not None:
+        frame[0].merge(stages)
+
+
+def instrumented(fn):
+    """Collect ParseStats over an async parse call and attach them to its summary as ``stages``."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        stats = ParseStats()
+        token = _active.set((stats, None, None))
+        try:
+            result = await fn(*args, **kwargs)
+        finally:
+            _active.reset(token)
+        if isinstance(result, dict) and 'error' not in result:
+            result['stages'] = stats.as_dict()
+        return result
+    return wrapper
@@ -0,0 +1,110 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import time
+import asyncio
+from telethon.errors.rpcerrorlist import FloodWaitError
+
+
+DEFAULT_MAX_WAIT_SECONDS = 3600.0
+
+
+class SessionScheduler:
+    """Request gate of one session.
+
+    FloodWait is an account-wide limit, so every parse-path RPC of the session
+    goes through ``call``: requests hold until the session's wait deadline,
+    a FloodWaitError moves the deadline to exactly ``seconds`` from now and
+    the request is retried. Waits longer than ``max_wait`` are raised to the
+    caller instead (parse jobs checkpoint and stop there).
+    """
+
+    def __init__(self, name: str, max_wait: float = DEFAULT_MAX_WAIT_SECONDS):
+        self.name = name
+        self.max_wait = max_wait
+        self.deadline = 0.0
+        self.requests = 0
+        self.flood_waits = 0
+        self.waited_seconds = 0.0
+
+    def pause(self, seconds: float) -> None:
+        now = time.monotonic()
+        until = now + seconds
+        self.flood_waits += 1
+        if until > self.deadline:
+            # Only the part not already covered by a running pause adds waiting time
+            self.waited_seconds += until - max(self.deadline, now)
+            self.deadline = until
+
+    async def wait(self) -> None:
+        delay = self.deadline - time.monotonic()
+        if delay > self.max_wait:
+            raise FloodWaitError(request=None, capture=int(delay) + 1)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.deadline - time.monotonic()
+
+    async def call(self, fn):
+        """Await ``fn()`` once the session may send again, retrying after FloodWait."""
+        while True:
+            await self.wait()
+            self.requests += 1
+            try:
+                return await fn()
+            except FloodWaitError as exc:
+                if exc.seconds > self.max_wait:
+                    # Not waited here: remember the deadline so nothing else is sent before it
+                    self.flood_waits += 1
+                    self.deadline = max(self.deadline, time.monotonic() + exc.seconds)
+                    raise
+                self.pause(exc.seconds)
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'flood_waits': self.flood_waits,
+            'waited_seconds': round(self.waited_seconds, 1),
+            'wait_left': round(max(0.0, self.deadline - time.monotonic()), 1),
+        }
+
+
+class RequestScheduler:
+    """SessionScheduler per .session file."""
+
+    def __init__(self, max_wait: float = DEFAULT_MAX_WAIT_SECONDS):
+        self.max_wait = max_wait
+        self._sessions: dict[str, SessionScheduler] = {}
+
+    def for_session(self, session_file: str) -> SessionScheduler:
+        key = session_file.replace('\n', '')
+        scheduler = self._sessions.get(key)
+        if scheduler is None:
+            scheduler = self._sessions[key] = SessionScheduler(key, self.max_wait)
+        return scheduler
+
+    def for_client(self, client) -> SessionScheduler:
+        """Scheduler of the session a TelegramClient was opened with."""
+        name = getattr(getattr(client, 'session', None), 'filename', None)
+        return self.for_session(name or f'client-{id(client)}')
+
+    def stats(self) -> dict[str, dict]:
+        return {name: scheduler.stats() for name, scheduler in self._sessions.items()}
+
+
+_default_scheduler: RequestScheduler | None = None
+
+
+def get_scheduler() -> RequestScheduler:
+    """Process-wide scheduler configured from FLOOD_WAIT_MAX_SECONDS."""
+    global _default_scheduler
+    if _default_scheduler is None:
+        try:
+            max_wait = float(os.getenv('FLOOD_WAIT_MAX_SECONDS', DEFAULT_MAX_WAIT_SECONDS))
+        except ValueError:
+            max_wait = DEFAULT_MAX_WAIT_SECONDS
+        _default_scheduler = RequestScheduler(max_wait)
+    return _default_scheduler
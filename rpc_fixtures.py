@@ -0,0 +1,313 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import gzip
+import json
+import time
+import atexit
+import base64
+import asyncio
+from telethon.extensions import BinaryReader
+from telethon.tl.functions.channels import GetParticipantsRequest
+from telethon.tl.functions.messages import GetDialogsRequest
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.types import InputPeerChannel
+from telethon.tl.types.messages import DialogsNotModified
+
+
+# Messages per messages.GetHistory request of iter_messages
+HISTORY_PAGE_SIZE = 100
+
+# Fixture file: gzip'd JSON lines, one per RPC the parse paths made, in call order:
+#   {"kind": "dialogs", "key": [offset_id, conditional], "elapsed": s, "data": TL}
+#   {"kind": "participants", "key": [channel_id, offset, limit], "elapsed": s, "data": TL}
+#   {"kind": "users", "key": [user ids], "elapsed": s, "data": [TL, ...]}
+#   {"kind": "get_participants", "key": [channel_id, filter], "elapsed": s, "data": [TL, ...]}
+#   {"kind": "message", "key": [channel_id], "elapsed": s, "data": [message TL, sender TL or null]}
+# TL objects are stored as their base64 MTProto serialization, exactly as received.
+
+
+def _pack(obj) -> str | None:
+    return base64.b64encode(obj._bytes()).decode() if obj is not None else None
+
+
+def _unpack(data: str | None):
+    return BinaryReader(base64.b64decode(data)).tgread_object() if data is not None else None
+
+
+def _channel_id(target) -> int | None:
+    return getattr(target, 'channel_id', None) or getattr(target, 'id', None)
+
+
+FLUSH_EVERY = 200
+
+
+class FixtureRecorder:
+    """Appends recorded RPCs to a fixture file; every run adds a gzip member, so recordings accumulate.
+
+    Output is flushed every FLUSH_EVERY records and at exit, so a crashed run
+    still leaves a readable (if truncated) fixture.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._unflushed = 0
+
+    def record(self, kind: str, key: list, elapsed: float, pack) -> None:
+        """Write ``pack()`` as the data of a record; a response that cannot be serialized is skipped."""
+        try:
+            data = pack()
+        except Exception:
+            # Recording must never break the parse it observes
+            return
+        self.write(kind, key, elapsed, data)
+
+    def write(self, kind: str, key: list, elapsed: float, data) -> None:
+        if self._file is None:
+            self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        self._file.write(json.dumps({'kind': kind, 'key': key, 'elapsed': round(elapsed, 4), 'data': data}) + '\n')
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            self._unflushed = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_recorders: dict[str, FixtureRecorder] = {}
+
+
+def _recorder(path: str) -> FixtureRecorder:
+    # One writer per file: every pooled client appends through it
+    if path not in _recorders:
+        _recorders[path] = FixtureRecorder(path)
+        if len(_recorders) == 1:
+            atexit.register(lambda: [r.close() for r in _recorders.values()])
+    return _recorders[path]
+
+
+class _RecordingHistory:
+    def __init__(self, inner, recorder: FixtureRecorder, channel_id: int | None):
+        self._inner = inner
+        self._recorder = recorder
+        self._channel_id = channel_id
+
+    def __aiter__(self):
+        return self
+
+    @property
+    def buffer(self):
+        # The inner iterator's page; defunc counts history RPCs by it being swapped
+        return getattr(self._inner, 'buffer', None)
+
+    async def __anext__(self):
+        started = time.monotonic()
+        message = await self._inner.__anext__()
+        self._recorder.record('message', [self._channel_id], time.monotonic() - started,
+                              lambda: [_pack(message), _pack(getattr(message, 'sender', None))])
+        return message
+
+
+class RecordingClient:
+    """Wraps a TelegramClient and records the responses of the parse-path RPCs.
+
+    Everything else is passed through unchanged. Enabled for pooled clients
+    by RPC_RECORD_PATH (see session_pool).
+    """
+
+    def __init__(self, client, recorder: FixtureRecorder):
+        self._client = client
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def __call__(self, request, *args, **kwargs):
+        started = time.monotonic()
+        result = await self._client(request, *args, **kwargs)
+        elapsed = time.monotonic() - started
+        if isinstance(request, GetDialogsRequest):
+            self._recorder.record('dialogs', [request.offset_id, bool(request.hash)], elapsed, lambda: _pack(result))
+        elif isinstance(request, GetParticipantsRequest):
+            self._recorder.record('participants', [_channel_id(request.channel), request.offset, request.limit],
+                                  elapsed, lambda: _pack(result))
+        elif isinstance(request, GetUsersRequest):
+            self._recorder.record('users', [getattr(u, 'user_id', None) for u in request.id], elapsed,
+                                  lambda: [_pack(u) for u in result])
+        return result
+
+    async def get_participants(self, entity, *args, filter=None, **kwargs):
+        started = time.monotonic()
+        result = await self._client.get_participants(entity, *args, filter=filter, **kwargs)
+        self._recorder.record('get_participants', [_channel_id(entity), type(filter).__name__ if filter else None],
+                              time.monotonic() - started, lambda: [_pack(u) for u in result])
+        return result
+
+    def iter_messages(self, entity, *args, **kwargs):
+        return _RecordingHistory(self._client.iter_messages(entity, *args, **kwargs), self._recorder,
+                                 _channel_id(entity))
+
+
+def recording_client(client):
+    """``client`` wrapped in a RecordingClient if RPC_RECORD_PATH is set, else ``client`` itself."""
+    path = os.getenv('RPC_RECORD_PATH')
+    if not path:
+        return client
+    return RecordingClient(client, _recorder(path))
+
+
+class Fixture:
+    """Recorded responses indexed for replay."""
+
+    def __init__(self, path: str):
+        self.calls: dict[tuple, list] = {}
+        # channel id -> {message id: (elapsed, message TL, sender TL)}
+        self.history: dict[int, dict[int, tuple]] = {}
+        # Users from every users.GetUsers answer, so a differently batched lookup still resolves
+        self.users: dict[int, str] = {}
+        self.users_elapsed: list[float] = []
+        for entry in self._entries(path):
+            if entry['kind'] == 'message':
+                message = _unpack(entry['data'][0])
+                self.history.setdefault(entry['key'][0], {})[message.id] = (entry['elapsed'], *entry['data'])
+            elif entry['kind'] == 'users':
+                self.users.update(zip(entry['key'], entry['data']))
+                self.users_elapsed.append(entry['elapsed'])
+            else:
+                self.calls.setdefault((entry['kind'], *entry['key']), []).append((entry['elapsed'], entry['data']))
+
+    @staticmethod
+    def _entries(path: str):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    if line.endswith('\n'):
+                        yield json.loads(line)
+            except EOFError:
+                # Recording was interrupted: everything flushed before that is usable
+                return
+
+    def take(self, kind: str, *key):
+        """Next recorded (elapsed, data) for a call; the last one repeats once they run out."""
+        recorded = self.calls.get((kind, *key))
+        if not recorded:
+            raise LookupError(f'fixture has no {kind} response for {list(key)}')
+        return recorded.pop(0) if len(recorded) > 1 else recorded[0]
+
+    def summary(self) -> dict:
+        counts: dict[str, int] = {}
+        for (kind, *_), recorded in self.calls.items():
+            counts[kind] = counts.get(kind, 0) + len(recorded)
+        counts['users'] = len(self.users_elapsed)
+        counts['messages'] = sum(len(messages) for messages in self.history.values())
+        return counts
+
+
+class _ReplayHistory:
+    def __init__(self, client: 'ReplayClient', messages: list, limit: int | None):
+        self._client = client
+        self._messages = messages
+        self._next = 0
+        self._left = limit
+        # A new list for every HISTORY_PAGE_SIZE messages, as Telethon's RequestIter pages
+        self.buffer = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._next >= len(self._messages) or self._left == 0:
+            raise StopAsyncIteration
+        if self._next % HISTORY_PAGE_SIZE == 0:
+            self.buffer = self._messages[self._next:self._next + HISTORY_PAGE_SIZE]
+        elapsed, message_data, sender_data = self._messages[self._next]
+        await self._client._delay(elapsed)
+        self._next += 1
+        if self._left is not None:
+            self._left -= 1
+        message = _unpack(message_data)
+        message._sender = _unpack(sender_data)
+        return message
+
+
+class ReplayClient:
+    """Stand-in TelegramClient answering from a Fixture, each call taking its recorded time.
+
+    ``speed`` scales the delays (2.0 = twice as fast, 0 = no delays). History
+    is served from all recorded messages of the channel, filtered by the
+    requested min_id / offset_id / limit, so resumed and incremental scans
+    replay too.
+    """
+
+    def __init__(self, fixture: Fixture, session_name: str = 'replay.session', speed: float = 1.0):
+        self.fixture = fixture
+        self.speed = speed
+        self.session = type('Session', (), {'filename': session_name})()
+        self._connected = False
+
+    async def _delay(self, elapsed: float) -> None:
+        if self.speed > 0 and elapsed > 0:
+            await asyncio.sleep(elapsed / self.speed)
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def start(self):
+        self._connected = True
+        return self
+
+    async def connect(self):
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    async def get_input_entity(self, target):
+        return InputPeerChannel(channel_id=_channel_id(target), access_hash=getattr(target, 'access_hash', 0) or 0)
+
+    async def __call__(self, request):
+        if isinstance(request, GetDialogsRequest):
+            try:
+                elapsed, data = self.fixture.take('dialogs', request.offset_id, bool(request.hash))
+            except LookupError:
+                # Only "not modified" answers may have been recorded; a full list serves a conditional request
+                elapsed, data = self.fixture.take('dialogs', request.offset_id, False)
+            result = _unpack(data)
+            if isinstance(result, DialogsNotModified) and not request.hash:
+                raise LookupError('fixture has only DialogsNotModified; record with the session catalog removed')
+        elif isinstance(request, GetParticipantsRequest):
+            elapsed, data = self.fixture.take('participants', _channel_id(request.channel), request.offset,
+                                              request.limit)
+            result = _unpack(data)
+        elif isinstance(request, GetUsersRequest):
+            ids = [getattr(u, 'user_id', None) for u in request.id]
+            result = [_unpack(self.fixture.users[i]) for i in ids if i in self.fixture.users]
+            recorded = self.fixture.users_elapsed
+            elapsed = sum(recorded) / len(recorded) if recorded else 0.0
+        else:
+            raise NotImplementedError(type(request).__name__)
+        await self._delay(elapsed)
+        return result
+
+    async def get_participants(self, entity, *args, filter=None, **kwargs):
+        elapsed, data = self.fixture.take('get_participants', _channel_id(entity),
+                                          type(filter).__name__ if filter else None)
+        await self._delay(elapsed)
+        return [_unpack(u) for u in data]
+
+    def iter_messages(self, entity, limit=None, min_id=0, offset_id=0, **kwargs):
+        recorded = self.fixture.history.get(_channel_id(entity), {})
+        ids = sorted((i for i in recorded if i > min_id and (not offset_id or i < offset_id)), reverse=True)
+        return _ReplayHistory(self, [recorded[i] for i in ids], limit)
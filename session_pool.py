@@ -0,0 +1,166 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from telethon import TelegramClient
+from rpc_fixtures import recording_client
+
+
+DEFAULT_IDLE_SECONDS = 300.0
+DEFAULT_MAX_CLIENTS = 5
+
+
+class _PoolEntry:
+    def __init__(self, key: str, client):
+        self.key = key
+        self.client = client
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.start_lock = asyncio.Lock()
+
+
+class SessionClientPool:
+    """Long-lived TelegramClient per .session file.
+
+    Clients are connected on first use and reused by later calls. A client
+    with no active lease is disconnected once it has been idle longer than
+    ``idle_seconds``; at most ``max_clients`` clients are connected at once
+    (the least recently used idle client is closed to make room, otherwise
+    the caller waits for a lease to be released).
+    """
+
+    def __init__(self, idle_seconds: float = DEFAULT_IDLE_SECONDS, max_clients: int = DEFAULT_MAX_CLIENTS):
+        self.idle_seconds = idle_seconds
+        self.max_clients = max(1, max_clients)
+        self._entries: dict[str, _PoolEntry] = {}
+        self._cond: asyncio.Condition | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Clients are bound to the loop they connected on; a new loop
+            # (e.g. a fresh asyncio.run) cannot reuse them.
+            self._entries.clear()
+            self._cond = asyncio.Condition()
+            self._loop = loop
+        return self._cond
+
+    @asynccontextmanager
+    async def client(self, session_file: str, api_id: int, api_hash: str):
+        """Lease a started client for ``session_file``."""
+        entry = await self._acquire(session_file.replace('\n', ''), api_id, api_hash)
+        try:
+            async with entry.start_lock:
+                if not entry.client.is_connected():
+                    await entry.client.start()
+        except BaseException:
+            await self._release(entry, broken=True)
+            raise
+        try:
+            yield entry.client
+        finally:
+            await self._release(entry)
+
+    async def _acquire(self, key: str, api_id: int, api_hash: str) -> _PoolEntry:
+        cond = self._condition()
+        async with cond:
+            while True:
+                await self._reap_locked()
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.leases += 1
+                    return entry
+                if len(self._entries) < self.max_clients:
+                    break
+                idle = [e for e in self._entries.values() if e.leases == 0]
+                if idle:
+                    await self._close_locked(min(idle, key=lambda e: e.last_used))
+                    continue
+                await cond.wait()
+            # FloodWaits are left to the request scheduler, which waits them out
+            # per session and accounts for the time, instead of Telethon's silent sleep
+            entry = _PoolEntry(key, recording_client(TelegramClient(key, api_id, api_hash, flood_sleep_threshold=0)))
+            entry.leases = 1
+            self._entries[key] = entry
+            return entry
+
+    async def _release(self, entry: _PoolEntry, broken: bool = False) -> None:
+        cond = self._condition()
+        async with cond:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            if broken and entry.leases == 0:
+                await self._close_locked(entry)
+            cond.notify_all()
+
+    async def _close_locked(self, entry: _PoolEntry) -> None:
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        try:
+            await entry.client.disconnect()
+        except Exception:
+            pass
+
+    async def _reap_locked(self) -> int:
+        now = time.monotonic()
+        stale = [e for e in self._entries.values()
+                 if e.leases == 0 and now - e.last_used > self.idle_seconds]
+        for entry in stale:
+            await self._close_locked(entry)
+        return len(stale)
+
+    async def reap_idle(self) -> int:
+        """Disconnect clients idle longer than ``idle_seconds``; return how many were closed."""
+        cond = self._condition()
+        async with cond:
+            closed = await self._reap_locked()
+            if closed:
+                cond.notify_all()
+            return closed
+
+    async def reap_forever(self, interval: float | None = None) -> None:
+        """Background task for long-running processes (bot.py)."""
+        interval = interval if interval is not None else max(5.0, self.idle_seconds / 2)
+        while True:
+            await asyncio.sleep(interval)
+            await self.reap_idle()
+
+    async def close_all(self) -> None:
+        cond = self._condition()
+        async with cond:
+            for entry in list(self._entries.values()):
+                await self._close_locked(entry)
+            cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            'connected': len(self._entries),
+            'leased': sum(1 for e in self._entries.values() if e.leases),
+            'max_clients': self.max_clients,
+        }
+
+
+_default_pool: SessionClientPool | None = None
+
+
+def get_pool() -> SessionClientPool:
+    """Process-wide pool configured from SESSION_POOL_IDLE_SECONDS / SESSION_POOL_MAX_CLIENTS."""
+    global _default_pool
+    if _default_pool is None:
+        try:
+            idle = float(os.getenv('SESSION_POOL_IDLE_SECONDS', DEFAULT_IDLE_SECONDS))
+        except ValueError:
+            idle = DEFAULT_IDLE_SECONDS
+        try:
+            max_clients = int(os.getenv('SESSION_POOL_MAX_CLIENTS', DEFAULT_MAX_CLIENTS))
+        except ValueError:
+            max_clients = DEFAULT_MAX_CLIENTS
+        _default_pool = SessionClientPool(idle, max_clients)
+    return _default_pool
@@ -0,0 +1,43 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import entity_cache  # noqa: E402
+import group_catalog  # noqa: E402
+import request_scheduler  # noqa: E402
+import session_pool  # noqa: E402
+import user_store  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Empty working directory with fresh stores, caches, pool and schedulers.
+
+    Long FloodWaits (over a second) are not slept out, as with a low
+    FLOOD_WAIT_MAX_SECONDS.
+    """
+    monkeypatch.chdir(tmp_path)
+    for var in ('USER_STORE_PATH', 'ENTITY_CACHE_PATH', 'RPC_RECORD_PATH', 'MEMORY_PROFILE'):
+        monkeypatch.delenv(var, raising=False)
+    (tmp_path / 'userids.txt').write_text('')
+    (tmp_path / 'usernames.txt').write_text('')
+    monkeypatch.setattr(user_store, '_default_store', None)
+    monkeypatch.setattr(entity_cache, '_default_cache', None)
+    monkeypatch.setattr(group_catalog, '_default_cache', None)
+    monkeypatch.setattr(session_pool, '_default_pool', None)
+    monkeypatch.setattr(request_scheduler, '_default_scheduler', request_scheduler.RequestScheduler(max_wait=1))
+    yield tmp_path
+    store = user_store._default_store
+    if store is not None:
+        store.close()
@@ -0,0 +1,97 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import asyncio
+from types import SimpleNamespace
+
+from telethon import utils
+from telethon.tl.types import Dialog, Message, PeerChannel, PeerNotifySettings
+from telethon.tl.types.messages import Dialogs, DialogsNotModified, DialogsSlice
+
+import defunc
+import fake_client
+
+
+class DialogsServer:
+    """Answers messages.GetDialogs over groups listed in ``order`` (top first), 100 per page like Telegram.
+
+    A conditional request is answered with DialogsNotModified when its hash
+    matches the page it would return.
+    """
+
+    def __init__(self, world: fake_client.SyntheticWorld):
+        self.world = world
+        self.order = list(range(world.groups))
+        self.session = SimpleNamespace(filename='test.session')
+        self.hashes: list[int] = []
+
+    def _dialog(self, g: int) -> tuple[Dialog, Message]:
+        top = 10_000 + g
+        peer = PeerChannel(fake_client.FIRST_CHANNEL_ID + g)
+        return (Dialog(peer=peer, top_message=top, read_inbox_max_id=top, read_outbox_max_id=top, unread_count=0,
+                       unread_mentions_count=0, unread_reactions_count=0, notify_settings=PeerNotifySettings()),
+                Message(id=top, peer_id=peer, date=self.world.now, message=''))
+
+    async def __call__(self, request):
+        self.hashes.append(request.hash)
+        start = self.order.index(request.offset_id - 10_000) + 1 if request.offset_id else 0
+        groups = self.order[start:start + request.limit]
+        rows = [self._dialog(g) for g in groups]
+        dialogs = [d for d, _ in rows]
+        messages = [m for _, m in rows]
+        by_peer = {(utils.get_peer_id(m.peer_id), m.id): m for m in messages}
+        if request.hash and request.hash == defunc._dialogs_hash(dialogs, by_peer):
+            return DialogsNotModified(count=len(self.order))
+        chats = [self.world.channel(g) for g in groups]
+        if len(self.order) <= request.limit:
+            return Dialogs(dialogs=dialogs, messages=messages, chats=chats, users=[])
+        return DialogsSlice(count=len(self.order), dialogs=dialogs, messages=messages, chats=chats, users=[])
+
+
+def _group_ids(server: DialogsServer) -> list[int]:
+    server.hashes.clear()
+    return [g.id for g in asyncio.run(defunc._fetch_megagroups(server, 'test.session'))]
+
+
+def _ids(groups) -> list[int]:
+    return [fake_client.FIRST_CHANNEL_ID + g for g in groups]
+
+
+def test_unchanged_paged_list_is_answered_not_modified_page_by_page(workdir):
+    server = DialogsServer(fake_client.SyntheticWorld(groups=250))
+    first = _group_ids(server)
+    assert first == _ids(server.order)
+    assert server.hashes == [0, 0, 0]
+    assert _group_ids(server) == first
+    assert len(server.hashes) == 3 and all(server.hashes)
+
+
+def test_change_below_the_first_page_is_picked_up(workdir):
+    world = fake_client.SyntheticWorld(groups=150)
+    server = DialogsServer(world)
+    _group_ids(server)
+    # A group joined below the first page: page 1 is still not modified, page 2 is not
+    world.groups = 151
+    server.order.append(150)
+    assert _group_ids(server) == _ids(server.order)
+    assert len(server.hashes) == 2 and all(server.hashes)
+
+
+def test_pages_after_a_changed_one_are_fetched_in_full(workdir):
+    world = fake_client.SyntheticWorld(groups=150)
+    server = DialogsServer(world)
+    _group_ids(server)
+    # New activity moves a group to the top and shifts every page after the first
+    server.order.insert(0, server.order.pop(120))
+    assert _group_ids(server) == _ids(server.order)
+    assert server.hashes[0] != 0 and server.hashes[1] == 0
+
+
+def test_complete_dialog_list_is_reused_when_not_modified(workdir):
+    server = DialogsServer(fake_client.SyntheticWorld(groups=50))
+    first = _group_ids(server)
+    assert _group_ids(server) == first
+    assert len(server.hashes) == 1 and server.hashes[0] != 0
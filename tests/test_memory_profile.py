@@ -0,0 +1,38 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import builtins
+import sys
+
+import memory_profile
+from memory_profile import MemoryProfile
+
+
+def test_report_lists_top_allocation_sites():
+    profile = MemoryProfile(top=3)
+    profile.start()
+    kept = [bytearray(1024) for _ in range(2000)]
+    profile.mark('allocated')
+    report = profile.stop()
+    assert len(kept) == 2000
+    assert report['stages']['allocated']['traced_mb'] >= 1.5
+    assert 0 < len(report['top_sites']) <= 3
+    assert 'test_memory_profile.py:' in report['top_sites'][0]['site']
+
+
+def test_rss_is_zero_without_proc_and_resource(monkeypatch):
+    # As on Windows: no /proc and no resource module
+    real_open = builtins.open
+
+    def no_proc(path, *args, **kwargs):
+        if str(path).startswith('/proc/'):
+            raise FileNotFoundError(path)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, 'open', no_proc)
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    assert memory_profile._rss_mb() == 0.0
+    assert MemoryProfile(top=1).stop()['process_peak_rss_mb'] == 0.0
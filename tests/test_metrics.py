@@ -0,0 +1,47 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import asyncio
+
+import pytest
+
+import metrics
+
+
+async def _request(port: int, data: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(data)
+    await writer.drain()
+    try:
+        return await reader.read()
+    finally:
+        writer.close()
+
+
+@pytest.mark.parametrize('request_line', [
+    b'GET /metrics HTTP/1.1\r\n\r\n',
+    # Longer than the StreamReader limit, with no newline
+    b'GET /' + b'a' * 100_000,
+], ids=['scrape', 'oversized'])
+def test_scrapes_and_bad_requests_close_cleanly(request_line):
+    errors = []
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        server = await asyncio.start_server(metrics._handle, '127.0.0.1', 0)
+        try:
+            return await _request(server.sockets[0].getsockname()[1], request_line)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    response = asyncio.run(main())
+    assert errors == []
+    if request_line.endswith(b'\r\n\r\n'):
+        assert response.startswith(b'HTTP/1.1 200 OK')
+        assert b'# TYPE telegram_rpc_seconds histogram' in response
+    else:
+        assert response == b''
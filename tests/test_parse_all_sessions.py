@@ -0,0 +1,37 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+from collections import Counter
+
+import defunc
+import fake_client
+import session_pool
+
+
+def test_each_session_keeps_its_lease_across_its_groups(workdir, monkeypatch):
+    # More sessions than pooled clients, several groups each
+    sessions = [f's{i}.session' for i in range(6)]
+    world = fake_client.SyntheticWorld(groups=18, members=50)
+    monkeypatch.setattr(session_pool, 'TelegramClient',
+                        lambda name, *args, **kwargs: fake_client.FakeClient(world, name))
+    pool = session_pool._default_pool = session_pool.SessionClientPool(max_clients=2)
+
+    # A client without leases may be evicted to make room for another session
+    evictable = Counter()
+    release = pool._release
+
+    async def counting_release(entry, broken=False):
+        await release(entry, broken)
+        if entry.leases == 0:
+            evictable[entry.key] += 1
+
+    monkeypatch.setattr(pool, '_release', counting_release)
+
+    summary = defunc.parse_all_sessions(1, 'hash', True, True, sessions=sessions)
+    assert summary['groups_processed'] == world.groups
+    assert summary['errors'] == 0
+    # Once after listing its groups and once after parsing all of them
+    assert evictable == dict.fromkeys(sessions, 2)
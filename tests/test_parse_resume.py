@@ -0,0 +1,84 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import asyncio
+
+import pytest
+from telethon.errors.rpcerrorlist import FloodWaitError
+from telethon.tl.functions.channels import GetParticipantsRequest
+
+import defunc
+import fake_client
+import session_pool
+from request_scheduler import get_scheduler
+
+
+class FloodingClient(fake_client.FakeClient):
+    """FakeClient that answers the participants page ``flood_at`` = (channel id, offset) with a long FloodWait, once."""
+
+    flood_at: tuple | None = None
+
+    async def __call__(self, request):
+        # Give the other groups a turn, as a network round trip would
+        await asyncio.sleep(0)
+        if (self.flood_at is not None and isinstance(request, GetParticipantsRequest)
+                and (request.channel.channel_id, request.offset) == self.flood_at):
+            self.flood_at = None
+            raise FloodWaitError(request=None, capture=3600)
+        return await super().__call__(request)
+
+
+@pytest.fixture
+def world(monkeypatch):
+    world = fake_client.SyntheticWorld(groups=2, members=1000)
+    client = FloodingClient(world, 'test.session')
+    monkeypatch.setattr(session_pool, 'TelegramClient', lambda name, *args, **kwargs: client)
+    world.client = client
+    return world
+
+
+def _parse(concurrency: int) -> dict:
+    return defunc.parse_session_group_filtered('test.session', 1, 'hash', None, True, True,
+                                               stream=True, concurrency=concurrency)
+
+
+@pytest.mark.parametrize('concurrency', [1, 2])
+@pytest.mark.parametrize('flooded_group', [0, 1])
+def test_stream_resume_after_flood_wait_loses_no_matches(workdir, world, concurrency, flooded_group):
+    # One group's page at offset 600 hits a FloodWait too long to sleep out
+    world.client.flood_at = (fake_client.FIRST_CHANNEL_ID + flooded_group, 600)
+    with pytest.raises(FloodWaitError):
+        _parse(concurrency)
+    # The next run comes after the wait is over
+    get_scheduler().for_session('test.session').deadline = 0.0
+    resumed = _parse(concurrency)
+
+    # Both groups are unfiltered; they share half their members
+    expected = {str(world.user_id(g, i)) for g in range(2) for i in range(world.members)}
+    assert set((workdir / 'userids.txt').read_text().split()) == expected
+    assert resumed['participants_total'] == resumed['matched'] == 2 * world.members
+    assert resumed['written_userids'] == len(expected) == 1500
+
+
+class FloodOnceClient(fake_client.FakeClient):
+    """FakeClient whose first get_participants call hits a FloodWait short enough to sleep out."""
+
+    flooded = False
+
+    async def get_participants(self, target, filter=None, **kwargs):
+        if not self.flooded:
+            self.flooded = True
+            raise FloodWaitError(request=None, capture=0)
+        return await super().get_participants(target, filter, **kwargs)
+
+
+def test_single_group_parse_waits_out_short_flood_wait(workdir, monkeypatch):
+    world = fake_client.SyntheticWorld(groups=1, members=100)
+    client = FloodOnceClient(world, 'test.session')
+    monkeypatch.setattr(session_pool, 'TelegramClient', lambda name, *args, **kwargs: client)
+    assert defunc.parse_session_group('test.session', 1, 'hash', 0, True, False) == 'parsed_0'
+    assert client.flooded
+    assert len((workdir / 'userids.txt').read_text().split()) == world.members
@@ -0,0 +1,64 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import pytest
+
+import defunc
+import fake_client
+import rpc_fixtures
+import session_pool
+from user_filters import FilterSpec
+
+
+MEMBERS = 1000
+MESSAGES = 450
+
+
+@pytest.fixture
+def world():
+    return fake_client.SyntheticWorld(groups=1, members=MEMBERS, messages=MESSAGES)
+
+
+def _use_client(monkeypatch, client) -> None:
+    session_pool._default_pool = None
+    monkeypatch.setattr(session_pool, 'TelegramClient', lambda name, *args, **kwargs: client)
+
+
+def _rpcs(summary: dict) -> dict:
+    return {name: entry['rpcs'] for name, entry in summary['stages'].items()}
+
+
+def _parse_both() -> tuple[dict, dict]:
+    spec = FilterSpec(exclude_admins=True)
+    members = defunc.parse_session_group_filtered('test.session', 1, 'hash', None, True, True, filters=spec)
+    active = defunc.parse_session_group_active_filtered('test.session', 1, 'hash', None, True, True,
+                                                        message_limit=None, full_rescan=True, filters=spec)
+    return members, active
+
+
+def _check(members: dict, active: dict, admin_rpcs: int = 1) -> None:
+    # get_participants fetches the group in pages of 200; iter_messages reads 100 messages a page
+    assert _rpcs(members)['fetch'] == MEMBERS // 200
+    assert _rpcs(members).get('admins', 0) == admin_rpcs
+    assert _rpcs(active)['fetch'] == -(-MESSAGES // 100)
+
+
+def test_rpcs_count_pages(workdir, world, monkeypatch):
+    _use_client(monkeypatch, fake_client.FakeClient(world, 'test.session'))
+    _check(*_parse_both())
+
+
+def test_rpcs_count_pages_while_recording_and_replaying(workdir, world, monkeypatch):
+    path = str(workdir / 'rpcs.jsonl.gz')
+    monkeypatch.setenv('RPC_RECORD_PATH', path)
+    _use_client(monkeypatch, fake_client.FakeClient(world, 'test.session'))
+    _check(*_parse_both())
+    rpc_fixtures._recorders.pop(path).close()
+
+    monkeypatch.delenv('RPC_RECORD_PATH')
+    _use_client(monkeypatch, rpc_fixtures.ReplayClient(rpc_fixtures.Fixture(path), 'test.session', speed=0))
+    # The admin set is still in the session catalog from the recorded run
+    _check(*_parse_both(), admin_rpcs=0)
@@ -0,0 +1,39 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import asyncio
+
+import pytest
+
+import defunc
+import fake_client
+import session_pool
+
+
+@pytest.fixture
+def world(monkeypatch):
+    world = fake_client.SyntheticWorld(groups=2, members=300, messages=400)
+    client = fake_client.FakeClient(world, 'test.session')
+    monkeypatch.setattr(session_pool, 'TelegramClient', lambda name, *args, **kwargs: client)
+    return world
+
+
+@pytest.mark.parametrize('group_id', [None, fake_client.FIRST_CHANNEL_ID])
+def test_unfiltered_parse_reports_participants(workdir, world, group_id):
+    progress = {'processed': 0, 'total': 0}
+    asyncio.run(defunc.parse_session_group_async('test.session', 1, 'hash', None, True, True, group_id=group_id,
+                                                 progress=progress))
+    groups = 1 if group_id else world.groups
+    assert progress == {'processed': groups * world.members, 'total': groups * world.members}
+
+
+@pytest.mark.parametrize('group_id', [None, fake_client.FIRST_CHANNEL_ID])
+def test_unfiltered_active_parse_reports_messages(workdir, world, group_id):
+    progress = {'processed': 0, 'total': 0}
+    asyncio.run(defunc.parse_session_group_active_async('test.session', 1, 'hash', None, True, True, 1000,
+                                                        group_id=group_id, progress=progress))
+    groups = 1 if group_id else world.groups
+    assert progress == {'processed': groups * world.messages, 'total': groups * 1000}
@@ -0,0 +1,54 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import pytest
+
+import defunc
+import fake_client
+import session_pool
+from user_filters import FilterSpec
+
+
+@pytest.fixture
+def world(monkeypatch):
+    world = fake_client.SyntheticWorld(groups=1, members=200, messages=500)
+    client = fake_client.FakeClient(world, 'test.session')
+    monkeypatch.setattr(session_pool, 'TelegramClient', lambda name, *args, **kwargs: client)
+    return world
+
+
+def _active_filtered(spec: FilterSpec) -> dict:
+    return defunc.parse_session_group_active_filtered('test.session', 1, 'hash', None, True, True,
+                                                      message_limit=None, filters=spec)
+
+
+def test_filtered_scan_does_not_hide_messages_from_other_scans(workdir, world):
+    premium = _active_filtered(FilterSpec(premium=True))
+    assert premium['messages_scanned'] == world.messages
+
+    # Senders the premium filter skipped are still new to an unfiltered scan and to other specs
+    assert defunc.parse_session_group_active('test.session', 1, 'hash', None, True, True,
+                                             message_limit=None) == 'parsed_active_all'
+    senders = {str(world.message(0, m).from_id.user_id) for m in range(1, world.messages + 1)}
+    assert set((workdir / 'userids.txt').read_text().split()) == senders
+    assert _active_filtered(FilterSpec(exclude_bots=True))['messages_scanned'] == world.messages
+
+    # The same spec again only reads messages newer than its own checkpoint
+    assert _active_filtered(FilterSpec(premium=True))['messages_scanned'] == 0
+
+
+def test_cached_senders_keep_premium_and_deleted(workdir, monkeypatch):
+    world = fake_client.SyntheticWorld(groups=1, members=1001, messages=1001)
+    client = fake_client.FakeClient(world, 'test.session')
+    monkeypatch.setattr(session_pool, 'TelegramClient', lambda name, *args, **kwargs: client)
+
+    for token in ('premium', 'nopremium', 'nodeleted'):
+        runs = [defunc.parse_session_group_active_filtered('test.session', 1, 'hash', None, True, True,
+                                                           message_limit=None, full_rescan=True, resume=False,
+                                                           filters=FilterSpec.parse(token))['matched']
+                for _ in range(2)]
+        # The second run resolves senders from the entity cache the first one filled
+        assert runs[0] == runs[1], token
@@ -0,0 +1,249 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import time
+from datetime import datetime, timezone, timedelta
+from telethon.tl.types import UserStatusOnline, UserStatusOffline, UserStatusRecently, UserStatusLastWeek, UserStatusLastMonth
+from entity_cache import get_entity_cache, CachedUser
+
+
+def passes_last_seen(user, last_seen_days: int | None, include_recently: bool) -> bool:
+    if last_seen_days is None:
+        return True
+    status = getattr(user, 'status', None)
+    if status is None and not isinstance(user, CachedUser) and getattr(user, 'id', None) is not None:
+        # Min users from history often come without a status; use the last one seen
+        cached = get_entity_cache().get(user.id)
+        status = cached.status if cached is not None else None
+    now = datetime.now(timezone.utc)
+    threshold = timedelta(days=last_seen_days)
+    if isinstance(status, UserStatusOnline):
+        return True
+    if isinstance(status, UserStatusOffline):
+        was_online = getattr(status, 'was_online', None)
+        if not was_online:
+            return False
+        if was_online.tzinfo is None:
+            was_online = was_online.replace(tzinfo=timezone.utc)
+        return (now - was_online) <= threshold
+    if isinstance(status, UserStatusRecently):
+        return include_recently
+    if isinstance(status, UserStatusLastWeek):
+        return last_seen_days >= 7
+    if isinstance(status, UserStatusLastMonth):
+        return last_seen_days >= 30
+    # Unknown status
+    return False
+
+
+_STATUS_BUCKETS = {
+    UserStatusOnline: 'online',
+    UserStatusOffline: 'offline',
+    UserStatusRecently: 'recently',
+    UserStatusLastWeek: 'last_week',
+    UserStatusLastMonth: 'last_month',
+}
+
+
+def last_seen_matches(users, last_seen_days: int | None, include_recently: bool,
+                      now: float | None = None) -> set[int]:
+    """Ids of ``users`` that pass the last-seen filter: batch form of passes_last_seen.
+
+    The cutoff is computed once per chunk. Users are bucketed by status type
+    with one dict lookup each; the fixed buckets pass or fail as a whole and
+    offline users compare their was_online timestamp with the cutoff.
+    Missing statuses are looked up in the entity cache in one query.
+    """
+    users = list(users)
+    if last_seen_days is None:
+        return {user.id for user in users}
+    missing = [user.id for user in users
+               if getattr(user, 'status', None) is None and not isinstance(user, CachedUser)]
+    cached = get_entity_cache().get_many(missing) if missing else {}
+    cutoff = (time.time() if now is None else now) - last_seen_days * 86400
+    bucket_passes = {
+        'online': True,
+        'recently': include_recently,
+        'last_week': last_seen_days >= 7,
+        'last_month': last_seen_days >= 30,
+    }
+    matched: set[int] = set()
+    for user in users:
+        status = getattr(user, 'status', None)
+        if status is None and user.id in cached:
+            status = cached[user.id].status
+        bucket = _STATUS_BUCKETS.get(type(status))
+        if bucket == 'offline':
+            was_online = status.was_online
+            if was_online:
+                if was_online.tzinfo is None:
+                    was_online = was_online.replace(tzinfo=timezone.utc)
+                if was_online.timestamp() >= cutoff:
+                    matched.add(user.id)
+        elif bucket is not None and bucket_passes[bucket]:
+            matched.add(user.id)
+    return matched
+
+
+# Evaluation order. Attribute checks cost one getattr and go first, the ones
+# that usually drop the largest share of a group ahead; the admin check needs
+# the group's admin list; last seen (status buckets, timestamps, entity cache
+# lookups) is the expensive one and only sees what is left.
+FILTER_ORDER = ('premium', 'no_username', 'deleted', 'bots', 'admins', 'inactive')
+
+EXCLUDED_KEYS = tuple(f'excluded_{name}' for name in FILTER_ORDER)
+
+FILTER_LABELS = {
+    'premium': 'Premium',
+    'no_username': 'без username',
+    'deleted': 'удалённые',
+    'bots': 'боты',
+    'admins': 'админы',
+    'inactive': 'неактивные',
+}
+
+
+class FilterSpec:
+    """Which users a filtered parse keeps.
+
+    premium: None keeps everyone, True only Premium accounts, False only
+    non-Premium ones. The spec is plain data (``as_dict`` / ``from_dict``) so
+    it can sit in bot state and parse job keys; ``parse`` reads the text form
+    used by main.py and bot commands, e.g. ``noadmins seen:7 nobots username``.
+    """
+
+    def __init__(self, exclude_admins: bool = False, last_seen_days: int | None = None,
+                 include_recently: bool = True, exclude_bots: bool = False, require_username: bool = False,
+                 exclude_deleted: bool = False, premium: bool | None = None):
+        self.exclude_admins = exclude_admins
+        self.last_seen_days = last_seen_days
+        self.include_recently = include_recently
+        self.exclude_bots = exclude_bots
+        self.require_username = require_username
+        self.exclude_deleted = exclude_deleted
+        self.premium = premium
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> 'FilterSpec':
+        spec = cls()
+        for key, value in (data or {}).items():
+            if hasattr(spec, key):
+                setattr(spec, key, value)
+        return spec
+
+    @classmethod
+    def parse(cls, text: str) -> 'FilterSpec':
+        """Spec from space/comma separated tokens; raises ValueError on an unknown one."""
+        spec = cls()
+        for token in text.replace(',', ' ').lower().split():
+            if token == 'noadmins':
+                spec.exclude_admins = True
+            elif token.startswith('seen:') and token[5:].isdigit():
+                spec.last_seen_days = int(token[5:])
+            elif token == 'norecent':
+                spec.include_recently = False
+            elif token == 'nobots':
+                spec.exclude_bots = True
+            elif token == 'username':
+                spec.require_username = True
+            elif token == 'nodeleted':
+                spec.exclude_deleted = True
+            elif token == 'premium':
+                spec.premium = True
+            elif token == 'nopremium':
+                spec.premium = False
+            else:
+                raise ValueError(f'unknown filter: {token}')
+        return spec
+
+    def describe(self) -> str:
+        parts = []
+        if self.exclude_admins:
+            parts.append('без админов')
+        if self.last_seen_days is not None:
+            parts.append(f'онлайн <= {self.last_seen_days} дн.' + ('' if self.include_recently else ' (без «Недавно»)'))
+        if self.exclude_bots:
+            parts.append('без ботов')
+        if self.require_username:
+            parts.append('только с username')
+        if self.exclude_deleted:
+            parts.append('без удалённых')
+        if self.premium is True:
+            parts.append('только Premium')
+        elif self.premium is False:
+            parts.append('без Premium')
+        return ', '.join(parts) or 'без фильтров'
+
+    def compile(self, admin_ids=frozenset()) -> 'UserFilter':
+        return UserFilter(self, admin_ids)
+
+
+class UserFilter:
+    """A FilterSpec compiled into one predicate over users.
+
+    Only enabled checks are kept, in FILTER_ORDER. A rejected user is counted
+    once, under the first check it failed; ``take_rejected`` moves the counts
+    into a summary as its ``excluded_*`` keys.
+    """
+
+    def __init__(self, spec: FilterSpec, admin_ids=frozenset()):
+        self.spec = spec
+        checks = {}
+        if spec.premium is not None:
+            checks['premium'] = lambda u: bool(getattr(u, 'premium', False)) == spec.premium
+        if spec.require_username:
+            checks['no_username'] = lambda u: bool(getattr(u, 'username', None))
+        if spec.exclude_deleted:
+            checks['deleted'] = lambda u: not getattr(u, 'deleted', False)
+        if spec.exclude_bots:
+            checks['bots'] = lambda u: not getattr(u, 'bot', False)
+        if spec.exclude_admins:
+            checks['admins'] = lambda u: getattr(u, 'id', None) not in admin_ids
+        self._checks = [(name, checks[name]) for name in FILTER_ORDER if name in checks]
+        self._last_seen = spec.last_seen_days is not None
+        self.rejected = dict.fromkeys(FILTER_ORDER, 0)
+
+    def _first_failed(self, user) -> str | None:
+        for name, check in self._checks:
+            if not check(user):
+                return name
+        return None
+
+    def __call__(self, user) -> bool:
+        """Check one user (senders arriving one by one)."""
+        failed = self._first_failed(user)
+        if failed is None and self._last_seen and not passes_last_seen(user, self.spec.last_seen_days,
+                                                                       self.spec.include_recently):
+            failed = 'inactive'
+        if failed is not None:
+            self.rejected[failed] += 1
+            return False
+        return True
+
+    def select(self, users) -> list:
+        """Users of a chunk that pass; last seen runs as one batch over the survivors of the cheap checks."""
+        survivors = []
+        for user in users:
+            failed = self._first_failed(user)
+            if failed is None:
+                survivors.append(user)
+            else:
+                self.rejected[failed] += 1
+        if not self._last_seen or not survivors:
+            return survivors
+        active_ids = last_seen_matches(survivors, self.spec.last_seen_days, self.spec.include_recently)
+        kept = [user for user in survivors if user.id in active_ids]
+        self.rejected['inactive'] += len(survivors) - len(kept)
+        return kept
+
+    def take_rejected(self, summary: dict) -> None:
+        """Add the rejection counts to ``summary`` and start counting from zero."""
+        for name, count in self.rejected.items():
+            summary[f'excluded_{name}'] = summary.get(f'excluded_{name}', 0) + count
+            self.rejected[name] = 0
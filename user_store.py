@@ -0,0 +1,242 @@
+'''
+This Source Code Form is subject to the terms of the Mozilla
+Public License, v. 2.0. If a copy of the MPL was not distributed
+with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+'''
+
+import os
+import sys
+import json
+import time
+import sqlite3
+
+
+DEFAULT_DB_PATH = 'users.db'
+USERIDS_TXT = 'userids.txt'
+USERNAMES_TXT = 'usernames.txt'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    source_group INTEGER,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    in_userids INTEGER NOT NULL DEFAULT 0,
+    exported_username TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_users_exported_username ON users(exported_username);
+CREATE TABLE IF NOT EXISTS legacy_usernames (
+    username TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS scan_checkpoints (
+    group_id INTEGER NOT NULL,
+    scope TEXT NOT NULL DEFAULT '',
+    max_message_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (group_id, scope)
+);
+CREATE TABLE IF NOT EXISTS parse_jobs (
+    job_key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def is_exportable_username(username: str | None) -> bool:
+    """Legacy rule for usernames.txt: skip empty names and anything that looks like a bot."""
+    return bool(username) and ('Bot' not in username) and ('bot' not in username)
+
+
+def scan_scope(*params) -> str:
+    """Checkpoint scope of an active parse: senders one filter / output combination skipped are new to another."""
+    return json.dumps(params)
+
+
+class UserStore:
+    """Indexed store of collected users, keyed by Telegram user id.
+
+    usernames.txt / userids.txt are kept as append-only exports: ``add_users``
+    returns only values that are not in the files yet, so callers never need to
+    read the text files back to deduplicate.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._drop_unscoped_checkpoints()
+        self._conn.executescript(_SCHEMA)
+        self._import_legacy_once()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _meta(self, key: str) -> str | None:
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _drop_unscoped_checkpoints(self) -> None:
+        """Checkpoints from before scopes existed cannot tell which filters skipped senders: rescan once."""
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(scan_checkpoints)')]
+        if columns and 'scope' not in columns:
+            with self._conn:
+                self._conn.execute('DROP TABLE scan_checkpoints')
+
+    def _import_legacy_once(self) -> None:
+        """Seed the store from existing txt files so their entries are not written twice."""
+        if self._meta('legacy_imported'):
+            return
+        now = time.time()
+        with self._conn:
+            if os.path.exists(USERIDS_TXT):
+                with open(USERIDS_TXT, 'r') as f:
+                    ids = [(int(line), now, now) for line in (l.strip() for l in f) if line.isdigit()]
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO users(user_id, first_seen, last_seen, in_userids) VALUES (?, ?, ?, 1)', ids)
+            if os.path.exists(USERNAMES_TXT):
+                with open(USERNAMES_TXT, 'r') as f:
+                    names = [(line.lstrip('@'),) for line in (l.strip() for l in f) if line]
+                self._conn.executemany('INSERT OR IGNORE INTO legacy_usernames(username) VALUES (?)', names)
+            self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('legacy_imported', '1')")
+
+    def _username_exported(self, cur, username: str) -> bool:
+        if cur.execute('SELECT 1 FROM users WHERE exported_username = ? LIMIT 1', (username,)).fetchone():
+            return True
+        return cur.execute('SELECT 1 FROM legacy_usernames WHERE username = ?', (username,)).fetchone() is not None
+
+    def add_users(self, users, source_group: int | None = None,
+                  write_ids: bool = True, write_names: bool = True) -> tuple[list[str], list[str]]:
+        """Upsert ``(user_id, username)`` pairs; return (new user-id lines, new @username lines) for the txt exports."""
+        now = time.time()
+        new_ids: list[str] = []
+        new_names: list[str] = []
+        with self._conn:
+            cur = self._conn.cursor()
+            for user_id, username in users:
+                row = cur.execute('SELECT in_userids, exported_username FROM users WHERE user_id = ?',
+                                  (user_id,)).fetchone()
+                in_userids, exported = row if row is not None else (0, None)
+                id_is_new = write_ids and not in_userids
+                name_is_new = (write_names and is_exportable_username(username) and exported != username
+                               and not self._username_exported(cur, username))
+                if row is None:
+                    cur.execute('INSERT INTO users(user_id, username, source_group, first_seen, last_seen, '
+                                'in_userids, exported_username) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (user_id, username, source_group, now, now, int(id_is_new),
+                                 username if name_is_new else None))
+                else:
+                    # username None means "not resolved this time", not "removed"
+                    cur.execute('UPDATE users SET username = COALESCE(?, username), last_seen = ?, '
+                                'source_group = COALESCE(source_group, ?), in_userids = MAX(in_userids, ?), '
+                                'exported_username = CASE WHEN ? THEN ? ELSE exported_username END '
+                                'WHERE user_id = ?',
+                                (username, now, source_group, int(id_is_new), int(name_is_new), username, user_id))
+                if id_is_new:
+                    new_ids.append(str(user_id))
+                if name_is_new:
+                    new_names.append('@' + username)
+        return new_ids, new_names
+
+    def get_checkpoint(self, group_id: int | None, scope: str = '') -> int:
+        """Highest message id already scanned for senders in ``group_id`` under ``scope`` (0 if never scanned)."""
+        if group_id is None:
+            return 0
+        row = self._conn.execute('SELECT max_message_id FROM scan_checkpoints WHERE group_id = ? AND scope = ?',
+                                 (group_id, scope)).fetchone()
+        return row[0] if row else 0
+
+    def set_checkpoint(self, group_id: int | None, message_id: int, scope: str = '') -> None:
+        if group_id is None or not message_id:
+            return
+        with self._conn:
+            self._conn.execute(
+                'INSERT INTO scan_checkpoints(group_id, scope, max_message_id, updated_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(group_id, scope) DO UPDATE SET '
+                'max_message_id = MAX(max_message_id, excluded.max_message_id), updated_at = excluded.updated_at',
+                (group_id, scope, message_id, time.time()))
+
+    def load_job(self, job_key: str, max_age: float | None = None) -> dict | None:
+        """Saved state of an unfinished parse job, or None if there is none (or it is older than ``max_age``)."""
+        row = self._conn.execute('SELECT state, updated_at FROM parse_jobs WHERE job_key = ?', (job_key,)).fetchone()
+        if row is None or (max_age is not None and time.time() - row[1] > max_age):
+            return None
+        return json.loads(row[0])
+
+    def save_job(self, job_key: str, state: dict) -> None:
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO parse_jobs(job_key, state, updated_at) VALUES (?, ?, ?)',
+                               (job_key, json.dumps(state), time.time()))
+
+    def delete_job(self, job_key: str) -> None:
+        with self._conn:
+            self._conn.execute('DELETE FROM parse_jobs WHERE job_key = ?', (job_key,))
+
+    def count(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def clear(self) -> None:
+        with self._conn:
+            self._conn.execute('DELETE FROM users')
+            self._conn.execute('DELETE FROM legacy_usernames')
+            self._conn.execute('DELETE FROM scan_checkpoints')
+            self._conn.execute('DELETE FROM parse_jobs')
+            self._conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('legacy_imported', '1')")
+
+    def export_txt(self, userids_path: str = USERIDS_TXT, usernames_path: str = USERNAMES_TXT) -> tuple[int, int]:
+        """Rewrite the legacy txt files from the store; return (ids written, usernames written)."""
+        ids = [str(r[0]) for r in self._conn.execute('SELECT user_id FROM users ORDER BY first_seen, user_id')]
+        names: list[str] = []
+        seen: set[str] = set()
+        rows = self._conn.execute('SELECT username FROM legacy_usernames '
+                                  'UNION ALL SELECT username FROM users WHERE username IS NOT NULL')
+        for (username,) in rows:
+            if is_exportable_username(username) and username not in seen:
+                seen.add(username)
+                names.append('@' + username)
+        with open(userids_path, 'w') as f:
+            f.writelines(v + '\n' for v in ids)
+        with open(usernames_path, 'w') as f:
+            f.writelines(v + '\n' for v in names)
+        with self._conn:
+            self._conn.execute('UPDATE users SET in_userids = 1, exported_username = username')
+        return len(ids), len(names)
+
+
+def append_lines(filepath: str, values: list[str]) -> int:
+    """Append already-deduplicated values to a txt export; returns the number of bytes written."""
+    if not values:
+        return 0
+    with open(filepath, 'a') as f:
+        f.writelines(v + '\n' for v in values)
+    return sum(len(v.encode()) + 1 for v in values)
+
+
+_default_store: UserStore | None = None
+
+
+def get_store() -> UserStore:
+    """Process-wide store at USER_STORE_PATH (default users.db)."""
+    global _default_store
+    if _default_store is None:
+        _default_store = UserStore(os.getenv('USER_STORE_PATH', DEFAULT_DB_PATH))
+    return _default_store
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('export', 'count'):
+        print("Использование: python user_store.py export|count")
+        sys.exit(2)
+    store = get_store()
+    if sys.argv[1] == 'export':
+        n_ids, n_names = store.export_txt()
+        print(f"Экспортировано: {n_ids} user-id в {USERIDS_TXT}, {n_names} username в {USERNAMES_TXT}")
+    else:
+        print(store.count())